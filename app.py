@@ -1,28 +1,126 @@
-import hashlib
+import base64
+import json
+import logging
 import os
+import re
+import threading
 import time
-from pathlib import Path
-from typing import List
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
 
-from fastapi import FastAPI, File, HTTPException, UploadFile
-from fastapi.responses import FileResponse
+import numpy as np
+from fastapi import FastAPI, File, HTTPException, Query, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, ValidationError
+from starlette.concurrency import run_in_threadpool
 
+from src.concurrency import run_in_stage
+from src.domain.index_factory import live_count
+from src.domain.ingest_queue import IngestQueue
+from src.domain.search_filter import SearchFilter
 from src.domain.vector_store import VectorStore
-from src.stella import StellaEmbedder
+from src.image_preprocess import dhash
+from src.metrics import HTTP_REQUEST_SECONDS, INDEX_VECTORS, QUEUE_DEPTH, REGISTRY
+from src.model_registry import (
+    STELLA_MODEL_NAME,
+    load_embedder,
+    registry,
+    split_model_name,
+)
+from src.tracing import configure_logging, new_trace_id, reset_trace_id, set_trace_id
+from src.upload_storage import (
+    UPLOADS_DIR,
+    UploadTooLarge,
+    store_upload,
+    upload_url_path,
+)
+
+# WR_LOG_LEVEL / WR_LOG_JSON（ログには trace ID が付く）
+configure_logging()
+logger = logging.getLogger(__name__)
 
 # Initialize global instances
-embedder = StellaEmbedder()
-vector_store = VectorStore(dimension=1024, db_path="vectors.db")
+# モデルはここでは読み込まない（lifespan でバックグラウンド読み込み、/api/ready で確認）
+# 新規データベースで使う埋め込みモデル（"<model>@256" で Matryoshka の先頭 256 次元）
+# 既存のデータベースは index_meta のモデルを使い続ける（切り替えは /api/reindex）
+EMBEDDING_MODEL = os.environ.get("WR_EMBEDDING_MODEL", STELLA_MODEL_NAME)
+vector_store = VectorStore(
+    dimension=split_model_name(EMBEDDING_MODEL)[1] or 1024,
+    db_path="vectors.db",
+    embedding_model=EMBEDDING_MODEL,
+)
+ingest_queue = IngestQueue(
+    vector_store,
+    workers=int(os.environ.get("WR_INGEST_WORKERS", "4")),
+    # 0 なら完全一致のみ。撮り直したボードも同一とみなすなら 6〜10 程度
+    near_duplicate_distance=int(os.environ.get("WR_NEAR_DUP_DISTANCE", "0")),
+)
+
+MAX_UPLOAD_BYTES = int(os.environ.get("WR_MAX_UPLOAD_MB", "25")) * 1024 * 1024
+MAX_BATCH_FILES = int(os.environ.get("WR_MAX_BATCH_FILES", "20"))
+MAX_BATCH_QUERIES = int(os.environ.get("WR_MAX_BATCH_QUERIES", "64"))
+# クライアントが X-Request-ID で渡した trace ID はこの形なら使う
+TRACE_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if os.environ.get("WR_LAZY_MODELS", "0") != "1":
+        registry.preload(["stella"])
+    ingest_queue.start()
+    yield
+    await ingest_queue.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.middleware("http")
+async def limit_upload_size(request, call_next):
+    # multipart の解析（一時ファイルへの書き出し）より前に、明らかに大きすぎる本文を断る
+    if request.url.path.startswith("/api/add"):
+        files = MAX_BATCH_FILES if request.url.path == "/api/add/batch" else 1
+        limit = files * MAX_UPLOAD_BYTES + 1024 * 1024  # + multipart のヘッダ分
+        length = request.headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) > limit:
+            return JSONResponse(
+                status_code=413, content={"detail": "Request body too large"}
+            )
+    return await call_next(request)
+
+
+@app.middleware("http")
+async def trace_requests(request, call_next):
+    # trace ID はログ・ワーカーのジョブに引き継がれ、X-Request-ID で返す
+    trace_id = request.headers.get("x-request-id", "")
+    if not TRACE_ID_PATTERN.fullmatch(trace_id):
+        trace_id = new_trace_id()
+    token = set_trace_id(trace_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = trace_id
+        return response
+    finally:
+        # パスではなくルートのテンプレートで集計する（/api/debate/{debate_id}）
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=getattr(route, "path", "other"),
+            status=status,
+        )
+        reset_trace_id(token)
 
-app = FastAPI()
 
 # Mount the static folder for static assets
 app.mount("/static", StaticFiles(directory="src/static"), name="static")
 
 # Add a specific mount point for uploads to ensure they're accessible
-app.mount("/uploads", StaticFiles(directory="src/static/uploads"), name="uploads")
+app.mount("/uploads", StaticFiles(directory=UPLOADS_DIR), name="uploads")
 
 
 # データモデル（例：画像とテキストペア）
@@ -41,6 +139,26 @@ class SearchResponse(BaseModel):
     results: List[SearchResult]
 
 
+class SearchBatchQuery(BaseModel):
+    query: str
+    filter: SearchFilter | None = None
+
+
+class SearchBatchRequest(BaseModel):
+    queries: List[SearchBatchQuery]
+    k: int = Field(5, ge=1, le=100)
+
+
+class SearchBatchResult(BaseModel):
+    query: str
+    instruction: str  # English translation that was embedded
+    results: List[SearchResult]
+
+
+class SearchBatchResponse(BaseModel):
+    results: List[SearchBatchResult]
+
+
 class DebateRequest(BaseModel):
     tldr: str
     summary: str = ""
@@ -62,6 +180,7 @@ class DebateListItem(BaseModel):
 
 class DebateListResponse(BaseModel):
     debates: List[DebateListItem]
+    next_cursor: str | None = None  # Pass as ?cursor= to get the next page
 
 
 class DebateResult(BaseModel):
@@ -75,6 +194,7 @@ class DebateResult(BaseModel):
 
 class DebateSearchResponse(BaseModel):
     debates: List[DebateResult]
+    next_cursor: str | None = None  # Pass as ?cursor= to get the next page
 
 
 class DebateDetailResponse(BaseModel):
@@ -87,6 +207,13 @@ class DebateDetailResponse(BaseModel):
     ocr_text: str | None = None  # Add OCR text field for extracted text
 
 
+class ImageStatusResponse(BaseModel):
+    image_id: int
+    status: str  # pending / processing / indexed / failed
+    attempts: int = 0
+    last_error: str | None = None
+
+
 @app.get("/", response_class=FileResponse)
 async def read_root():
     return FileResponse("src/static/index.html")
@@ -117,12 +244,48 @@ async def read_debate():
     return FileResponse("src/static/debate.html")
 
 
+@app.get("/api/ready")
+async def ready():
+    """Readiness probe: 200 once the embedding model is loaded"""
+    ready = registry.is_ready(["stella"])
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "models": registry.status()},
+    )
+
+
 @app.post("/api/search")
-async def search_images(query: str):
+async def search_images(
+    query: str,
+    debate_id: Optional[List[int]] = Query(None),
+    created_after: Optional[str] = None,
+    created_before: Optional[str] = None,
+    entity: Optional[List[str]] = Query(None),
+):
+    """Top 5 boards for ``query``
+
+    The optional filters are applied before the vector search: ``debate_id``
+    (repeatable), upload time in [``created_after``, ``created_before``) and
+    ``entity`` (repeatable, every one must be among the OCR entities).
+    """
     try:
-        query_vector = embedder.embed_text(query)
+        search_filter = SearchFilter(
+            debate_ids=debate_id,
+            created_after=created_after,
+            created_before=created_before,
+            entities=entity or [],
+        )
+    except ValidationError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        # Stella / FAISS はイベントループを塞がないようにスレッドプールで実行する
+        # 埋め込みは取り込み側と同じマイクロバッチにまとめる
+        query_vector = await vector_store.processer.batcher.embed(query)
 
-        results = vector_store.search(query_vector, k=5)
+        # 絞り込みは FAISS の検索前に行う（条件に合う画像の中での上位 5 件）
+        results = await vector_store.asearch(
+            query_vector, k=5, search_filter=search_filter
+        )
 
         formatted_results = [
             SearchResult(file_path=path, distance=dist, text_content=text)
@@ -134,10 +297,63 @@ async def search_images(query: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/search/batch", response_model=SearchBatchResponse)
+async def search_images_batch(request: SearchBatchRequest):
+    """Top ``k`` boards for each of several queries (e.g. a dashboard's saved searches)
+
+    The queries are translated and embedded together, and each distinct
+    ``filter`` runs one FAISS search over all of its queries. Results are in
+    request order.
+    """
+    if len(request.queries) > MAX_BATCH_QUERIES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BATCH_QUERIES} queries per request"
+        )
+    try:
+        instructions = await vector_store.processer.aprocess_instructions(
+            [item.query for item in request.queries]
+        )
+
+        # 同じ絞り込み条件のクエリは (n, d) 行列にまとめて 1 回で検索する
+        groups: Dict[str, List[int]] = {}
+        for i, item in enumerate(request.queries):
+            key = item.filter.cache_key() if item.filter is not None else ""
+            groups.setdefault(key, []).append(i)
+        results = [None] * len(request.queries)
+        for rows in groups.values():
+            found = await vector_store.asearch_many(
+                np.stack([instructions[i].instruction_feats for i in rows]),
+                k=request.k,
+                search_filter=request.queries[rows[0]].filter,
+            )
+            for i, hits in zip(rows, found):
+                results[i] = [
+                    SearchResult(file_path=path, distance=dist, text_content=text)
+                    for path, dist, text, _ in hits
+                ]
+
+        return SearchBatchResponse(
+            results=[
+                SearchBatchResult(
+                    query=item.query,
+                    instruction=instruction.instruction,
+                    results=hits,
+                )
+                for item, instruction, hits in zip(
+                    request.queries, instructions, results
+                )
+            ]
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @app.post("/api/debate", response_model=DebateResponse)
 async def create_debate(request: DebateRequest):
     try:
-        debate_id = vector_store.add_debate(request.tldr, request.summary)
+        debate_id = await run_in_threadpool(
+            vector_store.add_debate, request.tldr, request.summary
+        )
         return DebateResponse(
             debate_id=debate_id, message="Debate created successfully"
         )
@@ -145,422 +361,400 @@ async def create_debate(request: DebateRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/api/add")
-async def add_image(
-    file: UploadFile = File(...),
-    text_content: str = "",
-    debate_id: str = "0",  # Changed to string to handle form data correctly
-):
-    try:
-        # Parse debate_id as integer, print the raw value for debugging
-        print(f"Raw debate_id received: '{debate_id}' (type: {type(debate_id)})")
+def resolve_debate_id(debate_id: str) -> int:
+    """Parse the form's debate_id, falling back to the latest debate if it is invalid"""
+    # Parse debate_id as integer, log the raw value for debugging
+    logger.debug("Raw debate_id received: '%s' (type: %s)", debate_id, type(debate_id))
 
-        try:
-            debate_id_int = int(debate_id)
-        except (ValueError, TypeError):
-            print(
-                f"WARNING: Cannot parse debate_id '{debate_id}' as an integer, defaulting to latest debate"
-            )
-            # Try to get the most recent debate ID as a fallback
-            vector_store.cursor.execute(
-                "SELECT id FROM debate ORDER BY id DESC LIMIT 1"
+    try:
+        debate_id_int = int(debate_id)
+    except (ValueError, TypeError):
+        logger.warning(
+            "Cannot parse debate_id '%s' as an integer, defaulting to latest debate",
+            debate_id,
+        )
+        # Try to get the most recent debate ID as a fallback
+        debate_id_int = vector_store.get_latest_debate_id() or 0
+        logger.info("Using latest debate ID: %d", debate_id_int)
+
+    # Extra validation
+    if debate_id_int <= 0:
+        # Try to get the most recent debate ID as a fallback
+        latest_debate_id = vector_store.get_latest_debate_id()
+        if latest_debate_id:
+            debate_id_int = latest_debate_id
+            logger.warning(
+                "Found invalid debate_id=%s, using latest debate ID %d instead",
+                debate_id,
+                debate_id_int,
             )
-            latest_debate = vector_store.cursor.fetchone()
-            debate_id_int = latest_debate[0] if latest_debate else 0
-            print(f"Using latest debate ID: {debate_id_int}")
-
-        # Extra validation
-        if debate_id_int <= 0:
-            # Try to get the most recent debate ID as a fallback
-            vector_store.cursor.execute(
-                "SELECT id FROM debate ORDER BY id DESC LIMIT 1"
+        else:
+            logger.warning(
+                "No valid debates found in database, images won't be associated correctly"
             )
-            latest_debate = vector_store.cursor.fetchone()
-            if latest_debate:
-                debate_id_int = latest_debate[0]
-                print(
-                    f"Found invalid debate_id={debate_id}, using latest debate ID {debate_id_int} instead"
-                )
-            else:
-                print(
-                    f"WARNING: No valid debates found in database, images won't be associated correctly"
-                )
 
-        # Verify debate exists
-        vector_store.cursor.execute(
-            "SELECT id, tldr FROM debate WHERE id = ?", (debate_id_int,)
-        )
-        debate = vector_store.cursor.fetchone()
-        if not debate:
-            print(f"WARNING: Debate with ID {debate_id_int} does not exist in database")
-            # Try to get any valid debate as a fallback
-            vector_store.cursor.execute(
-                "SELECT id, tldr FROM debate ORDER BY id DESC LIMIT 1"
-            )
-            fallback_debate = vector_store.cursor.fetchone()
-            if fallback_debate:
-                debate_id_int = fallback_debate[0]
-                print(
-                    f"Using fallback debate ID {debate_id_int} ({fallback_debate[1]})"
-                )
-            else:
-                print(f"ERROR: No debates found in database")
+    # Verify debate exists
+    debate = vector_store.get_debate_detail(debate_id_int)
+    if not debate:
+        logger.warning("Debate with ID %d does not exist in database", debate_id_int)
+        # Try to get any valid debate as a fallback
+        fallback_debate_id = vector_store.get_latest_debate_id()
+        if fallback_debate_id:
+            debate_id_int = fallback_debate_id
+            logger.info("Using fallback debate ID %d", debate_id_int)
         else:
-            print(f"Found debate {debate_id_int}: {debate[1]}")
+            logger.error("No debates found in database")
+    else:
+        logger.debug("Found debate %d: %s", debate_id_int, debate[1])
 
-        print(
-            f"Received upload request for debate_id={debate_id_int}, file={file.filename}"
-        )
+    return debate_id_int
+
+
+async def ingest_upload(file: UploadFile, debate_id_int: int, text_content: str) -> dict:
+    """Store one uploaded file and queue it for processing"""
+    logger.info(
+        "Received upload request for debate_id=%d, file=%s", debate_id_int, file.filename
+    )
+
+    # Ensure the upload directory exists
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
-        # Create a unique filename using a hash of the original filename and timestamp
-        timestamp = str(int(time.time()))
-        original_filename = file.filename or "uploaded_image"
-        file_extension = (
-            original_filename.split(".")[-1] if "." in original_filename else "jpg"
+    # Stored under the hash of its content, so the same photo is kept once.
+    # コピーはスレッドで行い、イベントループではファイル I/O をしない
+    try:
+        stored = await run_in_threadpool(
+            store_upload, file.file, UPLOADS_DIR, file.filename, MAX_UPLOAD_BYTES
         )
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-        # Create hash from original filename + timestamp
-        unique_id = hashlib.md5(f"{original_filename}_{timestamp}".encode()).hexdigest()
-        new_filename = f"{unique_id}.{file_extension}"
+    # URL path for database storage (this is what will be served to the client)
+    # Important: No leading slash, and no 'src/' prefix for consistent storage
+    url_path = upload_url_path(stored.path)
 
-        # Ensure the upload directory exists
-        uploads_dir = Path("src/static/uploads")
-        uploads_dir.mkdir(parents=True, exist_ok=True)
+    image_id = None
+    status = "pending"
 
-        # Full path for file system storage
-        file_system_path = uploads_dir / new_filename
+    phash = None
+    if ingest_queue.near_duplicate_distance > 0:
+        try:
+            phash = await run_in_stage("preprocess", dhash, str(stored.path))
+        except Exception as e:
+            logger.warning("Error computing perceptual hash: %s", e)
 
-        # URL path for database storage (this is what will be served to the client)
-        # Important: No leading slash, and no 'src/' prefix for consistent storage
-        url_path = f"static/uploads/{new_filename}"
+    try:
+        # Mistral / Stella の処理はワーカーに任せてすぐに返す
+        # （処理済みの画像と同じ内容なら結果を使い回して indexed で返る）
+        logger.debug("Queueing image %s", url_path)
+        image_id = await ingest_queue.aenqueue(
+            debate_id_int, url_path, content_hash=stored.content_hash, phash=phash
+        )
+        status = (await run_in_threadpool(ingest_queue.status, image_id))["status"]
+        logger.info("Queued image %d for processing (%s)", image_id, status)
+    except Exception as e:
+        logger.exception("Error queueing image: %s", e)
+        status = "failed"
+        # Even if processing fails, still add the basic image record to the database
+        image_id = await run_in_threadpool(
+            vector_store.add_image_record, debate_id_int, url_path, text_content or ""
+        )
+        logger.info(
+            "Saved basic image record with ID %d for debate %d", image_id, debate_id_int
+        )
 
-        print(f"Saving file to {file_system_path}")
+    # Verify the association after saving
+    await run_in_threadpool(vector_store.ensure_image_debate, image_id, debate_id_int)
 
-        # Write the file
-        contents = await file.read()
-        with open(file_system_path, "wb") as f:
-            f.write(contents)
+    return {
+        "message": "Successfully added",
+        "image_id": image_id,
+        "image_path": url_path,
+        "debate_id": debate_id_int,  # Return debate_id for verification
+        "status": status,  # Poll /api/image/{image_id}/status until indexed
+    }
 
-        # Verify file was written correctly
-        if not file_system_path.exists():
-            raise HTTPException(
-                status_code=500, detail=f"Failed to save file to {file_system_path}"
-            )
 
-        if file_system_path.stat().st_size == 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"File was saved but is empty: {file_system_path}",
-            )
+@app.post("/api/add")
+async def add_image(
+    file: UploadFile = File(...),
+    text_content: str = "",
+    debate_id: str = "0",  # Changed to string to handle form data correctly
+):
+    try:
+        debate_id_int = await run_in_threadpool(resolve_debate_id, debate_id)
+        return await ingest_upload(file, debate_id_int, text_content)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error uploading image: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-        print(f"Successfully saved file ({file_system_path.stat().st_size} bytes)")
 
-        image_id = None
+@app.post("/api/add/batch")
+async def add_images(
+    files: List[UploadFile] = File(...),
+    text_content: str = "",
+    debate_id: str = "0",
+):
+    """Upload several images to one debate; each file gets its own result"""
+    if len(files) > MAX_BATCH_FILES:
+        raise HTTPException(
+            status_code=413, detail=f"At most {MAX_BATCH_FILES} files per request"
+        )
+    debate_id_int = await run_in_threadpool(resolve_debate_id, debate_id)
 
+    results = []
+    # 1 ファイルずつ流すのでメモリ使用量はファイル数に比例しない
+    for file in files:
         try:
-            # Process the image and add it to the vector store
-            print(f"Processing image {url_path}")
-            image_id = vector_store.process_and_add_image(debate_id_int, url_path)
-            print(
-                f"Successfully processed image and added to vector store with ID {image_id}"
+            results.append(await ingest_upload(file, debate_id_int, text_content))
+        except HTTPException as e:
+            results.append(
+                {"filename": file.filename, "status": "rejected", "error": e.detail}
             )
         except Exception as e:
-            print(f"Error processing image: {str(e)}")
-            # Even if processing fails, still add the basic image record to the database
-            cursor = vector_store.cursor
-            cursor.execute(
-                """
-                INSERT INTO image (debate_id, image_path, ocr)
-                VALUES (?, ?, ?)
-            """,
-                (debate_id_int, url_path, text_content or ""),
-            )
-            image_id = cursor.lastrowid
-            vector_store.conn.commit()
-            print(
-                f"Saved basic image record with ID {image_id} for debate {debate_id_int}"
+            logger.exception("Error uploading image %s: %s", file.filename, e)
+            results.append(
+                {"filename": file.filename, "status": "failed", "error": str(e)}
             )
-
-        # Verify the association after saving
-        vector_store.cursor.execute(
-            "SELECT debate_id FROM image WHERE id = ?", (image_id,)
+    return {"debate_id": debate_id_int, "results": results}
+
+
+@app.get("/api/image/{image_id}/status", response_model=ImageStatusResponse)
+async def get_image_status(image_id: int):
+    status = await run_in_threadpool(ingest_queue.status, image_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Image with ID {image_id} not found")
+    return ImageStatusResponse(**status)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics: per-stage latency histograms, index sizes and queue depths"""
+    INDEX_VECTORS.set(live_count(vector_store.index), index="images")
+    QUEUE_DEPTH.set(await run_in_threadpool(ingest_queue.depth), queue="ingest")
+    if vector_store.debate_index is not None:
+        INDEX_VECTORS.set(live_count(vector_store.debate_index.index), index="debates")
+        QUEUE_DEPTH.set(
+            await run_in_threadpool(vector_store.debate_index.queue_depth),
+            queue="debate_vectors",
         )
-        saved_debate_id = vector_store.cursor.fetchone()
+    QUEUE_DEPTH.set(
+        vector_store.processer.batcher.stats()["queue_depth"], queue="embed_batcher"
+    )
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
-        if not saved_debate_id or saved_debate_id[0] != debate_id_int:
-            print(
-                f"WARNING: Image association issue detected. Expected debate_id={debate_id_int}, got {saved_debate_id[0] if saved_debate_id else 'None'}"
-            )
-            # Fix the association
-            vector_store.cursor.execute(
-                "UPDATE image SET debate_id = ? WHERE id = ?", (debate_id_int, image_id)
-            )
-            vector_store.conn.commit()
-            print(
-                f"Fixed association: Image {image_id} is now associated with debate {debate_id_int}"
-            )
 
-        # Double check the image is in the right place in the filesystem
-        if not os.path.exists(file_system_path):
-            print(
-                f"WARNING: Image file not found at expected location: {file_system_path}"
-            )
-        else:
-            print(
-                f"Confirmed image file exists at: {file_system_path} ({os.path.getsize(file_system_path)} bytes)"
-            )
+@app.get("/api/embedder/stats")
+async def get_embedder_stats():
+    return vector_store.processer.batcher.stats()
 
-        return {
-            "message": "Successfully added",
-            "image_id": image_id,
-            "image_path": url_path,
-            "debate_id": debate_id_int,  # Return debate_id for verification
-        }
 
-    except Exception as e:
-        print(f"Error uploading image: {str(e)}")
-        import traceback
+@app.get("/api/cache/stats")
+async def get_cache_stats():
+    return await run_in_threadpool(vector_store.processer.query_cache.stats)
 
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
 
+# 実行中の再埋め込みジョブの状態（1 プロセスにつき同時に 1 つ）
+reindex_state = {"status": "idle", "model": None, "vectors": None, "error": None}
 
-@app.get("/api/debates", response_model=DebateListResponse)
-async def get_debates():
-    try:
-        debates = vector_store.get_debates()
-
-        formatted_debates = []
-
-        for debate in debates:
-            debate_id = debate[0]
-            tldr = debate[1]
-            summary = debate[2]
-
-            created_at = ""
-            if len(debate) > 3:
-                if isinstance(debate[3], str):
-                    created_at = debate[3]
-                else:
-                    created_at = str(debate[3])
-
-            # Query for associated images
-            vector_store.cursor.execute(
-                """
-                SELECT id, image_path FROM image 
-                WHERE debate_id = ? 
-                ORDER BY id DESC LIMIT 1
-            """,
-                (debate_id,),
-            )
 
-            result = vector_store.cursor.fetchone()
+def run_reindex(model_name: str, batch_size: int):
+    try:
+        embedder = load_embedder(model_name)
+        reindex_state["status"] = "embedding"
+        reindex_state["vectors"] = vector_store.reindex(embedder, model_name, batch_size)
+        reindex_state["status"] = "done"
+    except Exception as e:
+        logger.exception("Error reindexing with %s: %s", model_name, e)
+        reindex_state["status"] = "failed"
+        reindex_state["error"] = str(e)
 
-            # Debug image association
-            print(f"Debate {debate_id}: Found image? {result is not None}")
 
-            image_path = None
-            if result and result[0]:
-                image_id, image_path = result
-                # Make sure the path follows our conventions
-                if image_path and image_path.startswith("src/"):
-                    image_path = image_path[4:]  # Remove 'src/' prefix
-                    print(f"  Fixed image path: {image_path}")
+@app.post("/api/reindex")
+async def start_reindex(model: str, batch_size: int = Query(64, ge=1, le=1024)):
+    """Re-embed every description with ``model`` and swap the index when done"""
+    if reindex_state["status"] in ("loading", "embedding"):
+        raise HTTPException(status_code=409, detail="A reindex is already running")
+    reindex_state.update(status="loading", model=model, vectors=None, error=None)
+    threading.Thread(
+        target=run_reindex, args=(model, batch_size), name="reindex", daemon=True
+    ).start()
+    return reindex_state
 
-                # Verify the file exists
-                file_path = (
-                    f"src/{image_path}"
-                    if not image_path.startswith("src/")
-                    else image_path
-                )
-                if not os.path.exists(file_path):
-                    # Try alternative paths
-                    basename = os.path.basename(image_path)
-                    alt_path = f"src/static/uploads/{basename}"
-                    if os.path.exists(alt_path):
-                        print(
-                            f"  Image file not found at {file_path}, but found at {alt_path}"
-                        )
-                        # Update the path in the database
-                        normalized_path = f"static/uploads/{basename}"
-                        vector_store.cursor.execute(
-                            "UPDATE image SET image_path = ? WHERE id = ?",
-                            (normalized_path, image_id),
-                        )
-                        vector_store.conn.commit()
-                        image_path = normalized_path
-                        print(f"  Updated image path in database to {normalized_path}")
-                    else:
-                        print(
-                            f"  WARNING: Image file not found at {file_path} or {alt_path}"
-                        )
-
-            formatted_debates.append(
-                DebateListItem(
-                    id=debate_id,
-                    tldr=tldr,
-                    summary=summary,
-                    created_at=created_at,
-                    image_path=image_path,
-                    score=0.0,  # Default score is 0 for regular listing
-                )
-            )
 
-            print(f"Debate {debate_id}: {tldr} - Image path: {image_path}")
+@app.get("/api/reindex")
+async def get_reindex_status():
+    return {
+        **reindex_state,
+        "embedding_model": vector_store.embedding_model,
+        "dimension": vector_store.dimension,
+    }
 
-        return DebateListResponse(debates=formatted_debates)
-    except Exception as e:
-        print(f"Error fetching debates: {str(e)}")
-        import traceback
 
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=str(e))
+# keyset ページングで 1 回に読む行数
+DEBATE_PAGE_SIZE = 100
 
 
-@app.get("/api/search-debates")
-async def search_debates(
-    query: str, minimum_score: float = 0.0, include_all: bool = False
-):
-    try:
-        print(f"Searching for debates with query: '{query}'")
-        print(f"Parameters: minimum_score={minimum_score}, include_all={include_all}")
+def encode_cursor(state: dict) -> str:
+    """Opaque pagination cursor"""
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
 
-        # Get all debates first
-        all_debates = vector_store.get_debates_with_images()
-        print(f"Found {len(all_debates)} total debates")
 
-        # Dictionary to store scores for each debate
-        score_by_debate = {}
+def decode_cursor(
+    cursor: Optional[str], keys: Sequence[str] = ("after",)
+) -> Optional[dict]:
+    """Cursor state (one of ``keys``); anything else is a 400"""
+    if not cursor:
+        return None
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(state, dict) or len(state) != 1:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    [(key, value)] = state.items()
+    if key == "offset":
+        valid = type(value) is int and value >= 0
+    else:
+        # {"after": null} は include_all でスコア付きの debate を出し切った後
+        valid = value is None or (
+            isinstance(value, list)
+            and len(value) == 2
+            and isinstance(value[0], str)
+            and type(value[1]) is int
+        )
+    if key not in keys or not valid:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return state
+
+
+async def iter_debate_pages(
+    limit: int,
+    after: Optional[Tuple[str, int]] = None,
+    exclude_ids: Sequence[int] = (),
+) -> AsyncIterator[tuple]:
+    """Debate rows (most recently updated first) fetched page by page, up to ``limit``"""
+    remaining = limit
+    while remaining > 0:
+        page_size = min(remaining, DEBATE_PAGE_SIZE)
+        rows = await run_in_threadpool(
+            vector_store.list_debates, page_size, after, exclude_ids
+        )
+        for row in rows:
+            yield row
+        if len(rows) < page_size:
+            return
+        remaining -= len(rows)
+        after = (rows[-1][3], rows[-1][0])
 
-        try:
-            # Use embedding-based vector search with cosine similarity
-            print("Performing embedding-based search...")
-            query, search_results = vector_store.search_by_text(
-                query, k=20
-            )  # Increase k to get more potential matches
-            print(f"Search returned {len(search_results)} results")
-
-            # Build a dictionary of image_path -> score for results
-            score_by_image = {}
-            for image_path, distance, _, _ in search_results:
-                # Convert distance to similarity score (lower distance is higher similarity)
-                # For FAISS L2 distance, use exponential decay to convert to 0-1 range
-                similarity = 1.0 / (1.0 + float(distance))
-                score_by_image[image_path] = similarity
-                print(f"Image: {image_path}, Score: {similarity:.4f}")
-
-            # Map debate IDs to their best scores
-            for image_path, score in score_by_image.items():
-                # Find which debate this image belongs to
-                vector_store.cursor.execute(
-                    """
-                    SELECT debate_id FROM image WHERE image_path = ?
-                """,
-                    (image_path,),
-                )
-                result = vector_store.cursor.fetchone()
-                if result and result[0]:
-                    debate_id = result[0]
-                    # Keep the highest score for each debate
-                    if (
-                        debate_id not in score_by_debate
-                        or score > score_by_debate[debate_id]
-                    ):
-                        score_by_debate[debate_id] = score
-                        print(
-                            f"Associating image score with debate ID {debate_id}: {score:.4f}"
-                        )
-        except Exception as e:
-            print(f"Error in vector search: {str(e)}")
-            print("Will continue with direct text matching only")
-
-        # Format the results, including all debates but with scores
-        debate_results = []
-        relevant_count = 0
-
-        for debate in all_debates:
-            debate_id = debate[0]
-            tldr = debate[1]
-            summary = debate[2]
-            created_at = str(debate[3]) if len(debate) > 3 else ""
-
-            # Find the associated image
-            vector_store.cursor.execute(
-                """
-                SELECT image_path, ocr FROM image 
-                WHERE debate_id = ? 
-                ORDER BY id DESC LIMIT 1
-            """,
-                (debate_id,),
-            )
 
-            image_path, ocr_text = vector_store.cursor.fetchone()
+def debate_item(row: tuple, score: float = 0.0) -> DebateListItem:
+    debate_id, tldr, summary, updated_at, _, image_path, _ = row
+    # Make sure the path follows our conventions (no 'src/' prefix)
+    if image_path and image_path.startswith("src/"):
+        image_path = image_path[4:]
+    return DebateListItem(
+        id=debate_id,
+        tldr=tldr,
+        summary=summary,
+        created_at=str(updated_at or ""),
+        image_path=image_path,
+        score=score,
+    )
 
-            # image_path_result = vector_store.cursor.fetchone()
-            # image_path = image_path_result[0] if image_path_result else None
 
-            # Normalize image path
-            if image_path and image_path.startswith("src/"):
-                image_path = image_path[4:]
+def ndjson_response(items: AsyncIterator[BaseModel], next_cursor: dict):
+    """Stream one JSON object per line, then a final {"next_cursor": ...} line"""
 
-            # Get score from search results or do direct matching on debate text
-            score = score_by_debate.get(debate_id, 0.0)
+    async def lines():
+        async for item in items:
+            yield item.model_dump_json() + "\n"
+        yield json.dumps({"next_cursor": next_cursor.get("value")}) + "\n"
 
-            # Always check for direct text matching in titles and summaries
-            # as this can sometimes be more accurate than image-based matching
-            if query:
-                query_lower = query.lower()
-                tldr_lower = tldr.lower()
-                summary_lower = (summary or "").lower()
-                ocr_text_lower = ocr_text.lower()
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
-                # Direct matching in title gets high score
-                if query_lower in tldr_lower:
-                    direct_match_score = 0.9
-                    score = max(score, direct_match_score)
-                    print(
-                        f"Direct title match for debate {debate_id}: score {direct_match_score}"
-                    )
 
-                # ocr_text matching
-                elif query_lower in ocr_text_lower:
-                    ocr_match_score = 0.8
-                    score = max(score, ocr_match_score)
-                    print(
-                        f"OCR text match for debate {debate_id}: score {ocr_match_score}"
-                    )
+@app.get("/api/debates", response_model=DebateListResponse)
+async def get_debates(
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+):
+    """Debates, most recently updated first
 
-                # Partial matching in title
-                elif any(word in tldr_lower for word in query_lower.split()):
-                    # Calculate how many words match
-                    query_words = set(query_lower.split())
-                    title_words = set(tldr_lower.split())
-                    matching_words = sum(
-                        1 for word in query_words if word in title_words
-                    )
-                    partial_match_score = 0.5 * (matching_words / len(query_words))
-                    score = max(score, partial_match_score)
-                    print(
-                        f"Partial title match for debate {debate_id}: score {partial_match_score:.4f}"
-                    )
+    Pass ``next_cursor`` from the previous page as ``cursor`` to continue.
+    With ``stream=true`` the response is NDJSON (one debate per line, then a
+    ``{"next_cursor": ...}`` line) written as rows are read.
+    """
+    try:
+        state = decode_cursor(cursor)
+        after = tuple(state["after"]) if state and state["after"] else None
+        next_cursor = {}
+
+        async def items():
+            count, last = 0, None
+            async for row in iter_debate_pages(limit, after):
+                count, last = count + 1, row
+                yield debate_item(row)
+            if count == limit:
+                next_cursor["value"] = encode_cursor({"after": [last[3], last[0]]})
+
+        if stream:
+            return ndjson_response(items(), next_cursor)
+
+        debates = [item async for item in items()]
+        return DebateListResponse(
+            debates=debates, next_cursor=next_cursor.get("value")
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error fetching debates: %s", e)
+        raise HTTPException(status_code=500, detail=str(e))
 
-                # Summary matching
-                elif summary and query_lower in summary_lower:
-                    summary_match_score = 0.6
-                    score = max(score, summary_match_score)
-                    print(
-                        f"Summary match for debate {debate_id}: score {summary_match_score}"
-                    )
 
-            # Track if this is a relevant result
-            is_relevant = score > minimum_score
-            if is_relevant:
-                relevant_count += 1
+@app.get("/api/search-debates")
+async def search_debates(
+    query: str,
+    minimum_score: float = 0.0,
+    include_all: bool = False,
+    limit: int = Query(50, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+):
+    """Debates ranked by hybrid search score, ``limit`` per page
 
-            # Only include debates that have a score above the minimum or if include_all is true
-            if is_relevant or include_all:
-                debate_results.append(
-                    DebateResult(
+    Matched debates come first (highest score first); with ``include_all``
+    the remaining debates follow with score 0, most recently updated first.
+    ``cursor`` / ``stream`` work as in /api/debates.
+    """
+    try:
+        logger.debug(
+            "Searching for debates with query: '%s' (minimum_score=%s, include_all=%s)",
+            query,
+            minimum_score,
+            include_all,
+        )
+        state = decode_cursor(cursor, ("offset", "after")) or {"offset": 0}
+
+        # 検索ヒットの debate 対応付けと最新画像の取得はまとめてクエリする
+        # include_all では全てのスコア付き debate を先に返す
+        query, ranked = await vector_store.asearch_debates(
+            query, k=20, minimum_score=-1.0 if include_all else minimum_score
+        )  # k: ベクトル側（debate の index → 画像で再採点）で拾う debate 数
+        logger.debug("Found %d matching debates", len(ranked))
+        next_cursor = {}
+
+        async def items():
+            remaining, after = limit, None
+            if "offset" in state:
+                offset = state["offset"]
+                page = ranked[offset : offset + limit]
+                for debate_id, tldr, summary, created_at, image_path, score in page:
+                    yield DebateResult(
                         id=debate_id,
                         tldr=tldr,
                         summary=summary,
@@ -568,67 +762,61 @@ async def search_debates(
                         image_path=image_path,
                         score=score,
                     )
-                )
-
-        # Sort debates by score, highest first
-        debate_results.sort(key=lambda x: x.score, reverse=True)
-
-        print(
-            f"Returning {len(debate_results)} debate results, {relevant_count} with score > {minimum_score}"
+                if offset + limit < len(ranked):
+                    next_cursor["value"] = encode_cursor({"offset": offset + limit})
+                    return
+                remaining -= len(page)
+            elif state.get("after") is not None:
+                after = tuple(state["after"])
+
+            if not include_all:
+                return
+            if remaining == 0:
+                next_cursor["value"] = encode_cursor({"after": None})
+                return
+
+            # スコアの付かなかった debate を更新日時順に続ける
+            count, last = 0, None
+            exclude_ids = [row[0] for row in ranked]
+            async for row in iter_debate_pages(remaining, after, exclude_ids):
+                count, last = count + 1, row
+                yield DebateResult(**debate_item(row).model_dump())
+            if count == remaining:
+                next_cursor["value"] = encode_cursor({"after": [last[3], last[0]]})
+
+        if stream:
+            return ndjson_response(items(), next_cursor)
+
+        debate_results = [item async for item in items()]
+        logger.debug("Returning %d debate results", len(debate_results))
+        return DebateSearchResponse(
+            debates=debate_results, next_cursor=next_cursor.get("value")
         )
-        return DebateSearchResponse(debates=debate_results)
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error searching debates: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error searching debates: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.get("/api/debate/{debate_id}", response_model=DebateDetailResponse)
 async def get_debate(debate_id: int):
     try:
-        print(f"Fetching details for debate ID: {debate_id}")
-
-        # Check if debate exists
-        vector_store.cursor.execute(
-            """
-            SELECT id, tldr, summary, created_at, updated_at FROM debate WHERE id = ?
-        """,
-            (debate_id,),
-        )
+        logger.debug("Fetching details for debate ID: %d", debate_id)
 
-        debate = vector_store.cursor.fetchone()
+        # Check if debate exists (and get its latest image and OCR text)
+        debate = await run_in_threadpool(vector_store.get_debate_detail, debate_id)
         if not debate:
             raise HTTPException(
                 status_code=404, detail=f"Debate with ID {debate_id} not found"
             )
 
-        # Extract debate details
-        debate_id = debate[0]
-        tldr = debate[1]
-        summary = debate[2]
-        created_at = str(debate[3] or "")
-
-        # Get associated image and OCR text
-        vector_store.cursor.execute(
-            """
-            SELECT id, image_path, ocr FROM image 
-            WHERE debate_id = ? 
-            ORDER BY id DESC LIMIT 1
-        """,
-            (debate_id,),
-        )
+        debate_id, tldr, summary, created_at, image_path, ocr_text = debate
+        created_at = str(created_at or "")
 
-        image_result = vector_store.cursor.fetchone()
-        image_path = None
-        ocr_text = None
-
-        if image_result:
-            image_id, image_path, ocr_text = image_result
-            # Normalize path
-            if image_path and image_path.startswith("src/"):
-                image_path = image_path[4:]
+        # Normalize path
+        if image_path and image_path.startswith("src/"):
+            image_path = image_path[4:]
 
         # Create response object
         response = DebateDetailResponse(
@@ -641,50 +829,36 @@ async def get_debate(debate_id: int):
             ocr_text=ocr_text or "",
         )
 
-        print(f"Returning debate details: {response}")
+        logger.debug("Returning debate details: %s", response)
         return response
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error fetching debate details: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error fetching debate details: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @app.delete("/api/debate/{debate_id}")
 async def delete_debate(debate_id: int):
     try:
-        print(f"Deleting debate ID: {debate_id}")
+        logger.info("Deleting debate ID: %d", debate_id)
 
         # Check if debate exists
-        vector_store.cursor.execute(
-            """
-            SELECT id FROM debate WHERE id = ?
-        """,
-            (debate_id,),
-        )
-
-        debate = vector_store.cursor.fetchone()
-        if not debate:
+        if not await run_in_threadpool(vector_store.debate_exists, debate_id):
             raise HTTPException(
                 status_code=404, detail=f"Debate with ID {debate_id} not found"
             )
 
         # Delete the debate and associated images
-        vector_store.delete_debate(debate_id)
+        await run_in_threadpool(vector_store.delete_debate, debate_id)
 
         return {"message": f"Debate {debate_id} deleted successfully"}
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error deleting debate: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error deleting debate: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -692,35 +866,27 @@ async def delete_debate(debate_id: int):
 async def update_debate(debate_id: int, request: DebateRequest):
     """
     tldr, summaryを更新する
-    summaryに応じてembeddingもし直す
+    summaryに応じてembeddingもし直す（debate の index がバックグラウンドで、
+    続けて編集された場合は最後の編集から WR_DEBATE_DEBOUNCE 秒後に 1 回だけ）
     """
     try:
-        print(f"Updating debate ID: {debate_id}")
+        logger.info("Updating debate ID: %d", debate_id)
 
         # Check if debate exists
-        vector_store.cursor.execute(
-            """
-            SELECT id FROM debate WHERE id = ?
-        """,
-            (debate_id,),
-        )
-
-        debate = vector_store.cursor.fetchone()
-        if not debate:
+        if not await run_in_threadpool(vector_store.debate_exists, debate_id):
             raise HTTPException(
                 status_code=404, detail=f"Debate with ID {debate_id} not found"
             )
 
         # Update the debate
-        vector_store.update_debate(debate_id, request.tldr, request.summary)
+        await run_in_threadpool(
+            vector_store.update_debate, debate_id, request.tldr, request.summary
+        )
 
         return {"message": f"Debate {debate_id} updated successfully"}
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Error updating debate: {str(e)}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error updating debate: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
@@ -1,3 +1,6 @@
-rm vectors.db
-rm vectors.faiss
-rm src/static/uploads/*.jp*
+rm -f vectors.db vectors.db-wal vectors.db-shm
+rm -f vectors.faiss vectors.faiss.wal vectors.faiss.wal.flushing vectors.faiss.shadow vectors.faiss.tmp
+rm -f debates.faiss debates.faiss.wal debates.faiss.wal.flushing debates.faiss.shadow debates.faiss.tmp
+rm -f query_cache.db
+rm -f src/static/uploads/*.jp* src/static/uploads/*.png src/static/uploads/*.gif src/static/uploads/*.webp src/static/uploads/*.heic src/static/uploads/*.part
+rm -rf image_cache
@@ -0,0 +1,91 @@
+"""Recall@k vs latency of the ANN backends against the flat baseline.
+
+    python -m scripts.bench_ann_backends --n 100000
+    python -m scripts.bench_ann_backends --from-index vectors.faiss
+
+Vectors are synthetic clustered unit vectors unless ``--from-index`` points at
+an existing snapshot, in which case held-out stored vectors are used as queries.
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from src.domain.index_factory import IndexConfig, build_index, reconstruct_all
+
+
+def synthetic(n: int, dimension: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(16, n // 500), dimension), dtype=np.float32)
+    assign = rng.integers(len(centers), size=n + n_queries)
+    data = centers[assign] + 0.5 * rng.standard_normal(
+        (n + n_queries, dimension), dtype=np.float32
+    )
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data[:n], data[n:]
+
+
+def measure(index, queries, k, params, truth):
+    start = time.perf_counter()
+    _, found = index.search(queries, k, params=params)
+    elapsed = (time.perf_counter() - start) / len(queries) * 1000
+    recall = np.mean(
+        [len(set(f) & set(t)) / k for f, t in zip(found.tolist(), truth.tolist())]
+    )
+    return recall, elapsed
+
+
+def run(data, queries, k):
+    ids = np.arange(len(data), dtype=np.int64)
+    dimension = data.shape[1]
+    config = IndexConfig()
+
+    flat = build_index("flat", dimension, config)
+    flat.add_with_ids(data, ids)
+    _, truth = flat.search(queries, k)
+    _, latency = measure(flat, queries, k, None, truth)
+    print(f"{'flat':<10} {'-':>12}  recall@{k}=1.000  {latency:7.3f} ms/query")
+
+    sweeps = {
+        "hnsw": [("efSearch", v) for v in (16, 32, 64, 128, 256)],
+        "ivf_flat": [("nprobe", v) for v in (1, 4, 16, 64)],
+        "ivf_pq": [("nprobe", v) for v in (1, 4, 16, 64)],
+    }
+    for kind, sweep in sweeps.items():
+        start = time.perf_counter()
+        index = build_index(kind, dimension, config, data)
+        index.add_with_ids(data, ids)
+        build_time = time.perf_counter() - start
+        print(f"{kind:<10} built in {build_time:.1f} s")
+        for name, value in sweep:
+            if name == "efSearch":
+                params = faiss.SearchParametersHNSW(efSearch=value)
+            else:
+                params = faiss.SearchParametersIVF(nprobe=value)
+            recall, latency = measure(index, queries, k, params, truth)
+            print(
+                f"{kind:<10} {name + '=' + str(value):>12}  recall@{k}={recall:.3f}  {latency:7.3f} ms/query"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--from-index", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.from_index:
+        _, vectors = reconstruct_all(faiss.read_index(args.from_index))
+        rng = np.random.default_rng(0)
+        order = rng.permutation(len(vectors))
+        data = vectors[order[args.queries :]]
+        queries = vectors[order[: args.queries]]
+    else:
+        data, queries = synthetic(args.n, args.dimension, args.queries)
+
+    run(np.ascontiguousarray(data), np.ascontiguousarray(queries), args.k)
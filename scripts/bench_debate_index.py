@@ -0,0 +1,173 @@
+"""Recall and latency of the two-stage debate search vs. mapping the top-k images.
+
+    python -m scripts.bench_debate_index --debates 20000 --images-per-debate 5
+    python -m scripts.bench_debate_index --debates 20000 --vectors-per-image 4
+
+Builds a throwaway store of synthetic debates: each has a topic vector (topics
+come in clusters of ``--cluster-size`` related debates), its images' vectors are noisy copies of it and its tldr / summary embeds close to
+it. Queries are noisy copies of random image vectors. The reference ranking
+scores every debate exactly (best of its image vectors and its text vector).
+"images" is the previous vector side of /api/search-debates (the ``k`` best
+images mapped to their debates); "two-stage" is ``VectorStore.rank_debates``.
+Mistral / Stella are not involved.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.domain.debate_index import DEBATE_ID_MASK, TEXT_SLOT
+from src.domain.index_factory import needs_rebuild, reconstruct_all
+from src.domain.vector_store import IMAGE_ID_MASK, SEGMENT_SHIFT, VectorStore
+from src.model_registry import registry
+
+
+class TopicEmbedder:
+    """Embeds "topic <n>" texts close to the topic vector n"""
+
+    def __init__(self, topics: np.ndarray, noise: float, seed: int = 1):
+        self.topics = topics
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+
+    def embed_batch(self, texts, batch_size: int = 32):
+        topics = self.topics[[int(text.split()[1]) for text in texts]]
+        return topics + self.noise * self.rng.standard_normal(topics.shape, dtype=np.float32)
+
+    def embed_text(self, text):
+        return self.embed_batch([text])[0]
+
+
+def unit(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=-1, keepdims=True)
+
+
+def populate(store, topics, images_per_debate, vectors_per_image, noise, rng):
+    batch = 1000
+    for start in range(0, len(topics), batch):
+        debate_ids = []
+        with store.db.write() as cursor:
+            for topic in range(start, min(start + batch, len(topics))):
+                cursor.execute(
+                    "INSERT INTO debate (tldr, summary) VALUES (?, ?)",
+                    (f"topic {topic}", ""),
+                )
+                debate_ids.append(cursor.lastrowid)
+        records, vectors = [], []
+        for topic, debate_id in zip(range(start, start + batch), debate_ids):
+            for i in range(images_per_debate):
+                records.append((debate_id, f"static/uploads/{debate_id}_{i}.jpg", "", "", None))
+                vectors.append(
+                    topics[topic]
+                    + noise * rng.standard_normal((vectors_per_image, topics.shape[1]))
+                )
+        segments = [[("description", "")] * vectors_per_image] * len(records)
+        store.add_images(records, np.concatenate(vectors), segments=segments)
+        print(f"  {start + len(debate_ids):,d} debates")
+
+    # add_images が始めた移行を待ってから、残りの移行があれば済ませる
+    if store._rebuild_thread is not None:
+        store._rebuild_thread.join()
+    kind = needs_rebuild(store.index, store.index_config)
+    if kind is not None:
+        store._rebuild_index(kind)
+
+
+def exact_debate_scores(store, queries: np.ndarray) -> np.ndarray:
+    """(n_queries, max debate id + 1) exact max-sim scores"""
+    ids, vectors = reconstruct_all(store.index)
+    with store.db.read() as cursor:
+        cursor.execute("SELECT id, debate_id FROM image")
+        debate_of_image = dict(cursor.fetchall())
+    owners = np.array([debate_of_image[int(i) & IMAGE_ID_MASK] for i in ids])
+    text_ids, text_vectors = reconstruct_all(store.debate_index.index)
+    text_rows = (text_ids >> SEGMENT_SHIFT) == TEXT_SLOT
+    owners = np.concatenate([owners, text_ids[text_rows] & DEBATE_ID_MASK])
+    vectors = np.concatenate([vectors, text_vectors[text_rows]])
+
+    scores = np.full((len(queries), owners.max() + 1), -np.inf, dtype=np.float32)
+    similarities = queries @ vectors.T
+    for row in range(len(queries)):
+        np.maximum.at(scores[row], owners, similarities[row])
+    return scores
+
+
+def percentiles(latencies: list) -> str:
+    latencies = np.array(latencies) * 1000
+    return (
+        f"p50={np.percentile(latencies, 50):7.2f} ms  "
+        f"p99={np.percentile(latencies, 99):7.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--debates", type=int, default=20_000)
+    parser.add_argument("--images-per-debate", type=int, default=5)
+    parser.add_argument("--vectors-per-image", type=int, default=1)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--noise", type=float, default=0.03)
+    parser.add_argument("--cluster-size", type=int, default=20)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    centers = rng.standard_normal(
+        (args.debates // args.cluster_size + 1, args.dimension), dtype=np.float32
+    )
+    topics = unit(
+        centers[np.arange(args.debates) // args.cluster_size]
+        + 0.4 * rng.standard_normal((args.debates, args.dimension), dtype=np.float32)
+    )
+    registry.replace("stella", TopicEmbedder(topics, args.noise))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(dimension=args.dimension, db_path=str(Path(tmp) / "vectors.db"))
+        start = time.perf_counter()
+        populate(
+            store, topics, args.images_per_debate, args.vectors_per_image, args.noise, rng
+        )
+        # 最後のバッチまでキューが処理されるのを待つ
+        while True:
+            with store.db.read() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM debate_vector_queue")
+                if cursor.fetchone()[0] == 0 and store.debate_index.ready:
+                    break
+            time.sleep(0.5)
+        print(
+            f"Built {args.debates:,d} debates ({store.index.ntotal:,d} image vectors, "
+            f"{store.debate_index.index.ntotal:,d} debate vectors) "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        ids, vectors = reconstruct_all(store.index)
+        picks = rng.choice(len(ids), args.queries, replace=False)
+        queries = unit(
+            vectors[picks]
+            + 2 * args.noise * rng.standard_normal(vectors[picks].shape, dtype=np.float32)
+        ).astype(np.float32)
+        reference = exact_debate_scores(store, queries)
+
+        for name in ("images", "two-stage"):
+            latencies, recalls, found = [], [], []
+            for query, scores in zip(queries, reference):
+                truth = set(np.argsort(-scores)[: args.k].tolist())
+                start = time.perf_counter()
+                if name == "images":
+                    results = store.search(query, k=args.k)
+                    by_image = store.get_debate_ids_for_images(r[0] for r in results)
+                    ranking = list(dict.fromkeys(by_image[r[0]] for r in results))
+                else:
+                    ranking = [d for d, _ in store.rank_debates(query, k=args.k)]
+                latencies.append(time.perf_counter() - start)
+                recalls.append(len(truth & set(ranking)) / args.k)
+                found.append(len(ranking))
+            print(
+                f"{name:<10} debates found={np.mean(found):5.1f}  "
+                f"recall@{args.k}={np.mean(recalls):.3f}  {percentiles(latencies)}"
+            )
+        store.close()
@@ -0,0 +1,153 @@
+"""SQL latency of /api/search-debates: per-debate N+1 queries vs. set-based queries.
+
+    python -m scripts.bench_debate_search --debates 10000 --images-per-debate 3
+
+Builds a throwaway database, then fuses a synthetic set of k image hits into
+a debate ranking both ways. "legacy" is the old endpoint logic (one lookup per
+hit and one latest-image query per debate, no indexes); "batched" is
+``VectorStore.score_debates``.
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.domain.vector_store import VectorStore
+
+WORDS = "contrastive momentum encoder attention diffusion loss schedule dataset".split()
+
+
+def populate(store: VectorStore, n_debates: int, images_per_debate: int, seed: int):
+    rng = np.random.default_rng(seed)
+    with store.db.write() as cursor:
+        cursor.executemany(
+            "INSERT INTO debate (tldr, summary) VALUES (?, ?)",
+            [
+                (" ".join(rng.choice(WORDS, 3)), " ".join(rng.choice(WORDS, 12)))
+                for _ in range(n_debates)
+            ],
+        )
+        cursor.executemany(
+            "INSERT INTO image (debate_id, image_path, ocr) VALUES (?, ?, ?)",
+            [
+                (
+                    debate_id,
+                    f"static/uploads/{debate_id}_{i}.jpg",
+                    ", ".join(rng.choice(WORDS, 4)),
+                )
+                for debate_id in range(1, n_debates + 1)
+                for i in range(images_per_debate)
+            ],
+        )
+
+
+def legacy_direct_match_score(query: str, tldr: str, summary: str, ocr_text: str) -> float:
+    """The previous per-debate substring scoring"""
+    query_lower = query.lower()
+    tldr_lower = (tldr or "").lower()
+    if query_lower in tldr_lower:
+        return 0.9
+    if query_lower in (ocr_text or "").lower():
+        return 0.8
+    query_words = set(query_lower.split())
+    if any(word in tldr_lower for word in query_words):
+        title_words = set(tldr_lower.split())
+        return 0.5 * sum(1 for word in query_words if word in title_words) / len(query_words)
+    if summary and query_lower in summary.lower():
+        return 0.6
+    return 0.0
+
+
+def legacy_score_debates(cursor: sqlite3.Cursor, query: str, search_results):
+    """The previous /api/search-debates SQL access pattern"""
+    cursor.execute(
+        "SELECT id, tldr, summary, updated_at FROM debate ORDER BY updated_at DESC"
+    )
+    all_debates = cursor.fetchall()
+
+    score_by_debate = {}
+    for image_path, distance, _, _ in search_results:
+        cursor.execute("SELECT debate_id FROM image WHERE image_path = ?", (image_path,))
+        result = cursor.fetchone()
+        if result and result[0]:
+            score = 1.0 / (1.0 + distance)
+            score_by_debate[result[0]] = max(score, score_by_debate.get(result[0], 0.0))
+
+    results = []
+    for debate_id, tldr, summary, updated_at in all_debates:
+        cursor.execute(
+            "SELECT image_path, ocr FROM image WHERE debate_id = ? ORDER BY id DESC LIMIT 1",
+            (debate_id,),
+        )
+        image_path, ocr_text = cursor.fetchone()
+        score = max(
+            score_by_debate.get(debate_id, 0.0),
+            legacy_direct_match_score(query, tldr, summary, ocr_text),
+        )
+        if score > 0.0:
+            results.append((debate_id, tldr, summary, updated_at, image_path, score))
+    results.sort(key=lambda x: x[5], reverse=True)
+    return results
+
+
+def timed(fn, repeat: int) -> np.ndarray:
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies) * 1000
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--debates", type=int, default=10_000)
+    parser.add_argument("--images-per-debate", type=int, default=3)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--query", default="momentum encoder")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(db_path=str(Path(tmp) / "vectors.db"), debate_index=False)
+        populate(store, args.debates, args.images_per_debate, seed=0)
+
+        rng = np.random.default_rng(1)
+        search_results = [
+            (
+                f"static/uploads/{rng.integers(1, args.debates + 1)}_0.jpg",
+                float(rng.uniform(0.2, 1.0)),
+                "",
+                "",
+            )
+            for _ in range(args.k)
+        ]
+
+        batched = timed(
+            lambda: store.score_debates(args.query, search_results), args.repeat
+        )
+
+        # 旧実装はインデックス無しのスキーマで動いていた
+        store.db.executescript(
+            """
+            DROP INDEX idx_image_debate_id;
+            DROP INDEX idx_image_image_path;
+            DROP INDEX idx_debate_updated_at;
+        """
+        )
+        with store.db.read() as cursor:
+            legacy = timed(
+                lambda: legacy_score_debates(cursor, args.query, search_results),
+                args.repeat,
+            )
+
+        for name, latencies in (("legacy", legacy), ("batched", batched)):
+            print(
+                f"{name:>8}: debates={args.debates:,d}  k={args.k}  "
+                f"mean={latencies.mean():8.2f} ms  p99={np.percentile(latencies, 99):8.2f} ms"
+            )
+        store.close()
@@ -0,0 +1,66 @@
+"""Latency / throughput of the embedding backends on short queries and long descriptions.
+
+    python -m scripts.bench_embedder_backends
+    python -m scripts.bench_embedder_backends --backends torch onnx-int8 --threads 1 4 8
+
+For every backend and thread count (``WR_EMBED_THREADS``), reports the p50
+and p99 latency of single-text calls, which is the query path, and the
+throughput of ``embed_batch`` over descriptions, which is the ingest path.
+Run ``scripts.check_embedder_parity`` before switching ``WR_EMBED_BACKEND``.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from scripts.bench_embedder_batching import QUERIES
+from scripts.check_embedder_parity import descriptions
+from src.model_registry import EMBED_BACKENDS, STELLA_MODEL_NAME, load_embedder
+
+
+def latencies(embedder, texts, repeat: int) -> str:
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        embedder.embed_text(texts[i % len(texts)])
+        samples.append((time.perf_counter() - start) * 1000)
+    return f"p50={np.percentile(samples, 50):7.1f} ms  p99={np.percentile(samples, 99):7.1f} ms"
+
+
+def throughput(embedder, texts, batch_size: int, total: int) -> float:
+    texts = [texts[i % len(texts)] for i in range(total)]
+    start = time.perf_counter()
+    embedder.embed_batch(texts, batch_size=batch_size)
+    return total / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backends", nargs="+", choices=EMBED_BACKENDS, default=EMBED_BACKENDS
+    )
+    parser.add_argument("--threads", type=int, nargs="+", default=[os.cpu_count() or 1])
+    parser.add_argument("--model", default=STELLA_MODEL_NAME)
+    parser.add_argument("--db", default="vectors.db")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--total", type=int, default=128)
+    args = parser.parse_args()
+
+    long_texts = descriptions(args.db, 64)
+    for backend in args.backends:
+        for threads in args.threads:
+            os.environ["WR_EMBED_THREADS"] = str(threads)
+            start = time.perf_counter()
+            embedder = load_embedder(args.model, backend=backend)
+            load_seconds = time.perf_counter() - start
+            embedder.embed_batch(["warm up"] * 4)
+
+            print(f"{backend} threads={threads} (loaded in {load_seconds:.1f} s)")
+            print(f"  short query      {latencies(embedder, QUERIES, args.repeat)}")
+            print(f"  long description {latencies(embedder, long_texts, args.repeat)}")
+            rate = throughput(embedder, long_texts, args.batch_size, args.total)
+            print(f"  batch={args.batch_size} descriptions {rate:7.1f} texts/s")
+            del embedder
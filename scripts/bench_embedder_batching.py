@@ -0,0 +1,68 @@
+"""Embedding throughput with and without micro-batching at concurrency 1/8/32.
+
+    python -m scripts.bench_embedder_batching --requests 256
+
+"unbatched" runs one ``embed_text`` per request on the shared executor (the
+previous behaviour); "batched" sends every request through ``MicroBatcher``.
+"""
+
+import argparse
+import asyncio
+import time
+
+from src.concurrency import run_in_stage
+from src.micro_batcher import MicroBatcher
+from src.stella import StellaEmbedder
+
+QUERIES = [
+    "contrastive learning with a momentum encoder",
+    "whiteboard about transformer attention and positional encodings",
+    "SimCLR vs MoCo comparison",
+    "derivation of the InfoNCE loss",
+    "diagram of a diffusion model sampling loop",
+    "meeting notes on dataset collection schedule",
+]
+
+
+async def run_clients(embed, n_requests: int, concurrency: int) -> float:
+    queue = asyncio.Queue()
+    for i in range(n_requests):
+        queue.put_nowait(f"{QUERIES[i % len(QUERIES)]} #{i}")
+
+    async def client():
+        while not queue.empty():
+            await embed(queue.get_nowait())
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(concurrency)])
+    return n_requests / (time.perf_counter() - start)
+
+
+async def main(n_requests: int, max_batch_size: int, max_wait_ms: float):
+    embedder = StellaEmbedder()
+    embedder.embed_text("warm up")
+
+    async def unbatched(text):
+        return await run_in_stage("embed", embedder.embed_text, text)
+
+    for concurrency in (1, 8, 32):
+        batcher = MicroBatcher(
+            embedder.embed_batch, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms
+        )
+        plain = await run_clients(unbatched, n_requests, concurrency)
+        batched = await run_clients(batcher.embed, n_requests, concurrency)
+        stats = batcher.stats()
+        print(
+            f"concurrency={concurrency:>2}  unbatched={plain:7.1f} req/s  "
+            f"batched={batched:7.1f} req/s  mean batch={stats['mean_batch_size']:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=256)
+    parser.add_argument("--max-batch-size", type=int, default=32)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    asyncio.run(main(args.requests, args.max_batch_size, args.max_wait_ms))
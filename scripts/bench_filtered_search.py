@@ -0,0 +1,138 @@
+"""Filtered image search: post-filtering a global top-k vs. pre-filtered search.
+
+    python -m scripts.bench_filtered_search --boards 100000
+    python -m scripts.bench_filtered_search --boards 100000 --brute-force 0
+
+Builds a throwaway store of clustered synthetic vectors whose boards carry
+tags with selectivities from 50% down to 0.1% in their OCR entities. For each
+tag, a query is answered three ways:
+- "post": the global top ``k * --overfetch`` images, then keep the tagged
+  ones, as the app used to do;
+- "pre": ``VectorStore.search`` with a ``SearchFilter``, which brute-forces
+  subsets of at most ``--brute-force`` vectors and otherwise uses a FAISS
+  ``IDSelector``;
+- "cached": the same search again, with the filter's ID set cached.
+Recall@k is measured against an exact search over the tagged boards.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scripts.bench_ann_backends import synthetic
+from src.domain import vector_store
+from src.domain.index_factory import needs_rebuild
+from src.domain.search_filter import SearchFilter
+from src.domain.vector_store import VectorStore
+
+SELECTIVITIES = [0.5, 0.1, 0.01, 0.001]
+
+
+def tag(selectivity: float) -> str:
+    return f"tag{str(selectivity).replace('.', '')}"
+
+
+def populate(store: VectorStore, vectors: np.ndarray, rng: np.random.Generator):
+    n_boards = len(vectors)
+    draws = rng.random((n_boards, len(SELECTIVITIES)))
+    batch = 10_000
+    for start in range(0, n_boards, batch):
+        end = min(start + batch, n_boards)
+        with store.db.write() as cursor:
+            # executemany の後の lastrowid は当てにならないので先に採番位置を見ておく
+            cursor.execute("SELECT COALESCE(MAX(id), 0) FROM image")
+            first_id = cursor.fetchone()[0] + 1
+            cursor.executemany(
+                "INSERT INTO image (image_path, ocr, has_vector) VALUES (?, ?, 1)",
+                [
+                    (
+                        f"static/uploads/{i}.jpg",
+                        ", ".join(
+                            tag(s) for s, d in zip(SELECTIVITIES, draws[i]) if d < s
+                        ),
+                    )
+                    for i in range(start, end)
+                ],
+            )
+            image_ids = list(range(first_id, first_id + end - start))
+            cursor.executemany(
+                "INSERT INTO image_vector (image_id, slot, kind, text) VALUES (?, 0, '', '')",
+                [(image_id,) for image_id in image_ids],
+            )
+        store.persistence.add(image_ids, vectors[start:end])
+    kind = needs_rebuild(store.index, store.index_config)
+    if kind is not None:
+        store._rebuild_index(kind)
+
+
+def recall(found, truth) -> float:
+    return len(set(found) & set(truth)) / max(len(truth), 1)
+
+
+def percentile(latencies, q) -> float:
+    return float(np.percentile(np.array(latencies) * 1000, q))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--boards", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--overfetch", type=int, default=10)
+    parser.add_argument("--brute-force", type=int, default=vector_store.FILTER_BRUTE_FORCE)
+    args = parser.parse_args()
+    vector_store.FILTER_BRUTE_FORCE = args.brute_force
+
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(
+            dimension=args.dimension,
+            db_path=str(Path(tmp) / "vectors.db"),
+            debate_index=False,
+        )
+        # クラスタを持つ合成ベクトル（一様乱数は IVF に不利すぎる）
+        vectors, queries = synthetic(args.boards, args.dimension, args.queries)
+        populate(store, vectors, rng)
+        print(f"{args.boards:,d} boards in a {type(store.index).__name__} index")
+        print(
+            f"{'selectivity':>11} {'matches':>8}  {'method':<7} "
+            f"{'recall@' + str(args.k):>9} {'p50 ms':>8} {'p99 ms':>8}"
+        )
+        for selectivity in SELECTIVITIES:
+            search_filter = SearchFilter(entities=[tag(selectivity)])
+            ids, _ = store._filter_selection(search_filter)
+            # 正解は絞り込んだ全件との内積（brute force）で求めておく
+            saved = vector_store.FILTER_BRUTE_FORCE
+            vector_store.FILTER_BRUTE_FORCE = len(ids)
+            store._filter_cache = vector_store.LRUCache(maxsize=64, ttl=300.0)
+            truth = [
+                [path for path, _, _, _ in store.search(q, k=args.k, search_filter=search_filter)]
+                for q in queries
+            ]
+            vector_store.FILTER_BRUTE_FORCE = saved
+
+            for method in ("post", "pre", "cached"):
+                latencies, recalls = [], []
+                for query, expected in zip(queries, truth):
+                    if method == "pre":
+                        store._filter_cache = vector_store.LRUCache(maxsize=64, ttl=300.0)
+                    start = time.perf_counter()
+                    if method == "post":
+                        results = store.search(query, k=args.k * args.overfetch)
+                        found = [r[0] for r in results if tag(selectivity) in (r[2] or "")]
+                        found = found[: args.k]
+                    else:
+                        results = store.search(query, k=args.k, search_filter=search_filter)
+                        found = [r[0] for r in results]
+                    latencies.append(time.perf_counter() - start)
+                    recalls.append(recall(found, expected))
+                print(
+                    f"{selectivity:>11} {len(ids):>8,d}  {method:<7} "
+                    f"{np.mean(recalls):>9.3f} {percentile(latencies, 50):>8.2f} "
+                    f"{percentile(latencies, 99):>8.2f}"
+                )
+        store.close()
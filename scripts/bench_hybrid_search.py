@@ -0,0 +1,129 @@
+"""Hybrid (FAISS + FTS5) debate search latency at 100k boards.
+
+    python -m scripts.bench_hybrid_search --boards 100000
+    python -m scripts.bench_hybrid_search --boards 100000 --dimension 1024
+    python -m scripts.bench_hybrid_search --boards 100000 --vectors-per-board 6
+
+Builds a throwaway store with one image (OCR entities, description and
+``--vectors-per-board`` random vectors, like the description chunks and entity
+list of a dense board) per board, then times the vector search, the BM25 + RRF fusion
+(``VectorStore.score_debates``) and both together for random queries.
+Mistral / Stella are not involved; query vectors are random.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from src.domain.index_factory import needs_rebuild
+from src.domain.vector_store import VectorStore, vector_id
+
+
+def vocabulary(size: int, rng: np.random.Generator) -> list:
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    return [
+        "".join(rng.choice(letters, rng.integers(4, 10))) for _ in range(size)
+    ]
+
+
+def populate(
+    store: VectorStore,
+    n_boards: int,
+    words: list,
+    rng: np.random.Generator,
+    vectors_per_board: int = 1,
+):
+    def text(n):
+        return " ".join(words[i] for i in rng.zipf(1.3, n) % len(words))
+
+    batch = 10_000
+    for start in range(0, n_boards, batch):
+        size = min(batch, n_boards - start)
+        with store.db.write() as cursor:
+            cursor.executemany(
+                "INSERT INTO debate (tldr, summary) VALUES (?, ?)",
+                [(text(4), text(20)) for _ in range(size)],
+            )
+            first_id = cursor.lastrowid - size + 1
+            cursor.executemany(
+                """
+                INSERT INTO image (debate_id, image_path, ocr, description, has_vector)
+                VALUES (?, ?, ?, ?, 1)
+            """,
+                [
+                    (debate_id, f"static/uploads/{debate_id}.jpg", text(5), text(25))
+                    for debate_id in range(first_id, first_id + size)
+                ],
+            )
+            image_ids = range(cursor.lastrowid - size + 1, cursor.lastrowid + 1)
+        ids = [
+            vector_id(image_id, slot)
+            for image_id in image_ids
+            for slot in range(vectors_per_board)
+        ]
+        vectors = rng.standard_normal((len(ids), store.dimension), dtype=np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        store.persistence.add(ids, vectors)
+        print(f"  {start + size:,d} boards")
+
+    # 本番と同じく規模に応じた ANN バックエンドに移行してから測る
+    kind = needs_rebuild(store.index, store.index_config)
+    if kind is not None:
+        store._rebuild_index(kind)
+
+
+def percentiles(latencies: list) -> str:
+    latencies = np.array(latencies) * 1000
+    return (
+        f"p50={np.percentile(latencies, 50):7.2f} ms  "
+        f"p99={np.percentile(latencies, 99):7.2f} ms"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--boards", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--vectors-per-board", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    words = vocabulary(20_000, rng)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(
+            dimension=args.dimension,
+            db_path=str(Path(tmp) / "vectors.db"),
+            debate_index=False,
+        )
+        start = time.perf_counter()
+        populate(store, args.boards, words, rng, args.vectors_per_board)
+        print(
+            f"Built {args.boards:,d} boards ({store.index.ntotal:,d} vectors) "
+            f"in {time.perf_counter() - start:.1f} s"
+        )
+
+        vector_latencies, fusion_latencies, total_latencies = [], [], []
+        for _ in range(args.queries):
+            query = " ".join(words[i] for i in rng.zipf(1.3, 2) % len(words))
+            query_vector = rng.standard_normal(args.dimension, dtype=np.float32)
+
+            start = time.perf_counter()
+            results = store.search(query_vector, k=args.k)
+            middle = time.perf_counter()
+            store.score_debates(query, results)
+            end = time.perf_counter()
+
+            vector_latencies.append(middle - start)
+            fusion_latencies.append(end - middle)
+            total_latencies.append(end - start)
+
+        print(f"vector search : {percentiles(vector_latencies)}")
+        print(f"FTS5 + fusion : {percentiles(fusion_latencies)}")
+        print(f"hybrid total  : {percentiles(total_latencies)}")
+        store.close()
@@ -0,0 +1,87 @@
+"""Vision payload size and ingest time with and without image preprocessing.
+
+    python -m scripts.bench_image_preprocess src/static/uploads
+    python -m scripts.bench_image_preprocess src/static/uploads --call-mistral
+
+For every image in the directory, compares the base64 data URL of the original
+upload with the preprocessed derivative (size, preprocessing time cold and
+from the cache). With ``--call-mistral`` it also times ``get_image_info`` end
+to end both ways (needs MISTRAL_API_KEY; each image is sent twice).
+"""
+
+import argparse
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from src.image_preprocess import ImagePreprocessor
+
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif"}
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main(directory: Path, image_format: str, call_mistral: bool):
+    paths = sorted(p for p in directory.iterdir() if p.suffix.lower() in EXTENSIONS)
+    if not paths:
+        print(f"No images in {directory}")
+        return
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        raw = ImagePreprocessor(cache_dir=None, enabled=False)
+        prep = ImagePreprocessor(cache_dir=Path(cache_dir), image_format=image_format)
+
+        raw_sizes, prep_sizes, cold_ms, warm_ms = [], [], [], []
+        for path in paths:
+            raw_sizes.append(len(raw.to_data_url(str(path))))
+
+            start = time.perf_counter()
+            url = prep.to_data_url(str(path))
+            cold_ms.append((time.perf_counter() - start) * 1000)
+            prep_sizes.append(len(url))
+
+            start = time.perf_counter()
+            prep.to_data_url(str(path))
+            warm_ms.append((time.perf_counter() - start) * 1000)
+
+        print(f"{len(paths)} images, format={image_format}")
+        print(
+            f"payload   original mean={statistics.mean(raw_sizes) / 1024:8.0f} KiB  "
+            f"preprocessed mean={statistics.mean(prep_sizes) / 1024:8.0f} KiB  "
+            f"({sum(prep_sizes) / sum(raw_sizes):.0%} of original)"
+        )
+        print(
+            f"preprocess cold p50={percentile(cold_ms, 0.5):6.1f} ms  "
+            f"p95={percentile(cold_ms, 0.95):6.1f} ms  "
+            f"cached p50={percentile(warm_ms, 0.5):6.2f} ms"
+        )
+
+        if call_mistral:
+            from src.mistralai_api import MistralModel
+
+            model = MistralModel()
+            for label, preprocessor in (("original", raw), ("preprocessed", prep)):
+                model.preprocessor = preprocessor
+                seconds = []
+                for path in paths:
+                    start = time.perf_counter()
+                    model.get_image_info(str(path))
+                    seconds.append(time.perf_counter() - start)
+                print(
+                    f"ingest {label:>12}  p50={percentile(seconds, 0.5):5.2f} s  "
+                    f"p95={percentile(seconds, 0.95):5.2f} s"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--format", choices=["jpeg", "webp"], default="jpeg")
+    parser.add_argument("--call-mistral", action="store_true")
+    args = parser.parse_args()
+
+    main(args.directory, args.format, args.call_mistral)
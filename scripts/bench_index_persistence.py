@@ -0,0 +1,65 @@
+"""Insert latency benchmark for the FAISS write-ahead log persistence.
+
+    python -m scripts.bench_index_persistence --total 100000
+    python -m scripts.bench_index_persistence --total 20000 --full-write
+
+Reports the mean / p99 latency of single-vector inserts around each checkpoint
+(1k, 10k, 100k, ...). With ``--full-write`` the old behaviour (``faiss.write_index``
+after every insert) is measured as a baseline.
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from src.domain.index_persistence import IndexPersistence
+
+
+def run(total: int, dimension: int, window: int, full_write: bool):
+    checkpoints = [n for n in (1_000, 10_000, 100_000, 1_000_000) if n <= total]
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index_path = Path(tmp) / "vectors.faiss"
+        persistence = IndexPersistence(index_path, dimension)
+        index = persistence.load(faiss.IndexIDMap2(faiss.IndexFlatIP(dimension)))
+
+        latencies = []
+        for i in range(total):
+            vector = rng.standard_normal((1, dimension), dtype=np.float32)
+            vector /= np.linalg.norm(vector, axis=1, keepdims=True)
+
+            start = time.perf_counter()
+            if full_write:
+                with persistence.lock:
+                    index.add_with_ids(vector, np.array([i], dtype=np.int64))
+                faiss.write_index(index, str(index_path))
+            else:
+                persistence.add([i], vector)
+            latencies.append(time.perf_counter() - start)
+
+            if i + 1 in checkpoints:
+                recent = np.array(latencies[-window:]) * 1000
+                print(
+                    f"n={i + 1:>9,d}  mean={recent.mean():8.3f} ms  "
+                    f"p99={np.percentile(recent, 99):8.3f} ms"
+                )
+
+        start = time.perf_counter()
+        persistence.close()
+        print(f"final snapshot: {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--total", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=1024)
+    parser.add_argument("--window", type=int, default=500)
+    parser.add_argument("--full-write", action="store_true")
+    args = parser.parse_args()
+
+    run(args.total, args.dimension, args.window, args.full_write)
@@ -0,0 +1,104 @@
+"""Memory, latency and recall@k of truncated / quantized indexes vs 1024-d float.
+
+    python -m scripts.bench_quantized_index --from-index vectors.faiss
+    python -m scripts.bench_quantized_index --n 50000
+
+Stella is Matryoshka-trained, so a ``<model>@<dim>`` embedding is the first
+``dim`` components of the full one, renormalized. The truncated corpora are
+therefore derived from the stored 1024-d vectors without re-running the model.
+Ground truth is the exact top-k of the 1024-d flat index. With
+``--from-index``, held-out stored vectors are used as queries; otherwise the
+vectors are synthetic clustered unit vectors (which, unlike real embeddings,
+do not concentrate information in the leading dimensions).
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from scripts.bench_ann_backends import synthetic
+from src.domain.index_factory import (
+    IndexConfig,
+    build_index,
+    reconstruct_all,
+    search_parameters,
+)
+
+
+def truncate(vectors: np.ndarray, dimension: int) -> np.ndarray:
+    out = np.ascontiguousarray(vectors[:, :dimension])
+    out /= np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+    return out
+
+
+def measure(index, queries, k, params, truth):
+    latencies = []
+    found = []
+    for query in queries:
+        start = time.perf_counter()
+        _, ids = index.search(query[None, :], k, params=params)
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append(ids[0])
+    recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth.tolist())])
+    return recall, np.percentile(latencies, 50), np.percentile(latencies, 99)
+
+
+def run(data, queries, k, dimensions, k_factors):
+    ids = np.arange(len(data), dtype=np.int64)
+    config = IndexConfig()
+
+    baseline = build_index("flat", data.shape[1], config)
+    baseline.add_with_ids(data, ids)
+    _, truth = baseline.search(queries, k)
+
+    print(
+        f"{'dim':>5} {'kind':<7} {'k_factor':>8} {'bytes/vec':>10} "
+        f"{'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8}"
+    )
+    for dimension in dimensions:
+        corpus = truncate(data, dimension)
+        corpus_queries = truncate(queries, dimension)
+        for kind in ("flat", "sq8", "binary"):
+            index = build_index(kind, dimension, config, corpus)
+            index.add_with_ids(corpus, ids)
+            # ID マップ（8 bytes / vector）も含めたスナップショットの大きさ
+            size = len(faiss.serialize_index(index)) / len(data)
+            for k_factor in k_factors if kind != "flat" else [None]:
+                if k_factor is not None:
+                    config.rerank_k_factor = k_factor
+                params = search_parameters(index, config)
+                recall, p50, p99 = measure(index, corpus_queries, k, params, truth)
+                print(
+                    f"{dimension:>5} {kind:<7} {k_factor or '-':>8} {size:>10.0f} "
+                    f"{recall:>10.3f} {p50:>8.3f} {p99:>8.3f}"
+                )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--n", type=int, default=50_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--dimensions", type=int, nargs="+", default=[1024, 768, 512, 256])
+    parser.add_argument("--k-factors", type=int, nargs="+", default=[2, 4, 8, 16])
+    parser.add_argument("--from-index", type=str, default=None)
+    args = parser.parse_args()
+
+    if args.from_index:
+        _, vectors = reconstruct_all(faiss.read_index(args.from_index))
+        rng = np.random.default_rng(0)
+        order = rng.permutation(len(vectors))
+        data = vectors[order[args.queries :]]
+        queries = vectors[order[: args.queries]]
+    else:
+        data, queries = synthetic(args.n, max(args.dimensions), args.queries)
+
+    run(
+        np.ascontiguousarray(data, dtype=np.float32),
+        np.ascontiguousarray(queries, dtype=np.float32),
+        args.k,
+        args.dimensions,
+        args.k_factors,
+    )
@@ -0,0 +1,95 @@
+"""Throughput of batched multi-query search vs. one search per query.
+
+    python -m scripts.bench_search_batch --boards 100000
+    python -m scripts.bench_search_batch --boards 100000 --model dunzhang/stella_en_400M_v5@256
+
+Builds a throwaway store of clustered synthetic vectors and answers the same
+queries with ``VectorStore.search`` one at a time ("sequential") and with
+``VectorStore.search_many`` in batches of 8 / 32 / 64 ("batched"), which is
+what /api/search/batch does after translating. With ``--model``, the query
+texts are also embedded, with one ``embed_text`` per query vs. one
+``embed_batch`` per batch. Mistral translation is not involved (it is cached
+for saved searches).
+"""
+
+import argparse
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from scripts.bench_ann_backends import synthetic
+from scripts.bench_filtered_search import populate
+from src.domain.vector_store import VectorStore
+from src.model_registry import load_embedder, split_model_name
+
+BATCH_SIZES = [8, 32, 64]
+TEXTS = [
+    "contrastive learning with a momentum encoder",
+    "whiteboard about transformer attention and positional encodings",
+    "SimCLR vs MoCo comparison",
+    "derivation of the InfoNCE loss",
+    "diagram of a diffusion model sampling loop",
+    "meeting notes on dataset collection schedule",
+]
+
+
+def run(store, queries, texts, embedder, batch_size, k) -> float:
+    """Queries per second; batch_size 0 means one search per query"""
+    start = time.perf_counter()
+    if batch_size == 0:
+        for i, query in enumerate(queries):
+            if embedder is not None:
+                query = embedder.embed_text(texts[i])
+            store.search(query, k=k)
+    else:
+        for begin in range(0, len(queries), batch_size):
+            batch = queries[begin : begin + batch_size]
+            if embedder is not None:
+                batch = embedder.embed_batch(texts[begin : begin + batch_size])
+            store.search_many(batch, k=k)
+    return len(queries) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--boards", type=int, default=100_000)
+    parser.add_argument("--dimension", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=256)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--model", default=None)
+    args = parser.parse_args()
+
+    embedder = None
+    dimension = args.dimension
+    if args.model is not None:
+        embedder = load_embedder(args.model)
+        dimension = split_model_name(args.model)[1] or 1024
+        embedder.embed_text("warm up")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(
+            dimension=dimension,
+            db_path=str(Path(tmp) / "vectors.db"),
+            debate_index=False,
+        )
+        vectors, queries = synthetic(args.boards, dimension, args.queries)
+        populate(store, vectors, np.random.default_rng(0))
+        texts = [f"{TEXTS[i % len(TEXTS)]} #{i}" for i in range(args.queries)]
+        print(f"{args.boards:,d} boards in a {type(store.index).__name__} index")
+
+        # 順位が 1 件ずつの検索と一致することを確かめておく（スコアは丸め誤差程度ずれうる）
+        single = [[r[0] for r in store.search(query, k=args.k)] for query in queries]
+        many = [[r[0] for r in found] for found in store.search_many(queries, k=args.k)]
+        assert many == single
+
+        sequential = run(store, queries, texts, embedder, 0, args.k)
+        print(f"sequential      {sequential:8.1f} queries/s")
+        for batch_size in BATCH_SIZES:
+            batched = run(store, queries, texts, embedder, batch_size, args.k)
+            print(
+                f"batched ({batch_size:>2})    {batched:8.1f} queries/s  "
+                f"x{batched / sequential:.2f}"
+            )
+        store.close()
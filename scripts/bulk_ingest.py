@@ -0,0 +1,292 @@
+"""Import a folder of whiteboard photos without going through /api/add.
+
+    python -m scripts.bulk_ingest ~/whiteboards --group-by folder
+    python -m scripts.bulk_ingest ~/whiteboards --group-by time --gap-minutes 90
+
+Images are grouped into debates by their folder or by when they were taken
+(a new debate starts after ``--gap-minutes`` without photos). Descriptions
+are fetched from Mistral with bounded concurrency and a request-rate cap.
+429 / 5xx responses are retried with backoff. The descriptions (whole and
+in chunks) and entity lists are then embedded in batches with Stella, and each batch is written with one SQLite
+transaction and one FAISS add.
+
+The import can be resumed: images whose content is already indexed are
+skipped, and the debate created for each group is remembered in
+``--state``. Stop the server while importing, since both processes would
+write the FAISS index.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from PIL import Image
+
+from src.concurrency import run_in_stage
+from src.domain.vector_store import VectorStore
+from src.image_segments import image_segments
+from src.model_registry import registry
+from src.upload_storage import (
+    UPLOAD_CHUNK_SIZE,
+    UPLOADS_DIR,
+    store_upload,
+    upload_url_path,
+)
+
+EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic"}
+
+# EXIF の DateTimeOriginal（Exif IFD）と DateTime（IFD0）
+_EXIF_IFD = 0x8769
+_DATETIME_ORIGINAL = 0x9003
+_DATETIME = 0x0132
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(UPLOAD_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def store_file(path: Path):
+    """Copy the image into the uploads directory under its content hash"""
+    with open(path, "rb") as f:
+        return store_upload(f, UPLOADS_DIR, path.name)
+
+
+def taken_at(path: Path) -> datetime:
+    """When the photo was taken (EXIF), falling back to the file's mtime"""
+    try:
+        with Image.open(path) as image:
+            exif = image.getexif()
+            value = exif.get_ifd(_EXIF_IFD).get(_DATETIME_ORIGINAL) or exif.get(_DATETIME)
+        if value:
+            return datetime.strptime(value, "%Y:%m:%d %H:%M:%S")
+    except Exception:
+        pass
+    return datetime.fromtimestamp(path.stat().st_mtime)
+
+
+def group_images(
+    root: Path, group_by: str, gap_minutes: float
+) -> Dict[str, List[Path]]:
+    """Group key -> images, in the order they were taken"""
+    paths = sorted(
+        p for p in root.rglob("*") if p.is_file() and p.suffix.lower() in EXTENSIONS
+    )
+    groups: Dict[str, List[Path]] = {}
+    if group_by == "folder":
+        for path in paths:
+            key = str(path.parent.relative_to(root)) if path.parent != root else root.name
+            groups.setdefault(key, []).append(path)
+        return groups
+
+    dated = sorted((taken_at(path), path) for path in paths)
+    key, previous = None, None
+    for when, path in dated:
+        if previous is None or (when - previous).total_seconds() > gap_minutes * 60:
+            key = when.strftime("%Y-%m-%d %H:%M")
+        groups.setdefault(key, []).append(path)
+        previous = when
+    return groups
+
+
+class RateLimiter:
+    """At most ``rate`` calls per second, spaced evenly"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def is_retryable(error: Exception) -> bool:
+    status = getattr(error, "status_code", None)
+    if status is None:
+        return "429" in str(error) or "rate limit" in str(error).lower()
+    return status == 429 or status >= 500
+
+
+class BulkIngest:
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        state_path: Path,
+        concurrency: int,
+        rate: float,
+        batch_size: int,
+        max_retries: int = 6,
+    ):
+        self.vector_store = vector_store
+        self.state_path = state_path
+        self.state = json.loads(state_path.read_text()) if state_path.exists() else {}
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rate_limiter = RateLimiter(rate)
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+
+        self.indexed = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def debate_for(self, key: str, root: Path) -> int:
+        """Debate of a group, created on first use and remembered in the state file"""
+        debate_id = self.state.get(key)
+        if debate_id is not None and self.vector_store.debate_exists(debate_id):
+            return debate_id
+        debate_id = self.vector_store.add_debate(key, f"Imported from {root / key}")
+        self.state[key] = debate_id
+        self.state_path.write_text(json.dumps(self.state, indent=2))
+        return debate_id
+
+    async def describe(self, processing_path: str):
+        """Mistral image description with rate limiting and retry on 429 / 5xx"""
+        mistral = registry.get("mistral")
+        for attempt in range(self.max_retries):
+            async with self.semaphore:
+                await self.rate_limiter.wait()
+                try:
+                    return await mistral.aget_image_info(processing_path)
+                except Exception as e:
+                    if not is_retryable(e) or attempt == self.max_retries - 1:
+                        raise
+                    error = e
+            delay = min(60.0, 2.0 * 2**attempt) * random.uniform(0.5, 1.0)
+            print(f"Retrying {processing_path} in {delay:.1f} s ({error})")
+            await asyncio.sleep(delay)
+
+    async def process(self, debate_id: int, path: Path, content_hash: str):
+        stored = await asyncio.to_thread(store_file, path)
+        db_path = upload_url_path(stored.path)
+        image_info = await self.describe(str(stored.path))
+        return debate_id, db_path, image_info, content_hash
+
+    def commit(self, batch: List[tuple]):
+        """Embed the segments of a batch of images and store it in one transaction"""
+        stella = registry.get("stella")
+        segments = [
+            image_segments(
+                info.english_plain_text_description, info.english_named_entity_list
+            )
+            for _, _, info, _ in batch
+        ]
+        vectors = stella.embed_batch(
+            [text for image in segments for _, text in image]
+        )
+        self.vector_store.add_images(
+            [
+                (
+                    debate_id,
+                    db_path,
+                    ", ".join(info.english_named_entity_list),
+                    info.english_plain_text_description,
+                    content_hash,
+                )
+                for debate_id, db_path, info, content_hash in batch
+            ],
+            vectors,
+            segments,
+        )
+        self.indexed += len(batch)
+
+    async def run(self, root: Path, groups: Dict[str, List[Path]]):
+        jobs: List[Tuple[str, Path, str]] = []
+        for key, paths in groups.items():
+            hashes = [file_hash(path) for path in paths]
+            done = self.vector_store.get_indexed_content_hashes(hashes)
+            pending = [(key, p, h) for p, h in zip(paths, hashes) if h not in done]
+            self.skipped += len(paths) - len(pending)
+            jobs.extend(pending)
+        print(f"{len(jobs)} images to import, {self.skipped} already indexed")
+        if not jobs:
+            return
+
+        debate_ids = {key: self.debate_for(key, root) for key, _, _ in jobs}
+        start = time.perf_counter()
+        tasks = [
+            asyncio.create_task(self.process(debate_ids[key], path, content_hash))
+            for key, path, content_hash in jobs
+        ]
+
+        batch = []
+        for task in asyncio.as_completed(tasks):
+            try:
+                batch.append(await task)
+            except Exception as e:
+                self.failed += 1
+                print(f"Error describing image: {str(e)}")
+                continue
+            if len(batch) >= self.batch_size:
+                await run_in_stage("embed", self.commit, batch)
+                batch = []
+                elapsed = time.perf_counter() - start
+                print(
+                    f"{self.indexed}/{len(jobs)} indexed "
+                    f"({self.indexed / elapsed:.2f} images/s, {self.failed} failed)"
+                )
+        if batch:
+            await run_in_stage("embed", self.commit, batch)
+
+        elapsed = time.perf_counter() - start
+        print(
+            f"Indexed {self.indexed} images in {elapsed:.1f} s "
+            f"({self.indexed / elapsed:.2f} images/s), "
+            f"{self.skipped} skipped, {self.failed} failed (re-run to retry them)"
+        )
+
+
+async def main(args):
+    root = args.directory.resolve()
+    groups = group_images(root, args.group_by, args.gap_minutes)
+    print(f"Found {sum(len(p) for p in groups.values())} images in {len(groups)} groups")
+    if args.dry_run:
+        for key, paths in groups.items():
+            print(f"  {key}: {len(paths)} images")
+        return
+
+    UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+    # index_meta の埋め込みモデルが登録されてから読み込む
+    vector_store = VectorStore(dimension=1024, db_path=args.db)
+    registry.preload(["stella"])
+    try:
+        ingest = BulkIngest(
+            vector_store,
+            args.state,
+            concurrency=args.concurrency,
+            rate=args.rate,
+            batch_size=args.batch_size,
+        )
+        await ingest.run(root, groups)
+    finally:
+        vector_store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--group-by", choices=["folder", "time"], default="folder")
+    parser.add_argument("--gap-minutes", type=float, default=120.0)
+    parser.add_argument("--concurrency", type=int, default=4, help="Mistral requests in flight")
+    parser.add_argument("--rate", type=float, default=2.0, help="Mistral requests per second")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--db", default="vectors.db")
+    parser.add_argument("--state", type=Path, default=Path("bulk_ingest_state.json"))
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    asyncio.run(main(args))
@@ -0,0 +1,92 @@
+"""Check that an accelerated embedding backend matches the PyTorch output.
+
+    python -m scripts.check_embedder_parity --backend onnx-int8
+    python -m scripts.check_embedder_parity --backend torch-int8 --db vectors.db
+
+Embeds short search queries and long board descriptions (from ``--db`` if
+it has any, otherwise built-in samples) with the ``torch`` backend and with
+``--backend``. It reports the cosine similarity per text group and exits
+with status 1 if any text is below ``--threshold``. Run it after changing
+``WR_EMBED_BACKEND`` or re-exporting the ONNX model.
+"""
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+from typing import List
+
+import numpy as np
+
+from scripts.bench_embedder_batching import QUERIES
+from src.model_registry import EMBED_BACKENDS, STELLA_MODEL_NAME, load_embedder
+
+DESCRIPTIONS = [
+    "The whiteboard contains detailed notes and diagrams related to machine learning "
+    "concepts, specifically focusing on adaptive soft contrastive learning. The board "
+    "includes diagrams illustrating processes and relationships between different "
+    "components such as cosine similarity, softmax, and entropy. There are references "
+    "to models like ViLBERT and methods like MLM (Masked Language Modeling), together "
+    "with mathematical expressions explaining the adaptive soft labeling process.",
+    "A project planning board with a timeline for dataset collection, annotation and "
+    "model training. Milestones are marked for each week, with owners written next to "
+    "each task and a list of open questions about labeling guidelines, storage costs "
+    "and the evaluation protocol at the bottom right.",
+    "Lecture notes deriving the InfoNCE loss step by step, starting from the mutual "
+    "information lower bound, with a sketch of positive and negative pairs, the "
+    "temperature parameter and a comparison of batch sizes used by SimCLR and MoCo.",
+]
+
+
+def descriptions(db_path: str, limit: int) -> List[str]:
+    """Stored board descriptions, falling back to the built-in samples"""
+    if Path(db_path).exists():
+        with sqlite3.connect(db_path) as connection:
+            rows = connection.execute(
+                "SELECT description FROM image WHERE description != '' LIMIT ?",
+                (limit,),
+            ).fetchall()
+        if rows:
+            return [row[0] for row in rows]
+    return DESCRIPTIONS
+
+
+def cosine(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--backend", choices=[b for b in EMBED_BACKENDS if b != "torch"], required=True
+    )
+    parser.add_argument("--model", default=STELLA_MODEL_NAME)
+    parser.add_argument("--db", default="vectors.db")
+    parser.add_argument("--limit", type=int, default=64)
+    parser.add_argument("--threshold", type=float, default=0.99)
+    args = parser.parse_args()
+
+    groups = {
+        "queries": QUERIES,
+        "descriptions": descriptions(args.db, args.limit),
+    }
+    reference = load_embedder(args.model, backend="torch")
+    expected = {name: reference.embed_batch(texts) for name, texts in groups.items()}
+    del reference
+    candidate = load_embedder(args.model, backend=args.backend)
+
+    failed = 0
+    for name, texts in groups.items():
+        similarity = cosine(expected[name], candidate.embed_batch(texts))
+        failed += int((similarity < args.threshold).sum())
+        print(
+            f"{name:<13} n={len(texts):<4} min cosine={similarity.min():.4f}  "
+            f"mean={similarity.mean():.4f}"
+        )
+
+    if failed:
+        print(f"FAIL: {failed} texts below cosine {args.threshold} ({args.backend})")
+        sys.exit(1)
+    print(f"OK: {args.backend} matches torch (cosine >= {args.threshold})")
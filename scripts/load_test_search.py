@@ -0,0 +1,89 @@
+"""Search latency while uploads are in flight, against a running server.
+
+    uvicorn app:app --port 8000
+    python -m scripts.load_test_search --image images/IMG_0569.jpg --uploads 10
+
+Starts ``--uploads`` concurrent /api/add requests and keeps issuing
+/api/search-debates requests until they finish, then prints p50/p99 search
+latency. Run it once with ``--uploads 0`` for the idle baseline.
+"""
+
+import argparse
+import json
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+
+def post_multipart(url: str, field: str, path: Path) -> dict:
+    boundary = uuid.uuid4().hex
+    body = (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{field}"; filename="{path.name}"\r\n'
+        "Content-Type: application/octet-stream\r\n\r\n"
+    ).encode() + path.read_bytes() + f"\r\n--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        url,
+        data=body,
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def create_debate(base_url: str) -> int:
+    request = urllib.request.Request(
+        f"{base_url}/api/debate",
+        data=json.dumps({"tldr": "load test", "summary": ""}).encode(),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read())["debate_id"]
+
+
+def run(base_url: str, image: Path, uploads: int, query: str, min_searches: int):
+    debate_id = create_debate(base_url)
+    upload_url = f"{base_url}/api/add?debate_id={debate_id}"
+
+    upload_threads = [
+        threading.Thread(target=post_multipart, args=(upload_url, "file", image))
+        for _ in range(uploads)
+    ]
+    for thread in upload_threads:
+        thread.start()
+
+    search_url = f"{base_url}/api/search-debates?" + urllib.parse.urlencode(
+        {"query": query}
+    )
+    latencies = []
+    while any(t.is_alive() for t in upload_threads) or len(latencies) < min_searches:
+        start = time.perf_counter()
+        with urllib.request.urlopen(search_url, timeout=600) as response:
+            response.read()
+        latencies.append(time.perf_counter() - start)
+
+    for thread in upload_threads:
+        thread.join()
+
+    latencies = np.array(latencies) * 1000
+    print(f"uploads in flight: {uploads}, searches: {len(latencies)}")
+    print(f"p50={np.percentile(latencies, 50):.1f} ms  p99={np.percentile(latencies, 99):.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--image", type=Path, required=True)
+    parser.add_argument("--uploads", type=int, default=10)
+    parser.add_argument("--query", default="contrastive learning")
+    parser.add_argument("--min-searches", type=int, default=20)
+    args = parser.parse_args()
+
+    run(args.base_url, args.image, args.uploads, args.query, args.min_searches)
@@ -0,0 +1,34 @@
+"""Cold start time and peak RSS of the server process.
+
+    python -m scripts.measure_startup
+
+Measures, in a fresh interpreter, how long ``import app`` takes, how long
+until the embedding model is ready, and the peak RSS after a query has been
+embedded. Run it on two checkouts to compare before/after.
+"""
+
+import json
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter() - start
+from src.model_registry import registry
+registry.get("stella")
+app.vector_store.processer.stella.embed_text("warm up")
+ready = time.perf_counter() - start
+peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({"import_seconds": imported, "ready_seconds": ready, "peak_rss_mb": peak_kb / 1024}))
+"""
+
+if __name__ == "__main__":
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    print(f"import app:      {result['import_seconds']:.2f} s")
+    print(f"model ready:     {result['ready_seconds']:.2f} s")
+    print(f"peak RSS:        {result['peak_rss_mb']:.0f} MB")
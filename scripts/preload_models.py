@@ -0,0 +1,24 @@
+"""Download the embedding model into a local cache directory.
+
+    python -m scripts.preload_models --cache-dir /models
+
+Start the server with ``WR_MODEL_CACHE_DIR=/models WR_MODEL_OFFLINE=1`` to load
+from that directory without touching the network. With ``WR_EMBED_BACKEND=onnx``
+(or ``onnx-int8``) the ONNX export is written to ``<cache-dir>/onnx`` as well.
+"""
+
+import argparse
+import os
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cache-dir", required=True)
+    args = parser.parse_args()
+
+    os.environ["WR_MODEL_CACHE_DIR"] = args.cache_dir
+    os.environ["WR_MODEL_OFFLINE"] = "0"
+
+    from src.model_registry import registry
+
+    registry.get("stella")
+    print(f"Cached models in {args.cache_dir}")
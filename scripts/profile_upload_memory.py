@@ -0,0 +1,117 @@
+"""Server RSS while many large uploads are in flight, against a running server.
+
+    WR_INGEST_WORKERS=0 uvicorn app:app --port 8000 &
+    python -m scripts.profile_upload_memory --pid $! --uploads 20 --size-mb 10
+
+Sends ``--uploads`` concurrent /api/add requests with random ``--size-mb``
+payloads, or one /api/add/batch request with ``--batch``. Meanwhile it samples
+the server's VmRSS from /proc and prints the baseline, the peak and the
+increase. With WR_INGEST_WORKERS=0 the payloads are only stored and not sent
+to Mistral. Each payload is unique, so delete the debate afterwards to remove
+the files.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import urllib.request
+import uuid
+
+from scripts.load_test_search import create_debate
+
+JPEG_MAGIC = b"\xff\xd8\xff\xe0"
+
+
+def rss_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+def post_files(url: str, field: str, payloads) -> dict:
+    boundary = uuid.uuid4().hex
+    body = bytearray()
+    for n, payload in enumerate(payloads):
+        body += (
+            f"--{boundary}\r\n"
+            f'Content-Disposition: form-data; name="{field}"; filename="upload{n}.jpg"\r\n'
+            "Content-Type: image/jpeg\r\n\r\n"
+        ).encode()
+        body += payload + b"\r\n"
+    body += f"--{boundary}--\r\n".encode()
+    request = urllib.request.Request(
+        url,
+        data=bytes(body),
+        headers={"Content-Type": f"multipart/form-data; boundary={boundary}"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=600) as response:
+        return json.loads(response.read())
+
+
+def main(base_url: str, pid: int, uploads: int, size_mb: int, batch: bool):
+    debate_id = create_debate(base_url)
+    payloads = [
+        JPEG_MAGIC + os.urandom(size_mb * 1024 * 1024 - len(JPEG_MAGIC))
+        for _ in range(uploads)
+    ]
+
+    baseline = rss_mb(pid)
+    samples = [baseline]
+    done = threading.Event()
+
+    def sample():
+        while not done.is_set():
+            samples.append(rss_mb(pid))
+            time.sleep(0.02)
+
+    sampler = threading.Thread(target=sample)
+    sampler.start()
+
+    start = time.perf_counter()
+    if batch:
+        threads = [
+            threading.Thread(
+                target=post_files,
+                args=(f"{base_url}/api/add/batch?debate_id={debate_id}", "files", payloads),
+            )
+        ]
+    else:
+        threads = [
+            threading.Thread(
+                target=post_files,
+                args=(f"{base_url}/api/add?debate_id={debate_id}", "file", [payload]),
+            )
+            for payload in payloads
+        ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    done.set()
+    sampler.join()
+
+    total_mb = uploads * size_mb
+    print(f"{uploads} x {size_mb} MB uploads ({'batch' if batch else 'concurrent'}) in {elapsed:.1f} s")
+    print(f"RSS baseline {baseline:7.1f} MB")
+    print(f"RSS peak     {max(samples):7.1f} MB  (+{max(samples) - baseline:.1f} MB for {total_mb} MB uploaded)")
+    print(f"RSS after    {rss_mb(pid):7.1f} MB")
+    print(f"debate {debate_id} holds the uploaded images")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pid", type=int, required=True)
+    parser.add_argument("--uploads", type=int, default=20)
+    parser.add_argument("--size-mb", type=int, default=10)
+    parser.add_argument("--batch", action="store_true")
+    args = parser.parse_args()
+
+    main(args.base_url, args.pid, args.uploads, args.size_mb, args.batch)
@@ -0,0 +1,42 @@
+"""Re-embed every stored description with another embedding model.
+
+    python -m scripts.reindex_vectors --model dunzhang/stella_en_1.5B_v5
+    WR_INDEX_KIND=sq8 python -m scripts.reindex_vectors --model dunzhang/stella_en_400M_v5@256
+
+Builds a shadow FAISS index from the descriptions saved in the ``image``
+table (the images are not sent to Mistral again) and swaps it in together
+with the per-image ``embedding_model`` and ``index_meta``. The server picks
+up the recorded model at its next start. To switch models without a restart,
+call ``POST /api/reindex?model=...`` on the running server instead.
+
+``<model>@<dim>`` keeps the first ``dim`` dimensions of the (Matryoshka)
+embedding, and ``WR_INDEX_KIND`` selects the index built for the new vectors
+(e.g. ``sq8`` / ``binary`` codes with float re-ranking).
+"""
+
+import argparse
+import time
+
+from src.domain.vector_store import VectorStore
+from src.model_registry import load_embedder
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", required=True)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--db", default="vectors.db")
+    args = parser.parse_args()
+
+    vector_store = VectorStore(db_path=args.db)
+    try:
+        print(
+            f"Current index: {vector_store.embedding_model} ({vector_store.dimension}d), "
+            f"{vector_store.index.ntotal} vectors"
+        )
+        embedder = load_embedder(args.model)
+        start = time.perf_counter()
+        count = vector_store.reindex(embedder, args.model, args.batch_size)
+        elapsed = time.perf_counter() - start
+        print(f"Re-embedded {count} images in {elapsed:.1f} s ({count / elapsed:.1f} images/s)")
+    finally:
+        vector_store.close()
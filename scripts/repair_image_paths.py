@@ -0,0 +1,50 @@
+"""Normalize stored image paths and point moved files at src/static/uploads.
+
+    python -m scripts.repair_image_paths            # dry run
+    python -m scripts.repair_image_paths --apply
+
+/api/debates used to check the filesystem for every row on every request;
+this does the same repair once, offline. Paths lose any 'src/' prefix, and
+a path whose file is missing is rewritten to static/uploads/<basename> if
+the file exists there.
+"""
+
+import argparse
+import os
+
+from src.domain.vector_store import VectorStore
+
+
+def repair(store: VectorStore, apply: bool) -> int:
+    with store.db.read() as cursor:
+        cursor.execute("SELECT id, image_path FROM image")
+        rows = cursor.fetchall()
+
+    fixed = 0
+    for image_id, image_path in rows:
+        normalized = image_path[4:] if image_path.startswith("src/") else image_path
+        if not os.path.exists(f"src/{normalized}"):
+            basename = os.path.basename(normalized)
+            if os.path.exists(f"src/static/uploads/{basename}"):
+                normalized = f"static/uploads/{basename}"
+            else:
+                print(f"WARNING: Image file not found for image {image_id}: {image_path}")
+
+        if normalized != image_path:
+            fixed += 1
+            print(f"Image {image_id}: {image_path} -> {normalized}")
+            if apply:
+                store.update_image_path(image_id, normalized)
+    return fixed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-path", default="vectors.db")
+    parser.add_argument("--apply", action="store_true")
+    args = parser.parse_args()
+
+    store = VectorStore(db_path=args.db_path)
+    fixed = repair(store, args.apply)
+    store.close()
+    print(f"{'Fixed' if args.apply else 'Would fix'} {fixed} image paths")
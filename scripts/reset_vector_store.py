@@ -7,21 +7,43 @@ def reset_vector_store():
     db_path = Path("vectors.db")
     faiss_path = Path("vectors.faiss")
     
-    # Remove SQLite database if it exists
-    if db_path.exists():
-        try:
-            os.remove(db_path)
-            print(f"Removed SQLite database: {db_path}")
-        except Exception as e:
-            print(f"Error removing SQLite database: {e}")
+    # Remove SQLite database (and its WAL-mode files) if it exists
+    for path in (db_path, Path("vectors.db-wal"), Path("vectors.db-shm")):
+        if path.exists():
+            try:
+                os.remove(path)
+                print(f"Removed SQLite database file: {path}")
+            except Exception as e:
+                print(f"Error removing SQLite database file: {e}")
     
-    # Remove FAISS index if it exists
-    if faiss_path.exists():
+    # Remove FAISS index and its write-ahead log if they exist
+    for path in (
+        faiss_path,
+        Path("vectors.faiss.wal"),
+        Path("vectors.faiss.wal.flushing"),
+        Path("vectors.faiss.shadow"),
+        Path("vectors.faiss.tmp"),
+        Path("debates.faiss"),
+        Path("debates.faiss.wal"),
+        Path("debates.faiss.wal.flushing"),
+        Path("debates.faiss.shadow"),
+        Path("debates.faiss.tmp"),
+    ):
+        if path.exists():
+            try:
+                os.remove(path)
+                print(f"Removed FAISS index file: {path}")
+            except Exception as e:
+                print(f"Error removing FAISS index file: {e}")
+
+    # Remove the query cache (translations and query embeddings) as well
+    query_cache_path = Path("query_cache.db")
+    if query_cache_path.exists():
         try:
-            os.remove(faiss_path)
-            print(f"Removed FAISS index: {faiss_path}")
+            os.remove(query_cache_path)
+            print(f"Removed query cache file: {query_cache_path}")
         except Exception as e:
-            print(f"Error removing FAISS index: {e}")
+            print(f"Error removing query cache file: {e}")
     
     print("Vector store reset complete")
 
@@ -0,0 +1,106 @@
+"""Concurrent read/write stress test for the VectorStore SQLite pool.
+
+    python -m scripts.stress_sqlite_pool --writers 4 --readers 16 --seconds 10
+
+Writer threads create debates, add image rows and update debates while
+reader threads run the request-path queries. The run fails (exit code 1) on
+any exception or if the final row counts do not match what the writers
+reported.
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from src.domain.vector_store import VectorStore
+
+
+def writer(store: VectorStore, stop: threading.Event, counts: Counter, errors: list):
+    rng = random.Random()
+    try:
+        while not stop.is_set():
+            debate_id = store.add_debate(f"debate {rng.random():.6f}", "summary")
+            images = rng.randint(1, 3)
+            for i in range(images):
+                store.add_image_record(debate_id, f"static/uploads/{debate_id}_{i}.jpg")
+            store.update_debate(debate_id, f"updated {debate_id}", "summary")
+            counts["debates"] += 1
+            counts["images"] += images
+            counts["writes"] += images + 2
+    except Exception as e:
+        errors.append(e)
+
+
+def reader(store: VectorStore, stop: threading.Event, counts: Counter, errors: list):
+    rng = random.Random()
+    try:
+        while not stop.is_set():
+            latest = store.get_latest_debate_id()
+            if latest:
+                debate_id = rng.randint(1, latest)
+                detail = store.get_debate_detail(debate_id)
+                if detail is not None and detail[4] is not None:
+                    mapping = store.get_debate_ids_for_images([detail[4]])
+                    if mapping.get(detail[4]) != debate_id:
+                        raise AssertionError(f"Inconsistent read for debate {debate_id}")
+            counts["reads"] += 1
+    except Exception as e:
+        errors.append(e)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--pool-size", type=int, default=4)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = VectorStore(
+            db_path=str(Path(tmp) / "vectors.db"), db_readers=args.pool_size
+        )
+        stop = threading.Event()
+        errors = []
+        # スレッドごとに集計して最後に足す（Counter の += はアトミックではない）
+        thread_counts = [Counter() for _ in range(args.writers + args.readers)]
+        threads = [
+            threading.Thread(
+                target=writer if n < args.writers else reader,
+                args=(store, stop, thread_counts[n], errors),
+            )
+            for n in range(args.writers + args.readers)
+        ]
+
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        time.sleep(args.seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        counts = sum(thread_counts, Counter())
+
+        with store.db.read() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM debate")
+            n_debates = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM image")
+            n_images = cursor.fetchone()[0]
+        store.close()
+
+    print(
+        f"writes={counts['writes'] / elapsed:8.1f}/s  reads={counts['reads'] / elapsed:8.1f}/s  "
+        f"debates={n_debates:,d}  images={n_images:,d}  errors={len(errors)}"
+    )
+    for error in errors[:5]:
+        print(f"  {type(error).__name__}: {error}")
+    if errors or (n_debates, n_images) != (counts["debates"], counts["images"]):
+        print("FAILED")
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,68 @@
+"""Warm the query translation / embedding cache from a query log.
+
+    python -m scripts.warm_query_cache queries.txt
+    python -m scripts.warm_query_cache search_log.jsonl --field query
+
+The log is either one query per line or JSON lines with the query under
+``--field``. Queries are processed with bounded concurrency; the most frequent
+queries are warmed first.
+"""
+
+import argparse
+import asyncio
+import json
+from collections import Counter
+from pathlib import Path
+
+from src.model import Processer
+from src.query_cache import QueryCache, normalize_query
+
+
+def read_queries(path: Path, field: str) -> list:
+    counts = Counter()
+    originals = {}
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            line = json.loads(line).get(field, "")
+        key = normalize_query(line)
+        if key:
+            counts[key] += 1
+            originals.setdefault(key, line)
+    return [originals[key] for key, _ in counts.most_common()]
+
+
+async def warm(queries: list, processer: Processer, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    failed = 0
+
+    async def one(query):
+        nonlocal failed
+        async with semaphore:
+            try:
+                await processer.aprocess_instruction(query)
+            except Exception as e:
+                failed += 1
+                print(f"Error warming '{query}': {str(e)}")
+
+    await asyncio.gather(*[one(query) for query in queries])
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("log", type=Path)
+    parser.add_argument("--field", default="query")
+    parser.add_argument("--cache-db", type=Path, default=Path("query_cache.db"))
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    queries = read_queries(args.log, args.field)[: args.limit]
+    processer = Processer(query_cache=QueryCache(args.cache_db))
+    failed = asyncio.run(warm(queries, processer, args.concurrency))
+
+    print(f"Warmed {len(queries) - failed}/{len(queries)} queries")
+    print(json.dumps(processer.query_cache.stats(), indent=2))
@@ -0,0 +1,114 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# CPU バウンドな処理（Stella の encode, FAISS の search）を流す共有スレッドプール
+EXECUTOR_WORKERS = int(os.environ.get("WR_EXECUTOR_WORKERS", "4"))
+
+# ステージごとの同時実行数の上限
+STAGE_LIMITS: Dict[str, int] = {
+    "mistral": int(os.environ.get("WR_MISTRAL_CONCURRENCY", "8")),
+    "preprocess": int(os.environ.get("WR_PREPROCESS_CONCURRENCY", "2")),
+    "embed": int(os.environ.get("WR_EMBED_CONCURRENCY", "2")),
+    "search": int(os.environ.get("WR_SEARCH_CONCURRENCY", "4")),
+}
+
+_executor = ThreadPoolExecutor(
+    max_workers=EXECUTOR_WORKERS, thread_name_prefix="wr-worker"
+)
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+def stage_limit(stage: str) -> asyncio.Semaphore:
+    """Semaphore bounding the number of in-flight calls of a stage"""
+    if stage not in _semaphores:
+        _semaphores[stage] = asyncio.Semaphore(STAGE_LIMITS[stage])
+    return _semaphores[stage]
+
+
+async def run_in_stage(stage: str, fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a blocking function on the shared executor under the stage's limit
+
+    The caller's context variables (the trace ID) are visible in ``fn``.
+    """
+    async with stage_limit(stage):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(
+            _executor, functools.partial(context.run, fn, *args, **kwargs)
+        )
+
+
+class ReadWriteLock:
+    """Shared / exclusive lock for data searched from several threads at once
+
+    ``with lock:`` is exclusive and re-entrant (like ``threading.RLock``);
+    ``with lock.read():`` is shared. A thread holding either side may take
+    ``read()`` again, but a reader must not ask for the exclusive side.
+    Waiting writers block new readers, so a stream of searches cannot starve
+    inserts.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writer: Optional[int] = None
+        self._depth = 0
+        self._waiting_writers = 0
+        self._local = threading.local()
+
+    def acquire(self):
+        me = threading.get_ident()
+        with self._cond:
+            if self._writer == me:
+                self._depth += 1
+                return
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._cond.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = me
+            self._depth = 1
+
+    def release(self):
+        with self._cond:
+            self._depth -= 1
+            if self._depth == 0:
+                self._writer = None
+                self._cond.notify_all()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        # 排他側・共有側を既に持っているスレッドはそのまま入れる
+        if self._writer == threading.get_ident() or getattr(self._local, "reading", False):
+            yield
+            return
+        with self._cond:
+            while self._writer is not None or self._waiting_writers:
+                self._cond.wait()
+            self._readers += 1
+        self._local.reading = True
+        try:
+            yield
+        finally:
+            self._local.reading = False
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
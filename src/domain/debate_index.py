@@ -0,0 +1,474 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+
+from src.domain.index_factory import (
+    IndexConfig,
+    build_index,
+    choose_kind,
+    index_kind,
+    needs_rebuild,
+    search_parameters,
+)
+from src.domain.index_persistence import IndexPersistence
+from src.domain.vector_store import IMAGE_ID_MASK, SEGMENT_SHIFT, vector_id
+from src.metrics import FAISS_SEARCH_SECONDS
+from src.model_registry import registry
+
+logger = logging.getLogger(__name__)
+
+# debate ごとのベクトル: FAISS の ID は画像の index と同じ形（slot << SEGMENT_SHIFT | debate_id）
+DEBATE_ID_MASK = IMAGE_ID_MASK
+CENTROID_SLOT = 0  # 画像の全ベクトルの重心
+TEXT_SLOT = 1  # tldr / summary の埋め込み
+# 最後の変更からこの秒数が経った debate だけを再計算する（連続した編集を 1 回にまとめる）
+DEBOUNCE_SECONDS = float(os.environ.get("WR_DEBATE_DEBOUNCE", "2.0"))
+# SQLite の現在時刻（UNIX 秒、time.time() と比較する）
+_NOW = "((julianday('now') - 2440587.5) * 86400.0)"
+
+
+def debate_vector_id(debate_id: int, slot: int) -> int:
+    return vector_id(debate_id, slot)
+
+
+class DebateIndex:
+    """Per-debate vectors in a second FAISS index (``debates.faiss``)
+
+    Each debate has up to two vectors: the centroid of all its images'
+    vectors and the embedding of its tldr / summary. Triggers
+    queue every debate whose images or text change in
+    ``debate_vector_queue``; a background thread recomputes the queued
+    debates, so writes never wait for the embedder. A debate is only taken
+    ``debounce`` seconds after its last change, and its text is only
+    re-embedded if it differs from the embedded one (hash in
+    ``debate_vector``). Text vectors are computed once the query embedder
+    is loaded.
+    """
+
+    def __init__(
+        self,
+        store,
+        index_path: Path,
+        index_config: IndexConfig,
+        flush_every: int = 1024,
+        flush_interval: float = 30.0,
+        update_interval: float = 5.0,
+        batch_size: int = 256,
+        debounce: float = DEBOUNCE_SECONDS,
+    ):
+        self.store = store
+        self.index_config = index_config
+        self.update_interval = update_interval
+        self.debounce = debounce
+        self.batch_size = batch_size
+        # reset（次元の変更）と更新が同時に走らないようにする
+        self._lock = threading.Lock()
+        # キューが空になるまで（起動時・作り直し中）は 1 段目に使わない
+        self.backfilling = True
+
+        self._create_queue()
+        self.persistence = IndexPersistence(
+            index_path,
+            store.dimension,
+            flush_every=flush_every,
+            flush_interval=flush_interval,
+        )
+        existed = self.persistence.index_path.exists()
+        self.persistence.load(
+            build_index(choose_kind(0, index_config), store.dimension, index_config)
+        )
+        if not existed or self.index.d != store.dimension:
+            self.reset(store.dimension)
+        logger.info(
+            "Loaded debate %s index with %d vectors", index_kind(self.index), self.index.ntotal
+        )
+
+        self._wakeup = threading.Event()
+        self._wakeup.set()  # 起動直後に一度キューを確認する
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._update_loop, name="debate-vectors", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def index(self) -> faiss.Index:
+        return self.persistence.index
+
+    @property
+    def ready(self) -> bool:
+        """Whether the index covers every debate (usable as the first stage)"""
+        return not self.backfilling and self.index.ntotal > 0
+
+    def _create_queue(self):
+        with self.store.db.write() as cursor:
+            cursor.execute("PRAGMA table_info(debate_vector_queue)")
+            columns = {row[1] for row in cursor.fetchall()}
+            if columns and "changed_at" not in columns:
+                cursor.execute(
+                    "ALTER TABLE debate_vector_queue "
+                    "ADD COLUMN changed_at REAL NOT NULL DEFAULT 0"
+                )
+
+        def enqueue(debate_id: str, centroid: int, text: int) -> str:
+            """Trigger statement queueing ``debate_id`` (an SQL expression)"""
+            flags = [("centroid_changed", centroid), ("text_changed", text)]
+            changed = "".join(f"{name} = 1, " for name, flag in flags if flag)
+            return f"""
+                INSERT INTO debate_vector_queue
+                    (debate_id, centroid_changed, text_changed, changed_at)
+                SELECT {debate_id}, {centroid}, {text}, {_NOW}
+                WHERE {debate_id} IS NOT NULL
+                ON CONFLICT (debate_id) DO UPDATE
+                SET {changed}version = version + 1, changed_at = {_NOW};"""
+
+        # トリガーは定義を変えても反映されるように毎回作り直す
+        self.store.db.executescript(
+            f"""
+            -- debate ベクトルの再計算待ち（version は取り出し後に変更されたかの確認用）
+            CREATE TABLE IF NOT EXISTS debate_vector_queue (
+                debate_id INTEGER PRIMARY KEY,
+                centroid_changed INTEGER NOT NULL DEFAULT 0,
+                text_changed INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 1,
+                changed_at REAL NOT NULL DEFAULT 0
+            );
+            -- 埋め込み済みの tldr / summary のハッシュ（同じ内容なら埋め込み直さない）
+            CREATE TABLE IF NOT EXISTS debate_vector (
+                debate_id INTEGER PRIMARY KEY,
+                text_hash TEXT NOT NULL
+            );
+
+            DROP TRIGGER IF EXISTS debate_vector_debate_ai;
+            CREATE TRIGGER debate_vector_debate_ai AFTER INSERT ON debate BEGIN
+                {enqueue("new.id", 0, 1)}
+            END;
+            DROP TRIGGER IF EXISTS debate_vector_debate_au;
+            CREATE TRIGGER debate_vector_debate_au
+            AFTER UPDATE OF tldr, summary ON debate BEGIN
+                {enqueue("new.id", 0, 1)}
+            END;
+            DROP TRIGGER IF EXISTS debate_vector_debate_ad;
+            CREATE TRIGGER debate_vector_debate_ad AFTER DELETE ON debate BEGIN
+                {enqueue("old.id", 1, 1)}
+            END;
+
+            DROP TRIGGER IF EXISTS debate_vector_image_ai;
+            CREATE TRIGGER debate_vector_image_ai AFTER INSERT ON image
+            WHEN new.has_vector = 1 BEGIN
+                {enqueue("new.debate_id", 1, 0)}
+            END;
+            -- attach_vector は has_vector = 1 を書き直す（ベクトルが置き換わった）
+            DROP TRIGGER IF EXISTS debate_vector_image_au;
+            CREATE TRIGGER debate_vector_image_au
+            AFTER UPDATE OF has_vector, debate_id ON image BEGIN
+                {enqueue("new.debate_id", 1, 0)}
+                {enqueue("old.debate_id", 1, 0)}
+            END;
+            DROP TRIGGER IF EXISTS debate_vector_image_ad;
+            CREATE TRIGGER debate_vector_image_ad AFTER DELETE ON image
+            WHEN old.has_vector = 1 BEGIN
+                {enqueue("old.debate_id", 1, 0)}
+            END;
+        """
+        )
+
+    def reset(self, dimension: int):
+        """Start over with an empty index of ``dimension`` and queue every debate
+
+        Used for databases created before the debate index existed and after
+        ``VectorStore.reindex`` switched the embedding model.
+        """
+        with self._lock:
+            self.backfilling = True
+            self.persistence.swap(
+                build_index(
+                    choose_kind(0, self.index_config), dimension, self.index_config
+                )
+            )
+            with self.store.db.write() as cursor:
+                # 新しいモデルでは全てのテキストを埋め込み直す
+                cursor.execute("DELETE FROM debate_vector")
+                # changed_at = 0: 作り直しは debounce を待たない
+                cursor.execute(
+                    """
+                    INSERT INTO debate_vector_queue
+                        (debate_id, centroid_changed, text_changed, changed_at)
+                    SELECT id, 1, 1, 0 FROM debate WHERE true
+                    ON CONFLICT (debate_id) DO UPDATE
+                    SET centroid_changed = 1, text_changed = 1, version = version + 1,
+                        changed_at = 0
+                """
+                )
+                logger.info("Queued %d debates for the debate index", cursor.rowcount)
+
+    def queue_depth(self) -> int:
+        """Debates waiting in debate_vector_queue"""
+        with self.store.db.read() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM debate_vector_queue")
+            return cursor.fetchone()[0]
+
+    def notify(self):
+        """Wake the background thread after a write (it also polls the queue)"""
+        self._wakeup.set()
+
+    def _update_loop(self):
+        delay = self.update_interval
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=delay)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            try:
+                while self.update() > 0 and not self._stopped.is_set():
+                    pass
+                delay = self._next_delay()
+                target = needs_rebuild(self.index, self.index_config)
+                if target is not None:
+                    self._rebuild_index(target)
+            except Exception as e:
+                logger.exception("Error updating debate vectors: %s", e)
+                delay = min(delay * 2, 300.0)
+
+    def _next_delay(self) -> float:
+        """Seconds until the oldest debounced debate is due (at most update_interval)"""
+        with self.store.db.read() as cursor:
+            cursor.execute("SELECT MIN(changed_at) FROM debate_vector_queue")
+            oldest = cursor.fetchone()[0]
+        if oldest is None:
+            return self.update_interval
+        due = oldest + self.debounce - time.time()
+        return min(max(due, 0.05), self.update_interval)
+
+    def update(self) -> int:
+        """Recompute up to ``batch_size`` due debates; returns how many were taken"""
+        with self._lock:
+            embed_text = registry.is_ready(["stella"])
+            with self.store.db.read() as cursor:
+                cursor.execute(
+                    """
+                    SELECT debate_id, centroid_changed, text_changed, version
+                    FROM debate_vector_queue
+                    WHERE (centroid_changed = 1 OR (text_changed = 1 AND ?))
+                      AND changed_at <= ?
+                    LIMIT ?
+                """,
+                    (embed_text, time.time() - self.debounce, self.batch_size),
+                )
+                queued = cursor.fetchall()
+                if not queued:
+                    if self.backfilling and not self._pending(cursor):
+                        self.backfilling = False
+                        logger.info("Debate index is complete (%d vectors)", self.index.ntotal)
+                    return 0
+                debate_ids = [row[0] for row in queued]
+                placeholders = ",".join("?" * len(debate_ids))
+                cursor.execute(
+                    f"SELECT id, tldr, summary FROM debate WHERE id IN ({placeholders})",
+                    debate_ids,
+                )
+                texts = {
+                    debate_id: "\n".join(t for t in (tldr, summary) if t).strip()
+                    for debate_id, tldr, summary in cursor.fetchall()
+                }
+                # 画像の全ベクトル（説明文・分割・固有表現・OCR）の FAISS ID
+                cursor.execute(
+                    f"""
+                    SELECT i.debate_id, (v.slot << ?) | v.image_id FROM image_vector v
+                    JOIN image i ON i.id = v.image_id
+                    WHERE i.has_vector = 1 AND i.debate_id IN ({placeholders})
+                """,
+                    [SEGMENT_SHIFT] + debate_ids,
+                )
+                image_vector_ids: Dict[int, List[int]] = {}
+                for debate_id, vid in cursor.fetchall():
+                    image_vector_ids.setdefault(debate_id, []).append(vid)
+                cursor.execute(
+                    f"""
+                    SELECT debate_id, text_hash FROM debate_vector
+                    WHERE debate_id IN ({placeholders})
+                """,
+                    debate_ids,
+                )
+                embedded_hashes = dict(cursor.fetchall())
+
+            upserts: Dict[int, np.ndarray] = {}
+            removals: List[int] = []
+            for debate_id, centroid_changed, _, _ in queued:
+                if not centroid_changed:
+                    continue
+                centroid = self._centroid(image_vector_ids.get(debate_id, []))
+                if centroid is None:
+                    removals.append(debate_vector_id(debate_id, CENTROID_SLOT))
+                else:
+                    upserts[debate_vector_id(debate_id, CENTROID_SLOT)] = centroid
+
+            text_done = embed_text
+            text_hashes: Dict[int, Optional[str]] = {}
+            to_embed: List[int] = []
+            if embed_text:
+                for debate_id, _, text_changed, _ in queued:
+                    if text_changed:
+                        text = texts.get(debate_id)
+                        text_hashes[debate_id] = (
+                            hashlib.sha1(text.encode()).hexdigest() if text else None
+                        )
+                # 要約以外の更新（updated_at だけ等）や同じ内容での保存は埋め込まない
+                to_embed = [
+                    debate_id
+                    for debate_id, text_hash in text_hashes.items()
+                    if text_hash is not None and text_hash != embedded_hashes.get(debate_id)
+                ]
+                removals += [
+                    debate_vector_id(debate_id, TEXT_SLOT)
+                    for debate_id, text_hash in text_hashes.items()
+                    if text_hash is None
+                ]
+                if to_embed:
+                    try:
+                        vectors = self.store.processer.embed_batch(
+                            [texts[debate_id] for debate_id in to_embed],
+                            path="debate_index",
+                        )
+                    except Exception as e:
+                        logger.error("Error embedding debate texts: %s", e)
+                        text_done = False
+                    else:
+                        for debate_id, vector in zip(to_embed, np.asarray(vectors)):
+                            upserts[debate_vector_id(debate_id, TEXT_SLOT)] = vector
+                if to_embed and text_done:
+                    logger.info(
+                        "Re-embedded the text of %d of %d changed debates",
+                        len(to_embed),
+                        len(text_hashes),
+                    )
+
+            with self.persistence.lock:
+                dimension = self.index.d
+                rows = [
+                    (vid, vector)
+                    for vid, vector in upserts.items()
+                    if len(vector) == dimension
+                ]
+                stored = {vid for vid, _ in rows}
+                if len(rows) != len(upserts):
+                    # reindex の差し替えと重なった（reset で全件作り直される）
+                    logger.warning("Skipping debate vectors of a replaced embedding model")
+                if removals:
+                    self.persistence.remove(
+                        [vid for vid in removals if vid not in upserts]
+                    )
+                if rows:
+                    vectors = np.stack([vector for _, vector in rows]).astype(np.float32)
+                    vectors /= np.maximum(
+                        np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+                    )
+                    self.persistence.upsert([vid for vid, _ in rows], vectors)
+
+            with self.store.db.write() as cursor:
+                if text_done:
+                    cursor.executemany(
+                        "DELETE FROM debate_vector WHERE debate_id = ?",
+                        [(d,) for d, text_hash in text_hashes.items() if text_hash is None],
+                    )
+                    cursor.executemany(
+                        "INSERT OR REPLACE INTO debate_vector (debate_id, text_hash) "
+                        "VALUES (?, ?)",
+                        [
+                            (d, text_hashes[d])
+                            for d in to_embed
+                            if debate_vector_id(d, TEXT_SLOT) in stored
+                        ],
+                    )
+                # 取り出した後に変更された debate は次の回にもう一度計算する
+                cursor.executemany(
+                    """
+                    UPDATE debate_vector_queue
+                    SET centroid_changed = 0, text_changed = text_changed * ?
+                    WHERE debate_id = ? AND version = ?
+                """,
+                    [
+                        (0 if text_done else 1, debate_id, version)
+                        for debate_id, _, _, version in queued
+                    ],
+                )
+                cursor.execute(
+                    """
+                    DELETE FROM debate_vector_queue
+                    WHERE centroid_changed = 0 AND text_changed = 0
+                """
+                )
+            if not text_done and embed_text:
+                raise RuntimeError("debate texts will be embedded on the next attempt")
+            return len(queued)
+
+    @staticmethod
+    def _pending(cursor) -> bool:
+        cursor.execute("SELECT 1 FROM debate_vector_queue LIMIT 1")
+        return cursor.fetchone() is not None
+
+    def _centroid(self, vector_ids: Sequence[int]) -> Optional[np.ndarray]:
+        """Mean of the given vectors of the image index (None if it has none of them)"""
+        vectors = [self.store.persistence.get(vid) for vid in vector_ids]
+        vectors = [vector for vector in vectors if vector is not None]
+        if not vectors:
+            return None
+        return np.mean(vectors, axis=0)
+
+    def _rebuild_index(self, kind: str):
+        logger.info("Rebuilding debate index as %s (%d vectors)", kind, self.index.ntotal)
+
+        def build(ids: np.ndarray, vectors: np.ndarray) -> faiss.Index:
+            index = build_index(kind, vectors.shape[1], self.index_config, vectors)
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+            return index
+
+        self.persistence.rebuild(build)
+
+    def get(self, debate_id: int, slot: int) -> Optional[np.ndarray]:
+        return self.persistence.get(debate_vector_id(debate_id, slot))
+
+    def get_text(self, debate_id: int) -> Optional[np.ndarray]:
+        """Embedding of the debate's tldr / summary (None until computed)"""
+        return self.get(debate_id, TEXT_SLOT)
+
+    def search(self, query_vector: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """The ``k`` debates closest to the (unit) query by max-sim over their vectors"""
+        query_vector = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        with self.persistence.lock.read():
+            index = self.index
+            if index.ntotal == 0 or query_vector.shape[1] != index.d:
+                return []
+            params = search_parameters(index, self.index_config)
+            # debate ごとに 2 本あるので倍を引き、足りなければ広げる
+            fetch = min(k * 2, index.ntotal)
+            best: Dict[int, float] = {}
+            while fetch > 0:
+                with FAISS_SEARCH_SECONDS.time(index="debates", method="ann"):
+                    distances, indices = index.search(query_vector, fetch, params=params)
+                best = {}
+                for distance, vid in zip(distances[0].tolist(), indices[0].tolist()):
+                    if vid < 0:
+                        continue
+                    debate_id = vid & DEBATE_ID_MASK
+                    if distance > best.get(debate_id, -np.inf):
+                        best[debate_id] = distance
+                if len(best) >= k or fetch >= index.ntotal:
+                    break
+                fetch = min(fetch * 2, index.ntotal)
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        """Stop the background thread and write a final snapshot"""
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.persistence.close()
@@ -0,0 +1,336 @@
+import math
+import os
+from typing import Literal, Optional, Tuple
+
+import faiss
+import numpy as np
+from pydantic import BaseModel
+
+IndexKind = Literal["flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "binary"]
+
+# 量子化したコードで候補を絞り、fp16 で保持したベクトルで並べ直す
+REFINE_KINDS = ("sq8", "binary")
+
+
+class IndexConfig(BaseModel):
+    """FAISS index backend settings"""
+
+    # "auto" は ann_threshold を超えるまで flat、それ以降は ann_kind を使う
+    kind: Literal["auto", "flat", "hnsw", "ivf_flat", "ivf_pq", "sq8", "binary"] = "auto"
+    ann_kind: IndexKind = "ivf_flat"
+    ann_threshold: int = 50_000
+    hnsw_m: int = 32
+    hnsw_ef_construction: int = 80
+    pq_m: int = 64  # 1024 次元なら 16 次元ごとに 1 byte
+    pq_nbits: int = 8
+    max_training_vectors: int = 200_000
+    # 現在の nlist の何倍の nlist が必要になったら学習し直すか
+    retrain_factor: float = 2.0
+    nprobe: int = 16
+    ef_search: int = 64
+    # sq8 / binary: k 件を返すために量子化コードで k * rerank_k_factor 件を取り出す
+    rerank_k_factor: int = 8
+    # HNSW: 削除済み（tombstone）の割合がこれを超えたら rebuild で詰め直す
+    max_tombstone_ratio: float = 0.2
+
+    @classmethod
+    def from_env(cls) -> "IndexConfig":
+        return cls(
+            kind=os.environ.get("WR_INDEX_KIND", "auto"),
+            rerank_k_factor=int(os.environ.get("WR_INDEX_RERANK_FACTOR", "8")),
+        )
+
+
+def ivf_nlist(n_vectors: int) -> int:
+    """Number of IVF cells for a corpus size (~4·sqrt(n), >= 39 training points per cell)"""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+
+def min_training_vectors(kind: IndexKind, config: IndexConfig) -> int:
+    """Smallest corpus size at which ``kind`` can be trained"""
+    if kind == "ivf_flat":
+        return 39 * 16
+    if kind == "ivf_pq":
+        return 39 * (1 << config.pq_nbits)
+    if kind == "sq8":
+        # 次元ごとの値域を推定するのに十分な数
+        return 1000
+    return 0
+
+
+def choose_kind(n_vectors: int, config: IndexConfig) -> IndexKind:
+    """Pick the backend for a corpus of ``n_vectors``"""
+    kind = config.ann_kind if config.kind == "auto" else config.kind
+    if config.kind == "auto" and n_vectors < config.ann_threshold:
+        return "flat"
+    if n_vectors < min_training_vectors(kind, config):
+        # 学習に必要な数が集まるまでは flat で運用する
+        return "flat"
+    return kind
+
+
+def index_kind(index: faiss.Index) -> IndexKind:
+    """Backend kind of an index built by ``build_index``"""
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(index, faiss.IndexIVFFlat):
+        return "ivf_flat"
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexRefine):
+        base = faiss.downcast_index(inner.base_index)
+        return "binary" if isinstance(base, faiss.IndexLSH) else "sq8"
+    return "flat"
+
+
+def build_index(
+    kind: IndexKind,
+    dimension: int,
+    config: IndexConfig,
+    training_vectors: Optional[np.ndarray] = None,
+) -> faiss.Index:
+    """Build an empty (trained, if needed) ID-addressable inner-product index"""
+    if kind == "flat":
+        return faiss.IndexIDMap2(faiss.IndexFlatIP(dimension))
+
+    if kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, config.hnsw_m, faiss.METRIC_INNER_PRODUCT)
+        hnsw.hnsw.efConstruction = config.hnsw_ef_construction
+        return faiss.IndexIDMap2(hnsw)
+
+    if kind in REFINE_KINDS:
+        return _build_refine_index(kind, dimension, config, training_vectors)
+
+    # IVF は ID を転置リストに直接持つので IDMap で包まない
+    if training_vectors is None or len(training_vectors) < min_training_vectors(
+        kind, config
+    ):
+        raise ValueError(f"Not enough vectors to train a {kind} index")
+    nlist = ivf_nlist(len(training_vectors))
+    quantizer = faiss.IndexFlatIP(dimension)
+    if kind == "ivf_flat":
+        index = faiss.IndexIVFFlat(
+            quantizer, dimension, nlist, faiss.METRIC_INNER_PRODUCT
+        )
+    else:
+        index = faiss.IndexIVFPQ(
+            quantizer,
+            dimension,
+            nlist,
+            config.pq_m,
+            config.pq_nbits,
+            faiss.METRIC_INNER_PRODUCT,
+        )
+    index.own_fields = True
+    quantizer.this.disown()
+
+    if len(training_vectors) > config.max_training_vectors:
+        rng = np.random.default_rng(0)
+        sample = rng.choice(
+            len(training_vectors), config.max_training_vectors, replace=False
+        )
+        training_vectors = training_vectors[sample]
+    index.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+    # ID での reconstruct / remove_ids に必要
+    index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    index.nprobe = config.nprobe
+    return index
+
+
+def _build_refine_index(
+    kind: IndexKind,
+    dimension: int,
+    config: IndexConfig,
+    training_vectors: Optional[np.ndarray],
+) -> faiss.Index:
+    """sq8 (1 byte / dim) or binary (1 bit / dim) codes with an fp16 re-ranking store"""
+    if kind == "sq8":
+        if training_vectors is None or len(training_vectors) < min_training_vectors(
+            kind, config
+        ):
+            raise ValueError(f"Not enough vectors to train a {kind} index")
+        base = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        if len(training_vectors) > config.max_training_vectors:
+            rng = np.random.default_rng(0)
+            sample = rng.choice(
+                len(training_vectors), config.max_training_vectors, replace=False
+            )
+            training_vectors = training_vectors[sample]
+        base.train(np.ascontiguousarray(training_vectors, dtype=np.float32))
+    else:
+        # 符号ビット（回転・学習なし）のハミング距離。候補の順位は refine で付け直すので
+        # metric は IndexRefine の要件に合わせて inner product としておく
+        base = faiss.IndexLSH(dimension, dimension, False, False)
+        base.metric_type = faiss.METRIC_INNER_PRODUCT
+    refine = faiss.IndexScalarQuantizer(
+        dimension, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT
+    )
+    index = faiss.IndexRefine(base, refine)
+    index.own_fields = True
+    index.own_refine_index = True
+    base.this.disown()
+    refine.this.disown()
+    index.k_factor = config.rerank_k_factor
+
+    id_mapped = faiss.IndexIDMap2(index)
+    id_mapped.own_fields = True
+    index.this.disown()
+    return id_mapped
+
+
+def needs_rebuild(index: faiss.Index, config: IndexConfig) -> Optional[IndexKind]:
+    """Return the kind to migrate to, or None if the current index is still adequate"""
+    current = index_kind(index)
+    tombstones = tombstone_count(index)
+    target = choose_kind(index.ntotal - tombstones, config)
+    if tombstones > config.max_tombstone_ratio * index.ntotal:
+        # 削除済みのベクトルを取り除く（ANN から flat に戻すことはしない）
+        return current if target == "flat" else target
+    if target == "flat":
+        # ANN から flat に戻すことはしない
+        return None
+    if current != target:
+        return target
+    if current in ("ivf_flat", "ivf_pq"):
+        nlist = faiss.extract_index_ivf(index).nlist
+        if ivf_nlist(index.ntotal) >= config.retrain_factor * nlist:
+            return current
+    return None
+
+
+def search_parameters(
+    index: faiss.Index,
+    config: IndexConfig,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    sel: Optional[faiss.IDSelector] = None,
+) -> Optional[faiss.SearchParameters]:
+    """Per-query search parameters for the backend of ``index``"""
+    kind = index_kind(index)
+    if kind in ("ivf_flat", "ivf_pq"):
+        return faiss.SearchParametersIVF(nprobe=nprobe or config.nprobe, sel=sel)
+    if kind == "hnsw":
+        # tombstone（負の ID）は探索中に読み飛ばす
+        live = faiss.IDSelectorRange(0, np.iinfo(np.int64).max)
+        combined = live if sel is None else faiss.IDSelectorAnd(live, sel)
+        params = faiss.SearchParametersHNSW(
+            efSearch=ef_search or config.ef_search, sel=combined
+        )
+        params.referenced_objects = [live, sel, combined]
+        return params
+    if kind in REFINE_KINDS:
+        params = faiss.IndexRefineSearchParameters(k_factor=config.rerank_k_factor)
+        if sel is not None:
+            if kind == "binary":
+                raise ValueError("The binary index does not support filtered search")
+            # IndexRefine は sel を量子化側に渡さないので、ID の変換も自前で行う
+            translated = faiss.IDSelectorTranslated(index.id_map, sel)
+            base_params = faiss.SearchParameters(sel=translated)
+            params.base_index_params = base_params
+            params.referenced_objects = [sel, translated, base_params]
+        return params
+    if sel is not None:
+        return faiss.SearchParameters(sel=sel)
+    return None
+
+
+def _id_map(index: faiss.IndexIDMap2) -> np.ndarray:
+    """Writable view of the external IDs of an ID-mapped index (position -> ID)"""
+    if index.ntotal == 0:
+        return np.empty(0, dtype=np.int64)
+    return faiss.rev_swig_ptr(index.id_map.data(), index.id_map.size())
+
+
+def tombstone_count(index: faiss.Index) -> int:
+    """Vectors removed from an HNSW index but still stored (see ``remove_ids``)"""
+    if index_kind(index) != "hnsw":
+        return 0
+    return int(np.count_nonzero(_id_map(index) < 0))
+
+
+def live_count(index: faiss.Index) -> int:
+    """Number of searchable vectors (``ntotal`` without tombstones)"""
+    return index.ntotal - tombstone_count(index)
+
+
+def all_ids(index: faiss.Index) -> np.ndarray:
+    """IDs of every (live) vector stored in the index"""
+    if isinstance(index, faiss.IndexIDMap2):
+        ids = faiss.vector_to_array(index.id_map).astype(np.int64)
+        return ids[ids >= 0]
+
+    invlists = faiss.extract_index_ivf(index).invlists
+    ids = [
+        faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy()
+        for i in range(invlists.nlist)
+        if invlists.list_size(i)
+    ]
+    return np.concatenate(ids) if ids else np.empty(0, dtype=np.int64)
+
+
+def reconstruct_all(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """All (ids, vectors) in the index; IVF-PQ returns decoded approximations"""
+    ids = all_ids(index)
+    if len(ids) == 0:
+        return ids, np.empty((0, index.d), dtype=np.float32)
+    if isinstance(index, faiss.IndexIDMap2):
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+        if len(ids) < index.ntotal:
+            vectors = vectors[_id_map(index) >= 0]  # tombstone を除く
+        return ids, vectors
+    return ids, index.reconstruct_batch(ids)
+
+
+def contains_id(index: faiss.Index, vector_id: int) -> bool:
+    """Whether a vector with this ID is stored (O(1) through the ID map)"""
+    try:
+        index.reconstruct(int(vector_id))
+        return True
+    except RuntimeError:
+        return False
+
+
+def remove_ids(index: faiss.Index, ids: np.ndarray) -> int:
+    """Remove the vectors stored under ``ids`` (IDs not in the index are skipped)
+
+    Never rebuilds the index. HNSW cannot delete graph nodes, so the removed
+    vectors are tombstoned: their ID is replaced by a negative one that
+    ``search_parameters`` excludes, snapshots keep, and ``needs_rebuild``
+    compacts away. Rebuilding the rev_map (ID -> position) for that would be
+    O(n) per call, so it keeps the removed IDs until the index is compacted or
+    reloaded: ``contains_id`` / ``reconstruct`` still find them, and owners of
+    the index must remember the removals (``IndexPersistence`` does).
+    sq8 / binary codes are removed from both code stores.
+    """
+    ids = np.asarray(
+        [i for i in np.asarray(ids, dtype=np.int64).tolist() if contains_id(index, i)],
+        dtype=np.int64,
+    )
+    if len(ids) == 0:
+        return 0
+    kind = index_kind(index)
+    if kind != "hnsw" and kind not in REFINE_KINDS:
+        return index.remove_ids(ids)
+
+    # 位置は id_map から引く（rev_map には tombstone 済みの ID も残っている）
+    id_map = _id_map(index)
+    positions = np.flatnonzero(np.isin(id_map, ids))
+    if kind == "hnsw":
+        # 位置ごとに異なる負の ID にする（読み込み時の rev_map のキーが重複しないように）
+        id_map[positions] = -1 - positions
+        return len(positions)
+
+    refine = faiss.downcast_index(index.index)
+    selector = faiss.IDSelectorBatch(positions.astype(np.int64))
+    for codes in (refine.base_index, refine.refine_index):
+        codes.remove_ids(selector)
+    refine.ntotal = refine.base_index.ntotal
+    faiss.copy_array_to_vector(np.delete(id_map, positions), index.id_map)
+    index.ntotal = refine.ntotal
+    # 後ろの位置が詰まるので作り直す（コードの削除自体が O(n)）
+    index.construct_rev_map()
+    return len(positions)
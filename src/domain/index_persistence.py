@@ -0,0 +1,369 @@
+import logging
+import os
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Iterable, Optional
+
+import faiss
+import numpy as np
+
+from src.concurrency import ReadWriteLock
+from src.domain.index_factory import (
+    contains_id,
+    index_kind,
+    reconstruct_all,
+    remove_ids,
+)
+
+logger = logging.getLogger(__name__)
+
+# WAL レコード: [op: uint8][id: int64] (+ [vector: float32 * dimension] if op == add)
+# ID ベースなのでリプレイは冪等（add は同じ ID を一度削除してから追加する）
+_HEADER_FORMAT = "<Bq"
+_HEADER_SIZE = struct.calcsize(_HEADER_FORMAT)
+_OP_ADD = 1
+_OP_REMOVE = 2
+# 平坦なコード配列（flat / HNSW / sq8 / binary）をファイルから mmap する。
+# faiss < 1.11 には無いので、そのときは通常どおりメモリに読み込む
+_MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+
+
+class IndexPersistence:
+    """Write-ahead log + background snapshot persistence for an ID-mapped FAISS index.
+
+    Every insert/delete is appended to ``<index>.wal`` (O(d) bytes) instead of
+    rewriting the whole index. A background thread writes a full snapshot once
+    ``flush_every`` operations are pending or ``flush_interval`` seconds have
+    passed, and the log is replayed on top of the last snapshot at startup.
+    ID-mapped (flat, HNSW, sq8, binary) snapshots are memory-mapped on load
+    (``IO_FLAG_MMAP_IFC``), so loading is O(1) in the index size; the mapped
+    codes are read-only, so the index is copied into memory on the first write.
+    """
+
+    def __init__(
+        self,
+        index_path: Path,
+        dimension: int,
+        flush_every: int = 1024,
+        flush_interval: float = 30.0,
+        fsync: bool = False,
+    ):
+        self.index_path = Path(index_path)
+        self.wal_path = self.index_path.with_name(self.index_path.name + ".wal")
+        # スナップショット書き込み中の WAL セグメント
+        self.flushing_path = self.index_path.with_name(
+            self.index_path.name + ".wal.flushing"
+        )
+        self.dimension = dimension
+        self.vector_size = dimension * 4
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+
+        self.index: Optional[faiss.Index] = None
+        # index のコードがスナップショットの mmap を指している（書き込む前に複製する）
+        self._mapped = False
+        # HNSW から tombstone で消したが rev_map には残っている ID（rebuild・読み込みで消える）
+        self._removed: set = set()
+        # 検索は lock.read()（同時に走れる）、追加・削除・差し替えは with lock:
+        self.lock = ReadWriteLock()
+        self._flush_lock = threading.Lock()
+        self._wal_file = None
+        # rebuild 中に行われた操作（新しい index に後から適用する）
+        self._captured: Optional[list] = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def load(self, index: faiss.Index) -> faiss.Index:
+        """Load the last snapshot (if any) and replay the WAL on top of it"""
+        if self.index_path.exists():
+            with open(self.index_path, "rb") as f:
+                id_mapped = f.read(4) == b"IxM2"
+            # IVF の転置リストは mmap すると読み取り専用になるので通常どおり読み込む
+            flags = _MMAP_FLAG if id_mapped else 0
+            index = faiss.read_index(str(self.index_path), flags)
+            self._mapped = bool(flags)
+
+        ops = []
+        for segment in (self.flushing_path, self.wal_path):
+            ops += self._read_log(segment)
+        self.index = index
+        if ops:
+            self._make_writable()
+            self._apply(self.index, ops)
+            logger.info("Replayed %d operations from write-ahead log", len(ops))
+
+        self._pending = len(ops)
+        self._wal_file = open(self.wal_path, "ab")
+
+        self._thread = threading.Thread(
+            target=self._flush_loop, name="faiss-snapshot", daemon=True
+        )
+        self._thread.start()
+        return self.index
+
+    def _read_log(self, segment: Path) -> list:
+        """(op, id, vector) records of a WAL segment, without a torn last record"""
+        if not segment.exists():
+            return []
+
+        data = segment.read_bytes()
+        ops = []
+        offset = 0
+        while offset + _HEADER_SIZE <= len(data):
+            op, vector_id = struct.unpack_from(_HEADER_FORMAT, data, offset)
+            end = offset + _HEADER_SIZE + (self.vector_size if op == _OP_ADD else 0)
+            if end > len(data):
+                break
+            vector = None
+            if op == _OP_ADD:
+                vector = np.frombuffer(
+                    data,
+                    dtype=np.float32,
+                    count=self.dimension,
+                    offset=offset + _HEADER_SIZE,
+                )
+            ops.append((op, vector_id, vector))
+            offset = end
+        if offset != len(data):
+            logger.warning(
+                "Ignoring %d trailing bytes of a partial WAL record in %s",
+                len(data) - offset,
+                segment,
+            )
+        return ops
+
+    def _apply(self, index: faiss.Index, ops: list):
+        """Replay WAL records on ``index`` (idempotent: an add first removes the ID)"""
+        # 同じ種類の操作が続く区間ごとにまとめて適用する
+        start = 0
+        while start < len(ops):
+            end = start
+            while end < len(ops) and ops[end][0] == ops[start][0]:
+                end += 1
+            run = ops[start:end]
+            ids = np.array([vector_id for _, vector_id, _ in run], dtype=np.int64)
+            # index にある ID だけが消される（add の区間ではほとんど何もしない）
+            remove_ids(index, ids)
+            if run[0][0] == _OP_ADD:
+                index.add_with_ids(np.stack([vector for _, _, vector in run]), ids)
+            self._note(self._removed, index, run[0][0], ids)
+            start = end
+
+    @staticmethod
+    def _note(removed: set, index: faiss.Index, op: int, ids: np.ndarray):
+        """Keep ``removed`` in step with an add / remove just applied to ``index``"""
+        if op == _OP_ADD:
+            removed.difference_update(ids.tolist())
+        elif index_kind(index) == "hnsw":
+            removed.update(ids.tolist())
+
+    def _make_writable(self):
+        """Copy a memory-mapped index into memory before its first write"""
+        if not self._mapped:
+            return
+        # mmap されたコード配列は resize できない（faiss が abort する）
+        self.index = faiss.deserialize_index(faiss.serialize_index(self.index))
+        self._mapped = False
+        logger.info("Copied the memory-mapped index (%d vectors) for writing", self.index.ntotal)
+
+    def add(self, ids: Iterable[int], vectors: np.ndarray):
+        """Add vectors under the given IDs and append them to the WAL"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(
+            -1, self.dimension
+        )
+        records = bytearray()
+        for vector_id, vector in zip(ids, vectors):
+            records += struct.pack(_HEADER_FORMAT, _OP_ADD, int(vector_id))
+            records += vector.tobytes()
+
+        with self.lock:
+            self._make_writable()
+            self.index.add_with_ids(vectors, ids)
+            self._note(self._removed, self.index, _OP_ADD, ids)
+            if self._captured is not None:
+                self._captured.append((_OP_ADD, ids, vectors))
+            self._append(records, len(ids))
+
+    def upsert(self, ids: Iterable[int], vectors: np.ndarray):
+        """Add vectors, replacing any already stored under the same IDs"""
+        ids = list(ids)
+        with self.lock:
+            existing = [i for i in ids if self.contains(i)]
+            if existing:
+                self.remove(existing)
+            self.add(ids, vectors)
+
+    def get(self, vector_id: int) -> Optional[np.ndarray]:
+        """The vector stored under ``vector_id`` (None if there is none)"""
+        with self.lock.read():
+            if int(vector_id) in self._removed:
+                return None
+            try:
+                return self.index.reconstruct(int(vector_id))
+            except RuntimeError:
+                return None
+
+    def remove(self, ids: Iterable[int]) -> int:
+        """Remove vectors by ID and append the removal to the WAL"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(ids) == 0:
+            return 0
+        records = bytearray()
+        for vector_id in ids:
+            records += struct.pack(_HEADER_FORMAT, _OP_REMOVE, int(vector_id))
+
+        with self.lock:
+            self._make_writable()
+            removed = remove_ids(self.index, ids)
+            self._note(self._removed, self.index, _OP_REMOVE, ids)
+            if self._captured is not None:
+                self._captured.append((_OP_REMOVE, ids, None))
+            self._append(records, len(ids))
+        return removed
+
+    def contains(self, vector_id: int) -> bool:
+        """Whether a vector is stored under ``vector_id`` (O(1))"""
+        return int(vector_id) not in self._removed and contains_id(self.index, vector_id)
+
+    def live_mask(self, ids: np.ndarray) -> np.ndarray:
+        """False for the tombstoned ``ids`` that ``reconstruct`` would still find"""
+        if not self._removed:
+            return np.ones(len(ids), dtype=bool)
+        return ~np.isin(ids, list(self._removed))
+
+    def rebuild(self, build: Callable[[np.ndarray, np.ndarray], faiss.Index]):
+        """Replace the index with ``build(ids, vectors)`` without blocking writers
+
+        The new index is built outside the lock; inserts and deletes made while
+        it is being built are applied to it before the swap.
+        """
+        with self.lock.read():
+            # 共有側でも書き込みは止まっているので、ここから後の操作は全て記録される
+            ids, vectors = reconstruct_all(self.index)
+            self._captured = []
+        try:
+            new_index = build(ids, vectors)
+            with self.lock:
+                removed = set()
+                for op, op_ids, op_vectors in self._captured:
+                    remove_ids(new_index, op_ids)
+                    if op == _OP_ADD:
+                        new_index.add_with_ids(op_vectors, op_ids)
+                    self._note(removed, new_index, op, op_ids)
+                self.index = new_index
+                self._removed = removed
+                self._mapped = False
+        finally:
+            with self.lock:
+                self._captured = None
+        self.flush()
+
+    def write_shadow(self, index: faiss.Index) -> Path:
+        """Write ``index`` to ``<index>.shadow`` (fsynced) for a later ``swap``"""
+        shadow_path = self.index_path.with_name(self.index_path.name + ".shadow")
+        with open(shadow_path, "wb") as f:
+            f.write(faiss.serialize_index(index).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        return shadow_path
+
+    def swap(self, index: faiss.Index, shadow_path: Optional[Path] = None):
+        """Replace the index with one built elsewhere (possibly of another dimension)
+
+        The new snapshot is written to ``<index>.shadow`` first (unless
+        ``write_shadow`` already did) and renamed over the live snapshot; the
+        WAL of the old index is discarded, so the caller must apply every
+        pending change to ``index`` (before, or through this object after).
+        """
+        if shadow_path is None:
+            shadow_path = self.write_shadow(index)
+
+        with self._flush_lock, self.lock:
+            self._wal_file.close()
+            os.replace(shadow_path, self.index_path)
+            for segment in (self.flushing_path, self.wal_path):
+                if segment.exists():
+                    os.remove(segment)
+            self._wal_file = open(self.wal_path, "ab")
+
+            self.index = index
+            self._mapped = False
+            self._removed = set()
+            self.dimension = index.d
+            self.vector_size = index.d * 4
+            self._pending = 0
+            self._last_flush = time.monotonic()
+
+    def _append(self, records: bytes, count: int):
+        self._wal_file.write(records)
+        self._wal_file.flush()
+        if self.fsync:
+            os.fsync(self._wal_file.fileno())
+
+        self._pending += count
+        if self._pending >= self.flush_every:
+            self._wakeup.set()
+
+    def _flush_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(timeout=self.flush_interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                break
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            if self._pending >= self.flush_every or (self._pending and due):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.exception("Error writing FAISS snapshot: %s", e)
+
+    def flush(self):
+        """Write a full snapshot of the index and truncate the WAL"""
+        with self._flush_lock:
+            # 書き込みだけを止める（検索はスナップショット中も続けられる）
+            with self.lock.read():
+                if self.index is None:
+                    return
+                # 以降の追加は新しい WAL セグメントに書き込まれる
+                self._wal_file.close()
+                if self.flushing_path.exists():
+                    # 前回のスナップショットが中断されている場合は後ろに連結する
+                    with open(self.flushing_path, "ab") as f:
+                        f.write(self.wal_path.read_bytes())
+                    os.remove(self.wal_path)
+                elif self.wal_path.exists():
+                    os.replace(self.wal_path, self.flushing_path)
+                self._wal_file = open(self.wal_path, "ab")
+                snapshot = faiss.serialize_index(self.index)
+                self._pending = 0
+                self._last_flush = time.monotonic()
+
+            # ディスク書き込みはロックの外で行う
+            tmp_path = self.index_path.with_name(self.index_path.name + ".tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(snapshot.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.index_path)
+
+            if self.flushing_path.exists():
+                os.remove(self.flushing_path)
+
+    def close(self):
+        """Stop the background thread and write a final snapshot"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self.index is not None:
+            self.flush()
+            self._wal_file.close()
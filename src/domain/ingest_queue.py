@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import random
+import time
+from typing import List, Optional
+
+from src.domain.vector_store import VectorStore
+from src.tracing import get_trace_id, new_trace_id, reset_trace_id, set_trace_id
+
+logger = logging.getLogger(__name__)
+
+# ジョブの状態: pending -> processing -> indexed / failed（失敗時はバックオフ後に pending へ戻る）
+JOB_STATUSES = ("pending", "processing", "indexed", "failed")
+
+
+class IngestQueue:
+    """Persistent ingestion queue (SQLite ``ingest_job`` table) with async workers.
+
+    ``/api/add`` only stores the file and enqueues a job; a pool of workers
+    runs ``Processer.aprocess_image`` and attaches the vectors to the image row,
+    retrying failed jobs with exponential backoff. The workers do their SQLite
+    and FAISS bookkeeping in threads, so a long writer hold never blocks the
+    event loop. Images whose content (or,
+    with ``near_duplicate_distance`` > 0, perceptual hash) matches an already
+    indexed image reuse its results instead of calling Mistral again.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        workers: int = 4,
+        max_attempts: int = 5,
+        backoff_base: float = 2.0,
+        backoff_max: float = 300.0,
+        poll_interval: float = 1.0,
+        near_duplicate_distance: int = 0,
+    ):
+        self.vector_store = vector_store
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.near_duplicate_distance = near_duplicate_distance
+
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        db = self.vector_store.db
+        db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS ingest_job (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                image_id INTEGER NOT NULL,
+                image_path TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                created_at TEXT DEFAULT (datetime('now')),
+                updated_at TEXT DEFAULT (datetime('now')),
+                trace_id TEXT,
+                FOREIGN KEY (image_id) REFERENCES image(id)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_ingest_job_status
+                ON ingest_job (status, next_attempt_at);
+            CREATE INDEX IF NOT EXISTS idx_ingest_job_image_id
+                ON ingest_job (image_id);
+        """
+        )
+        with db.write() as cursor:
+            cursor.execute("PRAGMA table_info(ingest_job)")
+            if "trace_id" not in {row[1] for row in cursor.fetchall()}:
+                cursor.execute("ALTER TABLE ingest_job ADD COLUMN trace_id TEXT")
+            # 前回のプロセスが処理中に落ちたジョブはやり直す
+            cursor.execute(
+                "UPDATE ingest_job SET status = 'pending' WHERE status = 'processing'"
+            )
+
+    def enqueue(
+        self,
+        debate_id: int,
+        image_path: str,
+        content_hash: Optional[str] = None,
+        phash: Optional[int] = None,
+    ) -> int:
+        """Save the image record without a vector and queue it for processing
+
+        If an identical image was already indexed, its results are copied and
+        the job is recorded as ``indexed`` right away.
+        """
+        debate_id, db_path, processing_path = self.vector_store._prepare_image(
+            debate_id, image_path
+        )
+
+        # 画像行とジョブは同じトランザクションで登録する
+        with self.vector_store.db.write() as cursor:
+            image_id = self.vector_store.add_image_record(
+                debate_id, db_path, content_hash=content_hash, phash=phash
+            )
+            status = "indexed" if self._reuse(image_id) else "pending"
+            # ワーカーのログを登録したリクエストの trace ID で追えるようにする
+            cursor.execute(
+                """
+                INSERT INTO ingest_job (image_id, image_path, status, trace_id)
+                VALUES (?, ?, ?, ?)
+            """,
+                (image_id, processing_path, status, get_trace_id()),
+            )
+
+        if status == "pending" and self._loop is not None:
+            # スレッドから呼ばれることもあるのでループ側で起こす
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return image_id or 0
+
+    async def aenqueue(
+        self,
+        debate_id: int,
+        image_path: str,
+        content_hash: Optional[str] = None,
+        phash: Optional[int] = None,
+    ) -> int:
+        """``enqueue`` in a thread (it waits for the SQLite writer)"""
+        return await asyncio.to_thread(
+            self.enqueue, debate_id, image_path, content_hash, phash
+        )
+
+    def _reuse(self, image_id: int) -> bool:
+        """Copy the results of a duplicate image that is already indexed"""
+        source_id = self.vector_store.find_reusable_image(
+            image_id, self.near_duplicate_distance
+        )
+        if source_id is None:
+            return False
+        if not self.vector_store.copy_processed_image(source_id, image_id):
+            return False
+        logger.info("Reused results of image %d for duplicate image %d", source_id, image_id)
+        return True
+
+    def status(self, image_id: int) -> Optional[dict]:
+        """Latest job state of an image (None if the image does not exist)"""
+        with self.vector_store.db.read() as cursor:
+            cursor.execute(
+                """
+                SELECT i.id, i.has_vector, j.status, j.attempts, j.last_error
+                FROM image i
+                LEFT JOIN ingest_job j ON j.image_id = i.id
+                WHERE i.id = ?
+                ORDER BY j.id DESC LIMIT 1
+            """,
+                (image_id,),
+            )
+            row = cursor.fetchone()
+        if row is None:
+            return None
+
+        image_id, has_vector, status, attempts, last_error = row
+        if status is None:
+            # キュー導入前に登録された画像
+            status = "indexed" if has_vector else "failed"
+        return {
+            "image_id": image_id,
+            "status": status,
+            "attempts": attempts or 0,
+            "last_error": last_error,
+        }
+
+    def start(self):
+        """Start the worker tasks on the running event loop"""
+        self._wakeup = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._tasks = [
+            asyncio.create_task(self._worker(n), name=f"ingest-worker-{n}")
+            for n in range(self.workers)
+        ]
+        logger.info("Started %d ingest workers", self.workers)
+
+    def depth(self) -> int:
+        """Jobs waiting or being processed"""
+        with self.vector_store.db.read() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) FROM ingest_job WHERE status IN ('pending', 'processing')"
+            )
+            return cursor.fetchone()[0]
+
+    async def stop(self):
+        """Cancel the workers; in-flight jobs are retried on the next start"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def _claim(self) -> Optional[tuple]:
+        # SELECT -> UPDATE は writer のトランザクション内なので他のワーカーに割り込まれない
+        with self.vector_store.db.write() as cursor:
+            cursor.execute(
+                """
+                SELECT id, image_id, image_path, attempts, trace_id FROM ingest_job
+                WHERE status = 'pending' AND next_attempt_at <= ?
+                ORDER BY id LIMIT 1
+            """,
+                (time.time(),),
+            )
+            job = cursor.fetchone()
+            if job is None:
+                return None
+
+            cursor.execute(
+                """
+                UPDATE ingest_job
+                SET status = 'processing', attempts = attempts + 1, updated_at = datetime('now')
+                WHERE id = ?
+            """,
+                (job[0],),
+            )
+        return job
+
+    async def _worker(self, n: int):
+        # ループ上で待つのは aprocess_image だけ（SQLite / FAISS はスレッドで）
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            job_id, image_id, image_path, attempts, trace_id = job
+            token = set_trace_id(trace_id or new_trace_id())
+            try:
+                # 同じ画像の先行ジョブが待機中に終わっていれば結果を使い回す
+                if await asyncio.to_thread(self._reuse, image_id):
+                    await asyncio.to_thread(self._finish, job_id, "indexed")
+                    continue
+                image_data = await self.vector_store.processer.aprocess_image(
+                    image_path
+                )
+                await asyncio.to_thread(
+                    self.vector_store.attach_vector,
+                    image_id,
+                    image_data.segment_feats,
+                    ", ".join(image_data.ocr),
+                    image_data.description,
+                    segments=image_data.segments,
+                )
+                await asyncio.to_thread(self._finish, job_id, "indexed")
+                logger.info("[worker %d] Indexed image %d", n, image_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                await asyncio.to_thread(
+                    self._retry_or_fail, job_id, attempts + 1, str(e)
+                )
+                logger.error("[worker %d] Error processing image %d: %s", n, image_id, e)
+            finally:
+                reset_trace_id(token)
+
+    def _finish(self, job_id: int, status: str, error: Optional[str] = None):
+        with self.vector_store.db.write() as cursor:
+            cursor.execute(
+                """
+                UPDATE ingest_job
+                SET status = ?, last_error = ?, updated_at = datetime('now')
+                WHERE id = ?
+            """,
+                (status, error, job_id),
+            )
+
+    def _retry_or_fail(self, job_id: int, attempts: int, error: str):
+        if attempts >= self.max_attempts:
+            self._finish(job_id, "failed", error)
+            return
+
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        delay *= random.uniform(0.5, 1.0)  # 同時に失敗したジョブが一斉に再試行しないように
+        with self.vector_store.db.write() as cursor:
+            cursor.execute(
+                """
+                UPDATE ingest_job
+                SET status = 'pending', last_error = ?, next_attempt_at = ?,
+                    updated_at = datetime('now')
+                WHERE id = ?
+            """,
+                (error, time.time() + delay, job_id),
+            )
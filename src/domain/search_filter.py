@@ -0,0 +1,81 @@
+import json
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, field_validator
+
+
+class SearchFilter(BaseModel):
+    """Metadata predicates applied to images before the vector search
+
+    ``created_after`` / ``created_before`` bound the upload time of the image
+    (ISO dates or datetimes, naive ones are taken as UTC; the upper bound is
+    exclusive); every entry of ``entities`` must appear as a phrase in the
+    image's OCR entities (matched through image_fts, so case- and
+    accent-insensitive).
+    """
+
+    debate_ids: Optional[List[int]] = None
+    created_after: Optional[str] = None
+    created_before: Optional[str] = None
+    entities: List[str] = []
+
+    @field_validator("created_after", "created_before")
+    @classmethod
+    def _sqlite_datetime(cls, value: Optional[str]) -> Optional[str]:
+        # image.created_at は SQLite の datetime('now') 形式（UTC）
+        if value is None:
+            return None
+        if value[-1:] in ("Z", "z"):
+            # Python 3.10 の fromisoformat は末尾の "Z"（UTC）を受け付けない
+            value = value[:-1] + "+00:00"
+        dt = datetime.fromisoformat(value)
+        if dt.tzinfo is not None:
+            # オフセット付きは UTC に直す（naive は UTC とみなす）
+            dt = dt.astimezone(timezone.utc)
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
+
+    @field_validator("entities")
+    @classmethod
+    def _strip_entities(cls, value: List[str]) -> List[str]:
+        return sorted({entity.strip() for entity in value if entity.strip()})
+
+    def is_empty(self) -> bool:
+        return (
+            self.debate_ids is None
+            and self.created_after is None
+            and self.created_before is None
+            and not self.entities
+        )
+
+    def cache_key(self) -> str:
+        data = self.model_dump()
+        if self.debate_ids is not None:
+            data["debate_ids"] = sorted(set(self.debate_ids))
+        return json.dumps(data, sort_keys=True)
+
+    def where(self, alias: str = "i") -> Tuple[str, list]:
+        """SQL condition on the image table (as ``alias``) and its parameters"""
+        conditions, params = [], []
+        if self.debate_ids is not None:
+            conditions.append(
+                f"{alias}.debate_id IN ({','.join('?' * len(self.debate_ids)) or 'NULL'})"
+            )
+            params += list(self.debate_ids)
+        if self.created_after is not None:
+            conditions.append(f"{alias}.created_at >= ?")
+            params.append(self.created_after)
+        if self.created_before is not None:
+            conditions.append(f"{alias}.created_at < ?")
+            params.append(self.created_before)
+        if self.entities:
+            # LIKE '%...%' は全行を読むので FTS5 の転置リストで引く
+            conditions.append(
+                f"{alias}.id IN (SELECT rowid FROM image_fts WHERE image_fts MATCH ?)"
+            )
+            params.append(
+                " AND ".join(
+                    'ocr : "' + entity.replace('"', '""') + '"' for entity in self.entities
+                )
+            )
+        return " AND ".join(conditions) or "1", params
@@ -0,0 +1,133 @@
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+
+from src.metrics import SQL_SECONDS
+
+
+class SQLitePool:
+    """SQLite connections for concurrent requests: a pool of readers and one writer.
+
+    The database runs in WAL mode, so readers never block the writer (or each
+    other). Writes are serialized through a single connection; ``write()``
+    wraps its block in ``BEGIN IMMEDIATE`` / ``COMMIT`` and rolls back on error.
+    Nested ``write()`` blocks join the outer transaction, and ``read()`` inside
+    a ``write()`` on the same thread uses the writer so it sees its own rows.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        readers: int = 4,
+        cache_size_kib: int = 64 * 1024,
+        mmap_size: int = 256 * 1024 * 1024,
+        busy_timeout: float = 5.0,
+    ):
+        self.db_path = str(db_path)
+        self.readers = readers
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+
+        self._writer = self._connect()
+        self._writer.execute("PRAGMA journal_mode = WAL")
+        self._write_lock = threading.RLock()
+        self._write_depth = 0
+        self._write_owner: Optional[int] = None
+
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all_readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: トランザクションは write() で明示的に張る
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        conn.execute("PRAGMA synchronous = NORMAL")  # WAL なら NORMAL でも壊れない
+        conn.execute(f"PRAGMA cache_size = -{self.cache_size_kib}")
+        conn.execute(f"PRAGMA mmap_size = {self.mmap_size}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._all_readers) < self.readers:
+                conn = self._connect()
+                conn.execute("PRAGMA query_only = ON")
+                self._all_readers.append(conn)
+                return conn
+        # 全部使用中なら返却を待つ
+        return self._idle.get()
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Cursor]:
+        """Cursor on a pooled read-only connection"""
+        if self._write_owner == threading.get_ident():
+            yield self._writer.cursor()
+            return
+
+        start = time.perf_counter()
+        conn = self._acquire_reader()
+        acquired = time.perf_counter()
+        SQL_SECONDS.observe(acquired - start, mode="read", phase="wait")
+        cursor = conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+            self._idle.put(conn)
+            SQL_SECONDS.observe(time.perf_counter() - acquired, mode="read", phase="hold")
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Cursor]:
+        """Cursor on the writer inside a transaction (committed when the block exits)"""
+        start = time.perf_counter()
+        with self._write_lock:
+            outermost = self._write_depth == 0
+            cursor = self._writer.cursor()
+            if outermost:
+                acquired = time.perf_counter()
+                SQL_SECONDS.observe(acquired - start, mode="write", phase="wait")
+                cursor.execute("BEGIN IMMEDIATE")
+                self._write_owner = threading.get_ident()
+            self._write_depth += 1
+            try:
+                yield cursor
+                if outermost:
+                    # 呼び出し側が lastrowid を読めるよう別カーソルで COMMIT する
+                    self._writer.execute("COMMIT")
+            except BaseException:
+                if outermost:
+                    self._writer.execute("ROLLBACK")
+                raise
+            finally:
+                self._write_depth -= 1
+                if outermost:
+                    self._write_owner = None
+                    SQL_SECONDS.observe(
+                        time.perf_counter() - acquired, mode="write", phase="hold"
+                    )
+
+    def executescript(self, script: str):
+        """Run a DDL script on the writer (outside of write(); executescript commits itself)"""
+        with self._write_lock:
+            self._writer.executescript(script)
+
+    def close(self):
+        with self._readers_lock:
+            for conn in self._all_readers:
+                conn.close()
+            self._all_readers = []
+        with self._write_lock:
+            self._writer.close()
@@ -1,27 +1,95 @@
+import asyncio
+import logging
+import math
 import os
-import sqlite3
+import re
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Sequence, Tuple
 
 import faiss
 import numpy as np
 
+from src.concurrency import run_in_stage
+from src.domain.index_factory import (
+    IndexConfig,
+    build_index,
+    choose_kind,
+    index_kind,
+    needs_rebuild,
+    search_parameters,
+)
+from src.domain.index_persistence import IndexPersistence
+from src.domain.search_filter import SearchFilter
+from src.domain.sqlite_pool import SQLitePool
+from src.metrics import EMBED_SECONDS, EMBED_TEXTS, FAISS_SEARCH_SECONDS
 from src.model import ImageData, InstructionData, Processer
+from src.model_registry import STELLA_MODEL_NAME
+from src.query_cache import LRUCache, QueryCache
+from src.upload_storage import UPLOADS_DIR, upload_file_path
+
+if TYPE_CHECKING:
+    from src.domain.debate_index import DebateIndex
+
+# Reciprocal Rank Fusion の定数（大きいほど下位の順位も効く）
+RRF_K = 60
+# 語彙検索（FTS5）で融合に使う上位件数
+LEXICAL_LIMIT = 100
+# これより多くの文書に出現する語はクエリから外す（BM25 の計算量を抑える）
+MAX_TERM_DOCS = 5000
+# 画像ごとに複数のベクトルを持つ: FAISS の ID = slot << SEGMENT_SHIFT | image_id
+# slot 0（説明文全体）は image_id そのままなので、1 画像 1 ベクトル時代の index もそのまま使える
+SEGMENT_SHIFT = 40
+IMAGE_ID_MASK = (1 << SEGMENT_SHIFT) - 1
+# 画像単位で k 件集めるために、まず k * SEARCH_OVERSAMPLE 件のベクトルを引く
+SEARCH_OVERSAMPLE = 4
+# 2 段階の debate 検索: debate の index から k * DEBATE_OVERSAMPLE 件を候補にする
+DEBATE_OVERSAMPLE = 4
+# 絞り込み後のベクトルがこれ以下なら FAISS を使わず全件と内積を取る
+FILTER_BRUTE_FORCE = int(os.environ.get("WR_FILTER_BRUTE_FORCE", "4096"))
+
+logger = logging.getLogger(__name__)
+
+
+def vector_id(image_id: int, slot: int) -> int:
+    return (slot << SEGMENT_SHIFT) | image_id
 
 
 class VectorStore:
-    def __init__(self, dimension: int = 1024, db_path: str = "vectors.db"):
+    def __init__(
+        self,
+        dimension: int = 1024,
+        db_path: str = "vectors.db",
+        flush_every: int = 1024,
+        flush_interval: float = 30.0,
+        index_config: Optional[IndexConfig] = None,
+        db_readers: int = 4,
+        embedding_model: str = STELLA_MODEL_NAME,
+        debate_index: bool = True,
+        uploads_dir: Path = UPLOADS_DIR,
+    ):
+        # 既存のデータベースでは index_meta に記録されたモデル・次元が優先される
         self.dimension = dimension
-        # self.index = faiss.IndexFlatL2(dimension)
-        self.index = faiss.IndexFlatIP(dimension)
-        self.processer = Processer()
+        self.embedding_model = embedding_model
+        self.uploads_dir = Path(uploads_dir)
+        self.index_config = index_config or IndexConfig.from_env()
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self._reindex_lock = threading.Lock()
 
         self.db_path = Path(db_path)
-        self.conn = sqlite3.connect(db_path)
-        self.cursor = self.conn.cursor()
+        # FTS5 の語ごとの文書数（fts5vocab は転置リストを読むので毎回は引かない）
+        self._term_doc_counts = LRUCache(maxsize=100_000, ttl=300.0)
+        # 絞り込み条件ごとの対象ベクトルの ID と IDSelector（書き込みのたびに世代が変わる）
+        self._filter_cache = LRUCache(maxsize=64, ttl=300.0)
+        self._data_generation = 0
+        self.processer = Processer(
+            query_cache=QueryCache(self.db_path.parent / "query_cache.db")
+        )
+        # リクエストごとに接続を借りる（読み取りはプール、書き込みは単一の writer）
+        self.db = SQLitePool(db_path, readers=db_readers)
 
-        self.cursor.executescript(
+        self.db.executescript(
             """
             CREATE TABLE IF NOT EXISTS debate (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -35,103 +103,710 @@ class VectorStore:
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 debate_id INTEGER,
                 ocr TEXT,
+                description TEXT,
                 image_path TEXT NOT NULL,
+                has_vector INTEGER NOT NULL DEFAULT 0,
+                embedding_model TEXT,
+                content_hash TEXT,
+                phash INTEGER,
                 created_at TEXT DEFAULT (datetime('now')),
                 updated_at TEXT DEFAULT (datetime('now')),
                 FOREIGN KEY (debate_id) REFERENCES debate(id)
             );
+
+            CREATE INDEX IF NOT EXISTS idx_image_debate_id ON image(debate_id);
+            CREATE INDEX IF NOT EXISTS idx_image_image_path ON image(image_path);
+            CREATE INDEX IF NOT EXISTS idx_debate_updated_at ON debate(updated_at);
+
+            -- 画像のベクトルごとのテキスト（説明文・その分割・固有表現・OCR）
+            CREATE TABLE IF NOT EXISTS image_vector (
+                image_id INTEGER NOT NULL,
+                slot INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (image_id, slot),
+                FOREIGN KEY (image_id) REFERENCES image(id)
+            );
+
+            -- 現在の FAISS index を作った埋め込みモデルと次元
+            CREATE TABLE IF NOT EXISTS index_meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
         """
         )
-        self.conn.commit()
+        self._load_index_meta()
+        self._add_missing_columns()
+        self._backfill_image_vectors()
+        self.db.executescript(
+            """
+            CREATE INDEX IF NOT EXISTS idx_image_content_hash ON image(content_hash);
+        """
+        )
+        self._create_fts_tables()
 
-        self.faiss_to_image_id = {}
-        self.image_id_to_faiss = {}
-        self.image_id_to_text = {}
+        self.persistence = IndexPersistence(
+            self.db_path.parent / "vectors.faiss",
+            self.dimension,
+            flush_every=flush_every,
+            flush_interval=flush_interval,
+        )
         self._load_existing_vectors()
 
-    def _load_existing_vectors(self):
-        """Load existing vectors from disk if they exist"""
-        vector_file = self.db_path.parent / "vectors.faiss"
-        if vector_file.exists():
-            self.index = faiss.read_index(str(vector_file))
+        # debate 単位のベクトル（2 段階の debate 検索の 1 段目）
+        self.debate_index: Optional["DebateIndex"] = None
+        if debate_index:
+            # debate_index はこのモジュールの ID 形式を使うので、循環しないようにここで読み込む
+            from src.domain.debate_index import DebateIndex
+
+            self.debate_index = DebateIndex(
+                self,
+                self.db_path.parent / "debates.faiss",
+                self.index_config,
+                flush_every=flush_every,
+                flush_interval=flush_interval,
+            )
 
-            self.cursor.execute("SELECT id FROM image ORDER BY id")
-            for i, (image_id,) in enumerate(self.cursor.fetchall()):
-                self.faiss_to_image_id[i] = image_id
-                self.image_id_to_faiss[image_id] = i
-                self.image_id_to_text[image_id] = ""
+    def _add_missing_columns(self):
+        """Add columns introduced after the database was first created"""
+        with self.db.write() as cursor:
+            cursor.execute("PRAGMA table_info(image)")
+            columns = {row[1] for row in cursor.fetchall()}
+            if "has_vector" not in columns:
+                cursor.execute(
+                    "ALTER TABLE image ADD COLUMN has_vector INTEGER NOT NULL DEFAULT 0"
+                )
+            if "description" not in columns:
+                cursor.execute("ALTER TABLE image ADD COLUMN description TEXT")
+            if "content_hash" not in columns:
+                cursor.execute("ALTER TABLE image ADD COLUMN content_hash TEXT")
+            if "phash" not in columns:
+                cursor.execute("ALTER TABLE image ADD COLUMN phash INTEGER")
+            if "embedding_model" not in columns:
+                cursor.execute("ALTER TABLE image ADD COLUMN embedding_model TEXT")
+                # 既存のベクトルは index_meta のモデルで作られている
+                cursor.execute(
+                    "UPDATE image SET embedding_model = ? WHERE has_vector = 1",
+                    (self.embedding_model,),
+                )
 
-    def add_debate(self, tldr: str, summary: str) -> int:
-        """Add a new debate entry"""
-        self.cursor.execute(
+    def _backfill_image_vectors(self):
+        """Record the single description vector of images indexed before image_vector existed"""
+        with self.db.write() as cursor:
+            cursor.execute("SELECT 1 FROM index_meta WHERE key = 'image_vector'")
+            if cursor.fetchone() is not None:
+                return
+            cursor.execute(
+                """
+                INSERT INTO image_vector (image_id, slot, kind, text)
+                SELECT id, 0, 'description', COALESCE(NULLIF(description, ''), ocr, '')
+                FROM image
+                WHERE has_vector = 1
+                  AND NOT EXISTS (SELECT 1 FROM image_vector v WHERE v.image_id = image.id)
             """
-            INSERT INTO debate (tldr, summary)
-            VALUES (?, ?)
-        """,
-            (tldr, summary),
-        )
-        self.conn.commit()
-        return self.cursor.lastrowid or 0  # Return 0 if None
+            )
+            if cursor.rowcount > 0:
+                logger.info("Recorded the description vector of %d images", cursor.rowcount)
+            cursor.execute(
+                "INSERT INTO index_meta (key, value) VALUES ('image_vector', '1')"
+            )
 
-    def add_image(
-        self, debate_id: int, image_path: str, vector: np.ndarray, ocr_text: str
-    ) -> int:
-        """Add a new image and its vector"""
-        if isinstance(vector, list):
-            vector = np.array(vector, dtype=np.float32)
-        vector = vector.reshape(1, -1)
+    def _load_index_meta(self):
+        """Use the model / dimension recorded for the index, or record the configured ones"""
+        with self.db.write() as cursor:
+            cursor.execute("SELECT key, value FROM index_meta")
+            meta = dict(cursor.fetchall())
+            if not meta:
+                cursor.executemany(
+                    "INSERT INTO index_meta (key, value) VALUES (?, ?)",
+                    [
+                        ("embedding_model", self.embedding_model),
+                        ("dimension", str(self.dimension)),
+                    ],
+                )
+                meta = {
+                    "embedding_model": self.embedding_model,
+                    "dimension": str(self.dimension),
+                }
+
+        if (meta["embedding_model"], int(meta["dimension"])) != (
+            self.embedding_model,
+            self.dimension,
+        ):
+            logger.warning(
+                "Index was built with %s (%sd); using it instead of %s (%dd)",
+                meta["embedding_model"],
+                meta["dimension"],
+                self.embedding_model,
+                self.dimension,
+            )
+        self.embedding_model = meta["embedding_model"]
+        self.dimension = int(meta["dimension"])
+        self.processer.set_embedding_model(self.embedding_model)
 
-        self.cursor.execute(
+    def _create_fts_tables(self):
+        """FTS5 indexes over debate (tldr, summary) and image (ocr, description)
+
+        The indexes are external-content tables kept in sync by triggers, so every
+        insert / update / delete updates them incrementally. The ``*_vocab``
+        tables expose per-term document counts for query pruning.
+        """
+        with self.db.read() as cursor:
+            cursor.execute(
+                "SELECT name FROM sqlite_master WHERE name IN ('debate_fts', 'image_fts')"
+            )
+            existing = {row[0] for row in cursor.fetchall()}
+
+        self.db.executescript(
             """
-            INSERT INTO image (debate_id, image_path, ocr)
-            VALUES (?, ?, ?)
-        """,
-            (debate_id, image_path, ocr_text),
+            CREATE VIRTUAL TABLE IF NOT EXISTS debate_fts USING fts5(
+                tldr, summary, content='debate', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS debate_fts_vocab
+                USING fts5vocab(debate_fts, 'row');
+            CREATE TRIGGER IF NOT EXISTS debate_fts_ai AFTER INSERT ON debate BEGIN
+                INSERT INTO debate_fts (rowid, tldr, summary)
+                VALUES (new.id, new.tldr, new.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS debate_fts_ad AFTER DELETE ON debate BEGIN
+                INSERT INTO debate_fts (debate_fts, rowid, tldr, summary)
+                VALUES ('delete', old.id, old.tldr, old.summary);
+            END;
+            CREATE TRIGGER IF NOT EXISTS debate_fts_au AFTER UPDATE OF tldr, summary ON debate BEGIN
+                INSERT INTO debate_fts (debate_fts, rowid, tldr, summary)
+                VALUES ('delete', old.id, old.tldr, old.summary);
+                INSERT INTO debate_fts (rowid, tldr, summary)
+                VALUES (new.id, new.tldr, new.summary);
+            END;
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS image_fts USING fts5(
+                ocr, description, content='image', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE VIRTUAL TABLE IF NOT EXISTS image_fts_vocab
+                USING fts5vocab(image_fts, 'row');
+            CREATE TRIGGER IF NOT EXISTS image_fts_ai AFTER INSERT ON image BEGIN
+                INSERT INTO image_fts (rowid, ocr, description)
+                VALUES (new.id, new.ocr, new.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS image_fts_ad AFTER DELETE ON image BEGIN
+                INSERT INTO image_fts (image_fts, rowid, ocr, description)
+                VALUES ('delete', old.id, old.ocr, old.description);
+            END;
+            CREATE TRIGGER IF NOT EXISTS image_fts_au AFTER UPDATE OF ocr, description ON image BEGIN
+                INSERT INTO image_fts (image_fts, rowid, ocr, description)
+                VALUES ('delete', old.id, old.ocr, old.description);
+                INSERT INTO image_fts (rowid, ocr, description)
+                VALUES (new.id, new.ocr, new.description);
+            END;
+        """
+        )
+
+        # 既存のデータベースでは初回だけ全件からインデックスを作る
+        with self.db.write() as cursor:
+            for table in ("debate_fts", "image_fts"):
+                if table not in existing:
+                    cursor.execute(f"INSERT INTO {table} ({table}) VALUES ('rebuild')")
+
+    @property
+    def index(self) -> faiss.Index:
+        # rebuild で差し替わるので常に persistence 経由で参照する
+        return self.persistence.index
+
+    def _load_existing_vectors(self):
+        """Memory-map the last FAISS snapshot and replay the write-ahead log"""
+        self._upgrade_positional_index()
+        # FAISS の ID は image.id（削除・ベクトル無しの画像があっても位置がずれない）
+        empty = build_index(
+            choose_kind(0, self.index_config), self.dimension, self.index_config
         )
-        image_id = self.cursor.lastrowid
-        self.conn.commit()
+        self.persistence.load(empty)
+        logger.info("Loaded %s index with %d vectors", index_kind(self.index), self.index.ntotal)
+
+    def _schedule_rebuild(self):
+        """Migrate to an ANN backend (or retrain it) in the background when needed"""
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        if self._reindex_lock.locked():
+            return  # reindex の差し替えで作り直される
+        target = needs_rebuild(self.index, self.index_config)
+        if target is None:
+            return
+        self._rebuild_thread = threading.Thread(
+            target=self._rebuild_index, args=(target,), name="faiss-rebuild", daemon=True
+        )
+        self._rebuild_thread.start()
+
+    def _data_changed(self):
+        """After a debate / image write: drop cached filters, wake the debate index"""
+        self._data_generation += 1
+        if self.debate_index is not None:
+            self.debate_index.notify()
 
-        # Add the vector to the FAISS index
-        vector /= np.linalg.norm(vector, axis=1, keepdims=True)  # L2ノルムを 1 に正規化
-        self.index.add(vector)
-        faiss_idx = self.index.ntotal - 1
+    def _rebuild_index(self, kind: str):
+        logger.info("Rebuilding FAISS index as %s (%d vectors)", kind, self.index.ntotal)
 
-        self.faiss_to_image_id[faiss_idx] = image_id
-        self.image_id_to_faiss[image_id] = faiss_idx
-        self.image_id_to_text[image_id] = ocr_text
+        def build(ids: np.ndarray, vectors: np.ndarray) -> faiss.Index:
+            index = build_index(kind, self.dimension, self.index_config, vectors)
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+            return index
 
-        faiss.write_index(self.index, str(self.db_path.parent / "vectors.faiss"))
+        try:
+            self.persistence.rebuild(build)
+            logger.info("FAISS index is now %s", index_kind(self.index))
+        except Exception as e:
+            logger.exception("Error rebuilding FAISS index: %s", e)
+
+    def _upgrade_positional_index(self):
+        """Convert a pre-ID-map vectors.faiss (position == n-th image row) in place"""
+        index_path = self.persistence.index_path
+        if not index_path.exists():
+            return
+        with open(index_path, "rb") as f:
+            # IndexFlatIP / IndexFlatL2 の fourcc のみが旧形式
+            if f.read(4) not in (b"IxFI", b"IxF2"):
+                return
+
+        legacy = faiss.read_index(str(index_path))
+        logger.info("Upgrading positional FAISS index to an ID-mapped index")
+        # 旧形式は「n 番目のベクトル = id 順で n 番目の画像」を前提としていた
+        with self.db.read() as cursor:
+            cursor.execute("SELECT id FROM image ORDER BY id LIMIT ?", (legacy.ntotal,))
+            image_ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        vectors = legacy.reconstruct_n(0, len(image_ids))
+
+        upgraded = faiss.IndexIDMap2(faiss.IndexFlatIP(self.dimension))
+        upgraded.add_with_ids(vectors, image_ids)
+        faiss.write_index(upgraded, str(index_path))
+
+        with self.db.write() as cursor:
+            cursor.executemany(
+                "UPDATE image SET has_vector = 1 WHERE id = ?",
+                [(int(image_id),) for image_id in image_ids],
+            )
+
+    def reindex(self, embedder, model_name: str, batch_size: int = 64) -> int:
+        """Re-embed the stored segment texts with another model and swap the index
+
+        The new vectors go into a shadow index while searches keep using the
+        current one (``batch_size`` counts images). Rows added or changed
+        meanwhile are caught up, and the index is built and written to disk,
+        without the write lock. Only rows changed after that are re-embedded
+        while holding it, then the index, the per-row model and ``index_meta``
+        are switched in one transaction.
+        ``embedder`` needs an ``embed_batch(texts)`` method; it also becomes
+        the query embedder.
+        """
+        with self._reindex_lock:
+            if self._rebuild_thread is not None:
+                self._rebuild_thread.join()
+
+            with self.db.read() as cursor:
+                # 以降に追加された画像は追いつきの段階で埋め込む（走査が追いかけ続けないように）
+                cursor.execute("SELECT datetime('now'), COALESCE(MAX(id), 0) FROM image")
+                started_at, scan_end = cursor.fetchone()
+
+            dimension = np.asarray(embedder.embed_batch(["whiteboard"])).shape[-1]
+
+            # 旧モデルの画像ではなく、保存済みのセグメントのテキストを埋め込み直す
+            shadow: Dict[int, Dict[int, np.ndarray]] = {}
+
+            def segment_rows(cursor, image_ids: List[int]) -> list:
+                cursor.execute(
+                    f"""
+                    SELECT image_id, slot, text FROM image_vector
+                    WHERE image_id IN ({",".join("?" * len(image_ids))})
+                    ORDER BY image_id, slot
+                """,
+                    image_ids,
+                )
+                return cursor.fetchall()
+
+            def embed(image_ids: List[int], rows: list):
+                for image_id in image_ids:
+                    shadow.pop(image_id, None)
+                if not rows:
+                    return
+                with EMBED_SECONDS.time(path="reindex"):
+                    vectors = embedder.embed_batch([text or "" for _, _, text in rows])
+                EMBED_TEXTS.inc(len(rows), path="reindex")
+                for (image_id, slot, _), vector in zip(rows, np.asarray(vectors)):
+                    shadow.setdefault(image_id, {})[slot] = vector
+
+            last_id = 0
+            while True:
+                with self.db.read() as cursor:
+                    cursor.execute(
+                        """
+                        SELECT id FROM image WHERE has_vector = 1 AND id > ? AND id <= ?
+                        ORDER BY id LIMIT ?
+                    """,
+                        (last_id, scan_end, batch_size),
+                    )
+                    image_ids = [row[0] for row in cursor.fetchall()]
+                    if not image_ids:
+                        break
+                    rows = segment_rows(cursor, image_ids)
+                embed(image_ids, rows)
+                last_id = image_ids[-1]
+                logger.info("Re-embedded %d images with %s", len(shadow), model_name)
+
+            def changed_since(cursor, after_id: int, since: str) -> List[int]:
+                cursor.execute(
+                    """
+                    SELECT id FROM image
+                    WHERE has_vector = 1 AND (id > ? OR updated_at >= ?)
+                """,
+                    (after_id, since),
+                )
+                return [row[0] for row in cursor.fetchall()]
+
+            def stack(keys: List[Tuple[int, int]]) -> Tuple[np.ndarray, np.ndarray]:
+                ids = np.array(
+                    [vector_id(image_id, slot) for image_id, slot in keys], dtype=np.int64
+                )
+                vectors = np.empty((len(keys), dimension), dtype=np.float32)
+                for row, (image_id, slot) in enumerate(keys):
+                    vectors[row] = shadow[image_id][slot]
+                vectors /= np.maximum(
+                    np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12
+                )
+                return ids, vectors
+
+            # 埋め込み中に追加・更新された行を書き込みロックの外で追いつかせる
+            with self.db.read() as cursor:
+                cursor.execute("SELECT datetime('now'), COALESCE(MAX(id), 0) FROM image")
+                caught_up_at, caught_up_id = cursor.fetchone()
+                changed = changed_since(cursor, scan_end, started_at)
+            for start in range(0, len(changed), batch_size):
+                image_ids = changed[start : start + batch_size]
+                with self.db.read() as cursor:
+                    rows = segment_rows(cursor, image_ids)
+                embed(image_ids, rows)
+
+            # 学習・構築とスナップショットの fsync も書き込みロックの外で行う
+            ids, vectors = stack(
+                [(image_id, slot) for image_id, slots in shadow.items() for slot in slots]
+            )
+            kind = choose_kind(len(ids), self.index_config)
+            index = build_index(kind, dimension, self.index_config, vectors)
+            if len(ids):
+                index.add_with_ids(vectors, ids)
+            shadow_path = self.persistence.write_shadow(index)
+
+            with self.db.write() as cursor:
+                # 構築中に変わった行だけを埋め込み直す（書き込みはここで止まる）
+                changed = set(changed_since(cursor, caught_up_id, caught_up_at))
+                ordered = sorted(changed)
+                for start in range(0, len(ordered), batch_size):
+                    image_ids = ordered[start : start + batch_size]
+                    embed(image_ids, segment_rows(cursor, image_ids))
+                cursor.execute(
+                    """
+                    SELECT v.image_id, v.slot FROM image_vector v
+                    JOIN image i ON i.id = v.image_id
+                    WHERE i.has_vector = 1
+                """
+                )
+                live = {
+                    vector_id(image_id, slot)
+                    for image_id, slot in cursor.fetchall()
+                    if slot in shadow.get(image_id, {})
+                }
+
+                self.persistence.swap(index, shadow_path)
+                # 差し替え後の差分は新しい index の WAL に書かれる
+                self.persistence.remove(
+                    vid
+                    for vid in ids.tolist()
+                    if vid not in live or (vid & IMAGE_ID_MASK) in changed
+                )
+                added, added_vectors = stack(
+                    [
+                        (image_id, slot)
+                        for image_id in ordered
+                        for slot in shadow.get(image_id, {})
+                        if vector_id(image_id, slot) in live
+                    ]
+                )
+                if len(added):
+                    self.persistence.add(added, added_vectors)
+                cursor.execute(
+                    "UPDATE image SET embedding_model = ? WHERE has_vector = 1",
+                    (model_name,),
+                )
+                cursor.executemany(
+                    "INSERT OR REPLACE INTO index_meta (key, value) VALUES (?, ?)",
+                    [("embedding_model", model_name), ("dimension", str(dimension))],
+                )
+                self.dimension = dimension
+                self.embedding_model = model_name
+                self.processer.set_embedding_model(model_name, embedder)
+
+        logger.info(
+            "Swapped in a %s index of %d vectors (%d images) from %s (%dd)",
+            index_kind(self.index),
+            len(live),
+            len(shadow),
+            model_name,
+            dimension,
+        )
+        if self.debate_index is not None:
+            # debate ベクトルも新しいモデルで作り直す（書き込みロックの外で）
+            self.debate_index.reset(dimension)
+            self.debate_index.notify()
+        return len(shadow)
+
+    def add_debate(self, tldr: str, summary: str) -> int:
+        """Add a new debate entry"""
+        with self.db.write() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO debate (tldr, summary)
+                VALUES (?, ?)
+            """,
+                (tldr, summary),
+            )
+        self._data_changed()
+        return cursor.lastrowid or 0  # Return 0 if None
+
+    def add_image(
+        self,
+        debate_id: int,
+        image_path: str,
+        vector: np.ndarray,
+        ocr_text: str,
+        description: str = "",
+        segments: Optional[Sequence[Tuple[str, str]]] = None,
+    ) -> int:
+        """Add a new image and its vectors
+
+        ``vector`` holds one row per entry of ``segments`` ((kind, text) pairs,
+        see ``image_segments``); without ``segments`` it is the single
+        description vector.
+        """
+        # FAISS への追加に失敗したら image の INSERT もロールバックされる
+        with self.db.write() as cursor:
+            # 次元の確認は writer を取ってから（reindex の差し替えと競合しない）
+            vector = self._normalize(vector)
+            segments = self._check_segments(segments, description, vector)
+            cursor.execute(
+                """
+                INSERT INTO image
+                    (debate_id, image_path, ocr, description, has_vector, embedding_model)
+                VALUES (?, ?, ?, ?, 1, ?)
+            """,
+                (debate_id, image_path, ocr_text, description, self.embedding_model),
+            )
+            image_id = cursor.lastrowid
+            vector_ids, _ = self._store_segments(cursor, image_id, segments)
+
+            # Add the vectors to the FAISS index under the image id (and slot)
+            # index 全体は書き出さず WAL に追記する（スナップショットはバックグラウンド）
+            self.persistence.add(vector_ids, vector)
+        self._schedule_rebuild()
+        self._data_changed()
 
         return image_id or 0  # Return 0 if None
 
+    def _normalize(self, vectors) -> np.ndarray:
+        """(n, dimension) float32 rows with unit L2 norm"""
+        vectors = np.array(vectors, dtype=np.float32)
+        vectors = vectors.reshape(-1, vectors.shape[-1])
+        if vectors.shape[1] != self.dimension:
+            # 再埋め込みで index が差し替わる前に作られたベクトル
+            raise ValueError(
+                f"Vector has {vectors.shape[1]} dimensions, the index has {self.dimension}"
+            )
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)  # L2ノルムを 1 に正規化
+        return vectors
+
+    @staticmethod
+    def _check_segments(
+        segments: Optional[Sequence[Tuple[str, str]]], description: str, vectors: np.ndarray
+    ) -> List[Tuple[str, str]]:
+        segments = list(segments) if segments else [("description", description or "")]
+        if len(segments) != len(vectors):
+            raise ValueError(f"{len(vectors)} vectors for {len(segments)} segments")
+        return segments
+
+    def _store_segments(
+        self, cursor, image_id: int, segments: Sequence[Tuple[str, str]]
+    ) -> Tuple[List[int], List[int]]:
+        """Replace the image_vector rows of an image
+
+        Returns the FAISS IDs of the new vectors and those of old slots that
+        no longer exist.
+        """
+        cursor.execute("SELECT slot FROM image_vector WHERE image_id = ?", (image_id,))
+        old_slots = [row[0] for row in cursor.fetchall()]
+        cursor.execute("DELETE FROM image_vector WHERE image_id = ?", (image_id,))
+        cursor.executemany(
+            "INSERT INTO image_vector (image_id, slot, kind, text) VALUES (?, ?, ?, ?)",
+            [(image_id, slot, kind, text) for slot, (kind, text) in enumerate(segments)],
+        )
+        vector_ids = [vector_id(image_id, slot) for slot in range(len(segments))]
+        stale = [vector_id(image_id, slot) for slot in old_slots if slot >= len(segments)]
+        return vector_ids, stale
+
+    def add_images(
+        self,
+        records: Sequence[Tuple[int, str, str, str, Optional[str]]],
+        vectors: np.ndarray,
+        segments: Optional[Sequence[Sequence[Tuple[str, str]]]] = None,
+    ) -> List[int]:
+        """Add (debate_id, image_path, ocr, description, content_hash) rows with their vectors
+
+        ``segments`` gives the (kind, text) list of each record, and
+        ``vectors`` their rows one record after another; without it there is
+        one description vector per record. One SQLite transaction and one
+        FAISS add for the whole batch.
+        """
+        with self.db.write() as cursor:
+            vectors = self._normalize(vectors)
+            if segments is None:
+                segments = [[("description", record[3] or "")] for record in records]
+            if sum(len(s) for s in segments) != len(vectors):
+                raise ValueError(
+                    f"{len(vectors)} vectors for {sum(len(s) for s in segments)} segments"
+                )
+            image_ids, vector_ids = [], []
+            for record, record_segments in zip(records, segments):
+                debate_id, image_path, ocr_text, description, content_hash = record
+                cursor.execute(
+                    """
+                    INSERT INTO image (
+                        debate_id, image_path, ocr, description, content_hash,
+                        has_vector, embedding_model
+                    )
+                    VALUES (?, ?, ?, ?, ?, 1, ?)
+                """,
+                    (
+                        debate_id,
+                        image_path,
+                        ocr_text,
+                        description,
+                        content_hash,
+                        self.embedding_model,
+                    ),
+                )
+                image_ids.append(cursor.lastrowid)
+                ids, _ = self._store_segments(cursor, cursor.lastrowid, record_segments)
+                vector_ids += ids
+            self.persistence.add(vector_ids, vectors)
+        self._schedule_rebuild()
+        self._data_changed()
+        return image_ids
+
+    def get_indexed_content_hashes(self, content_hashes: Iterable[str]) -> set:
+        """The subset of ``content_hashes`` that already has an indexed image"""
+        content_hashes = list(content_hashes)
+        indexed = set()
+        with self.db.read() as cursor:
+            # SQLite のバインド変数の上限を超えないように分割する
+            for start in range(0, len(content_hashes), 500):
+                chunk = content_hashes[start : start + 500]
+                cursor.execute(
+                    f"""
+                    SELECT DISTINCT content_hash FROM image
+                    WHERE has_vector = 1 AND content_hash IN ({",".join("?" * len(chunk))})
+                """,
+                    chunk,
+                )
+                indexed.update(row[0] for row in cursor.fetchall())
+        return indexed
+
+    def attach_vector(
+        self,
+        image_id: int,
+        vector: np.ndarray,
+        ocr_text: str,
+        description: str = "",
+        segments: Optional[Sequence[Tuple[str, str]]] = None,
+    ):
+        """Attach vectors (and OCR entities / description) to an existing image row
+
+        ``vector`` and ``segments`` are as for ``add_image``.
+        """
+        with self.db.write() as cursor:
+            vector = self._normalize(vector)
+            segments = self._check_segments(segments, description, vector)
+            cursor.execute(
+                """
+                UPDATE image
+                SET ocr = ?, description = ?, has_vector = 1, embedding_model = ?,
+                    updated_at = datetime('now')
+                WHERE id = ?
+            """,
+                (ocr_text, description, self.embedding_model, image_id),
+            )
+            vector_ids, stale = self._store_segments(cursor, image_id, segments)
+            # 再処理されたジョブでも同じ ID のベクトルが重複しないように置き換える
+            if stale:
+                self.persistence.remove(stale)
+            self.persistence.upsert(vector_ids, vector)
+        self._schedule_rebuild()
+        self._data_changed()
+
     def process_and_add_image(self, debate_id: int, image_path: str) -> int:
         """Process image with embedder and add to store"""
-        print(f"Processing image for debate_id={debate_id}, with path={image_path}")
+        debate_id, db_path, processing_path = self._prepare_image(
+            debate_id, image_path
+        )
+
+        try:
+            # Process image using the full file path for file system access
+            logger.info("Processing image with Mistral API...")
+            image_data = self.processer.process_image(processing_path)
+        except Exception as e:
+            logger.exception("Error processing image: %s", e)
+            image_data = None
+
+        return self._store_processed_image(debate_id, db_path, image_data)
+
+    async def aprocess_and_add_image(self, debate_id: int, image_path: str) -> int:
+        """process_and_add_image without blocking the event loop on Mistral/Stella/SQLite"""
+        debate_id, db_path, processing_path = await asyncio.to_thread(
+            self._prepare_image, debate_id, image_path
+        )
+
+        try:
+            logger.info("Processing image with Mistral API...")
+            image_data = await self.processer.aprocess_image(processing_path)
+        except Exception as e:
+            logger.exception("Error processing image: %s", e)
+            image_data = None
+
+        return await asyncio.to_thread(
+            self._store_processed_image, debate_id, db_path, image_data
+        )
+
+    def _prepare_image(self, debate_id: int, image_path: str) -> Tuple[int, str, str]:
+        """Validate the debate and resolve (debate_id, db_path, processing_path)"""
+        logger.info("Processing image for debate_id=%s, with path=%s", debate_id, image_path)
 
         # Make sure debate_id is valid and convert to int if needed
         try:
             debate_id = int(debate_id)
         except (ValueError, TypeError):
-            print(f"WARNING: Invalid debate_id format: {debate_id}, converting to 0")
+            logger.warning("Invalid debate_id format: %s, converting to 0", debate_id)
             debate_id = 0
 
         if debate_id <= 0:
-            print(
-                f"WARNING: Invalid debate_id: {debate_id}, image may not be associated correctly"
+            logger.warning(
+                "Invalid debate_id: %d, image may not be associated correctly", debate_id
             )
         else:
             # Verify debate exists
-            self.cursor.execute("SELECT id FROM debate WHERE id = ?", (debate_id,))
-            debate = self.cursor.fetchone()
-            if not debate:
-                print(f"WARNING: Debate with ID {debate_id} does not exist in database")
+            if not self.debate_exists(debate_id):
+                logger.warning("Debate with ID %d does not exist in database", debate_id)
                 # Attempt to get the latest valid debate_id
-                self.cursor.execute("SELECT id FROM debate ORDER BY id DESC LIMIT 1")
-                latest_debate = self.cursor.fetchone()
-                if latest_debate:
-                    new_debate_id = latest_debate[0]
-                    print(
-                        f"Using latest debate ID {new_debate_id} instead of {debate_id}"
+                new_debate_id = self.get_latest_debate_id()
+                if new_debate_id:
+                    logger.warning(
+                        "Using latest debate ID %d instead of %d", new_debate_id, debate_id
                     )
                     debate_id = new_debate_id
 
@@ -142,32 +817,36 @@ class VectorStore:
             db_path = db_path[4:]
 
         # For file system access, construct the full path
-        # If the path doesn't include 'src/' but should, add it
-        if not db_path.startswith("src/"):
-            processing_path = f"src/{db_path}"
+        # Uploads live in uploads_dir; other paths are relative to src/
+        upload_path = upload_file_path(db_path, self.uploads_dir)
+        if upload_path is not None:
+            processing_path = str(upload_path)
         else:
-            processing_path = db_path
+            processing_path = f"src/{db_path}"
 
-        print(f"Original image_path: {image_path}")
-        print(f"Database path: {db_path}")
-        print(f"Processing path: {processing_path}")
+        logger.debug(
+            "Original image_path: %s, database path: %s, processing path: %s",
+            image_path,
+            db_path,
+            processing_path,
+        )
 
         # Verify the file exists
         if not os.path.exists(processing_path):
-            print(
-                f"WARNING: Image file not found at {processing_path}, trying alternative paths"
+            logger.warning(
+                "Image file not found at %s, trying alternative paths", processing_path
             )
             # Try some alternative paths
             alt_paths = [
                 processing_path,
                 db_path,
-                f"src/static/uploads/{os.path.basename(db_path)}",
+                str(self.uploads_dir / os.path.basename(db_path)),
                 f"static/uploads/{os.path.basename(db_path)}",
             ]
 
             for path in alt_paths:
                 if os.path.exists(path):
-                    print(f"Found file at alternative path: {path}")
+                    logger.info("Found file at alternative path: %s", path)
                     processing_path = path
                     break
             else:
@@ -176,117 +855,439 @@ class VectorStore:
                 )
 
         file_size = os.path.getsize(processing_path)
-        print(f"File size: {file_size} bytes")
+        logger.debug("File size: %d bytes", file_size)
 
         if file_size == 0:
             raise ValueError(f"Image file is empty: {processing_path}")
 
+        return debate_id, db_path, processing_path
+
+    def _store_processed_image(
+        self, debate_id: int, db_path: str, image_data: Optional[ImageData]
+    ) -> int:
+        """Save the image record (with its vector if processing succeeded)"""
         # Even if image processing fails, we always want to add the basic record to ensure
         # the image path is saved in the database and associated with the debate
         image_id = None
 
         try:
-            # Process image using the full file path for file system access
-            print(f"Processing image with Mistral API...")
-            image_data = self.processer.process_image(processing_path)
-            print(
-                f"Image processing successful. Description: {image_data.description if hasattr(image_data, 'description') else 'No description'}..."
+            if image_data is None:
+                raise ValueError("Image processing failed")
+            logger.debug(
+                "Image processing successful. Description: %s...",
+                getattr(image_data, "description", "No description"),
             )
 
             # Add the image with vector embedding
             image_id = self.add_image(
                 debate_id=debate_id,
                 image_path=db_path,  # Use the standardized path for storage
-                vector=image_data.description_feats,
+                vector=(
+                    image_data.segment_feats
+                    if image_data.segment_feats is not None
+                    else image_data.description_feats
+                ),
                 ocr_text=(
                     ", ".join(image_data.ocr) if hasattr(image_data, "ocr") else ""
                 ),
+                description=image_data.description,
+                segments=image_data.segments or None,
             )
-            print(f"Added image with vector embedding, image_id={image_id}")
+            logger.info("Added image with vector embedding, image_id=%d", image_id)
 
         except Exception as e:
-            import traceback
-
-            print(f"Error processing image: {str(e)}")
-            traceback.print_exc()
+            logger.error("Error adding image: %s", e)
 
             # Always save a basic record even if processing fails
-            self.cursor.execute(
+            image_id = self.add_image_record(debate_id, db_path)
+
+            logger.warning(
+                "Failed to process image with Mistral API, but saved basic record "
+                "with image_id=%s, debate_id=%d",
+                image_id,
+                debate_id,
+            )
+
+        # Double-check the association
+        if image_id:
+            self.ensure_image_debate(image_id, debate_id)
+
+        return image_id or 0  # Ensure we always return an integer
+
+    def add_image_record(
+        self,
+        debate_id: int,
+        image_path: str,
+        ocr_text: str = "",
+        content_hash: Optional[str] = None,
+        phash: Optional[int] = None,
+    ) -> int:
+        """Add an image row without a vector"""
+        with self.db.write() as cursor:
+            cursor.execute(
                 """
-                INSERT INTO image (debate_id, image_path, ocr)
-                VALUES (?, ?, ?)
+                INSERT INTO image (debate_id, image_path, ocr, content_hash, phash)
+                VALUES (?, ?, ?, ?, ?)
             """,
-                (debate_id, db_path, ""),
+                (debate_id, image_path, ocr_text, content_hash, phash),
             )
+        return cursor.lastrowid or 0
 
-            image_id = self.cursor.lastrowid
-            self.conn.commit()
+    def find_reusable_image(
+        self, image_id: int, near_duplicate_distance: int = 0
+    ) -> Optional[int]:
+        """An already indexed image whose results can be reused for ``image_id``
 
-            print(
-                f"Failed to process image with Mistral API, but saved basic record with image_id={image_id}, debate_id={debate_id}"
+        Matches on the content hash first; if ``near_duplicate_distance`` > 0,
+        also on a perceptual hash within that Hamming distance (re-shot boards).
+        """
+        with self.db.read() as cursor:
+            cursor.execute(
+                "SELECT content_hash, phash FROM image WHERE id = ?", (image_id,)
             )
-
-        # Double-check the association
-        if image_id:
-            self.cursor.execute("SELECT debate_id FROM image WHERE id = ?", (image_id,))
-            result = self.cursor.fetchone()
-            if result and result[0] != debate_id:
-                print(
-                    f"WARNING: Image {image_id} is associated with debate {result[0]}, not {debate_id}"
-                )
-                self.cursor.execute(
-                    "UPDATE image SET debate_id = ? WHERE id = ?", (debate_id, image_id)
-                )
-                self.conn.commit()
-                print(
-                    f"Fixed: Image {image_id} is now associated with debate {debate_id}"
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            content_hash, phash = row
+
+            if content_hash is not None:
+                cursor.execute(
+                    """
+                    SELECT id FROM image
+                    WHERE content_hash = ? AND has_vector = 1 AND id != ?
+                    ORDER BY id DESC LIMIT 1
+                """,
+                    (content_hash, image_id),
                 )
+                match = cursor.fetchone()
+                if match is not None:
+                    return match[0]
 
-        return image_id or 0  # Ensure we always return an integer
+            if near_duplicate_distance <= 0 or phash is None:
+                return None
+            cursor.execute(
+                """
+                SELECT id, phash FROM image
+                WHERE phash IS NOT NULL AND has_vector = 1 AND id != ?
+            """,
+                (image_id,),
+            )
+            candidates = cursor.fetchall()
+
+        if not candidates:
+            return None
+        ids = np.array([c[0] for c in candidates], dtype=np.int64)
+        hashes = np.array([c[1] for c in candidates], dtype=np.int64)
+        # 64 bit の XOR のビット数 = ハミング距離
+        diff = (hashes ^ np.int64(phash)).view(np.uint8).reshape(-1, 8)
+        distances = np.unpackbits(diff, axis=1).sum(axis=1)
+        best = int(np.argmin(distances))
+        if distances[best] > near_duplicate_distance:
+            return None
+        return int(ids[best])
+
+    def copy_processed_image(self, source_id: int, image_id: int) -> bool:
+        """Give ``image_id`` the OCR entities, description and vectors of ``source_id``"""
+        with self.db.read() as cursor:
+            cursor.execute(
+                "SELECT ocr, description FROM image WHERE id = ?", (source_id,)
+            )
+            row = cursor.fetchone()
+            cursor.execute(
+                "SELECT slot, kind, text FROM image_vector WHERE image_id = ? ORDER BY slot",
+                (source_id,),
+            )
+            segments = cursor.fetchall()
+        if row is None or not segments:
+            return False
+        vectors = [self.persistence.get(vector_id(source_id, slot)) for slot, _, _ in segments]
+        if any(vector is None for vector in vectors):
+            return False
+        self.attach_vector(
+            image_id,
+            np.stack(vectors),
+            row[0] or "",
+            row[1] or "",
+            segments=[(kind, text) for _, kind, text in segments],
+        )
+        return True
+
+    def ensure_image_debate(self, image_id: int, debate_id: int):
+        """Re-associate an image with ``debate_id`` if it points elsewhere"""
+        with self.db.write() as cursor:
+            cursor.execute("SELECT debate_id FROM image WHERE id = ?", (image_id,))
+            result = cursor.fetchone()
+            if result is None or result[0] == debate_id:
+                return
+            logger.warning(
+                "Image %d is associated with debate %d, not %d",
+                image_id,
+                result[0],
+                debate_id,
+            )
+            cursor.execute(
+                "UPDATE image SET debate_id = ? WHERE id = ?", (debate_id, image_id)
+            )
+        self._data_changed()
+        logger.info("Fixed: Image %d is now associated with debate %d", image_id, debate_id)
+
+    def update_image_path(self, image_id: int, image_path: str):
+        with self.db.write() as cursor:
+            cursor.execute(
+                "UPDATE image SET image_path = ? WHERE id = ?", (image_path, image_id)
+            )
 
     def search(
-        self, query_vector: np.ndarray, k: int = 5
+        self,
+        query_vector: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
     ) -> List[Tuple[str, float, str, str]]:
-        """Search for similar images and return their details"""
-        if isinstance(query_vector, list):
-            query_vector = np.array(query_vector, dtype=np.float32)
+        """Search for similar images and return their details
 
-        query_vector /= np.linalg.norm(
-            query_vector, axis=1, keepdims=True
-        )  # L2ノルムを 1 に正規化
-        query_vector = query_vector.reshape(1, -1)
+        ``nprobe`` (IVF) and ``ef_search`` (HNSW) override the configured
+        speed/recall trade-off for this query only. With ``search_filter``,
+        only images matching it are searched.
+        """
+        query_vectors = np.asarray(query_vector, dtype=np.float32).reshape(1, -1)
+        return self.search_many(query_vectors, k, nprobe, ef_search, search_filter)[0]
+
+    async def asearch(
+        self,
+        query_vector: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[Tuple[str, float, str, str]]:
+        """search on the shared executor (FAISS scan and result lookup)"""
+        return await run_in_stage(
+            "search", self.search, query_vector, k, nprobe, ef_search, search_filter
+        )
 
-        # Search using FAISS - lower distance is better match
-        # FAISS search params: x=query_vector, k=k (number of results)
-        distances, indices = self.index.search(query_vector, k)
+    def search_many(
+        self,
+        query_vectors: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[List[Tuple[str, float, str, str]]]:
+        """search for each row of ``query_vectors`` (n, d)
+
+        One ``index.search`` over the whole matrix and one SQL query for the
+        details of every hit.
+        """
+        if len(query_vectors) == 0:
+            return []
+        return self._fetch_results(
+            self._search_ids(query_vectors, k, nprobe, ef_search, search_filter)
+        )
 
-        results = []
-        for distance, faiss_idx in zip(distances[0], indices[0]):
-            if faiss_idx < 0:  # FAISS returns -1 for not enough results
-                continue
+    async def asearch_many(
+        self,
+        query_vectors: np.ndarray,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[List[Tuple[str, float, str, str]]]:
+        """search_many on the shared executor"""
+        return await run_in_stage(
+            "search",
+            self.search_many,
+            query_vectors,
+            k,
+            nprobe,
+            ef_search,
+            search_filter,
+        )
 
-            faiss_idx = int(faiss_idx)
+    def _filter_selection(
+        self, search_filter: SearchFilter
+    ) -> Tuple[np.ndarray, Optional[faiss.IDSelector]]:
+        """FAISS IDs of every vector of the matching images, and a selector over them
 
-            image_id = self.faiss_to_image_id[faiss_idx]
-            self.cursor.execute(
-                """
-                SELECT i.image_path, i.ocr, d.tldr, d.summary
+        The selector is None when there are at most FILTER_BRUTE_FORCE IDs
+        (they are scored directly). Both are cached per filter until the
+        next write.
+        """
+        key = (str(self._data_generation), search_filter.cache_key())
+        cached = self._filter_cache.get(key)
+        if cached is not None:
+            return cached
+        where, params = search_filter.where("i")
+        with self.db.read() as cursor:
+            cursor.execute(
+                f"""
+                SELECT (v.slot << ?) | v.image_id FROM image_vector v
+                JOIN image i ON i.id = v.image_id
+                WHERE i.has_vector = 1 AND {where}
+            """,
+                [SEGMENT_SHIFT] + params,
+            )
+            ids = np.array([row[0] for row in cursor.fetchall()], dtype=np.int64)
+        # ID は疎（slot << 40）なのでビットマップではなくハッシュ集合の IDSelectorBatch
+        selector = faiss.IDSelectorBatch(ids) if len(ids) > FILTER_BRUTE_FORCE else None
+        self._filter_cache.set(key, (ids, selector))
+        return ids, selector
+
+    def _search_ids(
+        self,
+        query_vectors: np.ndarray,
+        k: int,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+        search_filter: Optional[SearchFilter] = None,
+    ) -> List[List[Tuple[int, float]]]:
+        """FAISS-only part of search: the best ``k`` images by max-sim over their vectors
+
+        Returns, for each query row, (image_id, score) pairs best first.
+        """
+        query_vectors = np.array(query_vectors, dtype=np.float32).reshape(
+            len(query_vectors), -1
+        )
+        query_vectors /= np.linalg.norm(
+            query_vectors, axis=1, keepdims=True
+        )  # L2ノルムを 1 に正規化
+        selection = None
+        if search_filter is not None and not search_filter.is_empty():
+            selection = self._filter_selection(search_filter)
+
+        n_queries = len(query_vectors)
+        best: List[Dict[int, float]] = [{} for _ in range(n_queries)]
+        # Search using FAISS - lower distance is better match
+        # FAISS search params: x=query_vectors, k=k (number of results)
+        # 検索同士は並行に走り、add / remove とだけ排他になる
+        with self.persistence.lock.read():
+            index = self.index
+            if query_vectors.shape[1] != index.d:
+                # reindex の差し替え直前に旧モデルで埋め込まれたクエリ
+                logger.warning(
+                    "Query vector has %d dimensions, the index has %d",
+                    query_vectors.shape[1],
+                    index.d,
+                )
+                return [[] for _ in range(n_queries)]
+            available = index.ntotal
+            sel = None
+            if selection is not None:
+                ids, sel = selection
+                available = len(ids)
+                if sel is None or index_kind(index) == "binary":
+                    # 対象が少ない（または binary で sel が使えない）ときは全件と内積を取る
+                    with FAISS_SEARCH_SECONDS.time(index="images", method="exact"):
+                        best = self._score_ids(index, query_vectors, ids)
+                    available, sel = 0, None
+                else:
+                    # 対象の割合が小さいほど探索範囲を広げる（IVF のセル数・HNSW の候補数）
+                    widen = index.ntotal / max(available, 1)
+                    nprobe = nprobe or math.ceil(self.index_config.nprobe * widen)
+                    ef_search = ef_search or min(
+                        math.ceil(self.index_config.ef_search * widen),
+                        self.index_config.ef_search * 16,
+                    )
+            params = search_parameters(index, self.index_config, nprobe, ef_search, sel)
+            # 1 画像が複数ヒットしうるので多めに引き、画像ごとの最大値で k 件に絞る
+            # k 件に届かなかったクエリだけ引き直す
+            fetch = min(k * SEARCH_OVERSAMPLE, available)
+            pending = list(range(n_queries))
+            while pending and fetch > 0:
+                with FAISS_SEARCH_SECONDS.time(index="images", method="ann"):
+                    distances, indices = index.search(
+                        query_vectors[pending], fetch, params=params
+                    )
+                short = []
+                for row, row_distances, row_indices in zip(
+                    pending, distances.tolist(), indices.tolist()
+                ):
+                    hits: Dict[int, float] = {}
+                    for distance, vid in zip(row_distances, row_indices):
+                        if vid < 0:  # FAISS returns -1 for not enough results
+                            continue
+                        image_id = vid & IMAGE_ID_MASK
+                        if distance > hits.get(image_id, -np.inf):
+                            hits[image_id] = distance
+                    best[row] = hits
+                    if len(hits) < k and fetch < available:
+                        short.append(row)
+                pending = short
+                fetch = min(fetch * SEARCH_OVERSAMPLE, available)
+
+        return [
+            sorted(hits.items(), key=lambda item: item[1], reverse=True)[:k]
+            for hits in best
+        ]
+
+    def _score_ids(
+        self, index: faiss.Index, query_vectors: np.ndarray, ids: np.ndarray
+    ) -> List[Dict[int, float]]:
+        """Exact max-sim per image over the vectors ``ids`` for each query (brute force)"""
+        # HNSW の tombstone は rev_map に残っていて reconstruct できてしまう
+        ids = ids[self.persistence.live_mask(ids)]
+        if len(ids) == 0:
+            return [{} for _ in range(len(query_vectors))]
+        try:
+            vectors = index.reconstruct_batch(ids)
+        except RuntimeError:
+            # キャッシュ後に消えたベクトルがある
+            present = [vid for vid in ids.tolist() if self.persistence.contains(vid)]
+            ids = np.array(present, dtype=np.int64)
+            if not present:
+                return [{} for _ in range(len(query_vectors))]
+            vectors = index.reconstruct_batch(ids)
+        image_ids, owner = np.unique(ids & IMAGE_ID_MASK, return_inverse=True)
+        scores = np.full((len(image_ids), len(query_vectors)), -np.inf, dtype=np.float32)
+        np.maximum.at(scores, owner, vectors @ query_vectors.T)
+        image_ids = image_ids.tolist()
+        return [dict(zip(image_ids, column)) for column in scores.T.tolist()]
+
+    def _fetch_results(
+        self, hits: List[List[Tuple[int, float]]]
+    ) -> List[List[Tuple[str, float, str, str]]]:
+        """(image_path, score, ocr, tldr) for the hits of each query"""
+        image_ids = list({image_id for query_hits in hits for image_id, _ in query_hits})
+        if not image_ids:
+            return [[] for _ in hits]
+
+        # ヒットごとに JOIN せず 1 回の IN クエリでまとめて引く
+        placeholders = ",".join("?" * len(image_ids))
+        with self.db.read() as cursor:
+            cursor.execute(
+                f"""
+                SELECT i.id, i.image_path, i.ocr, d.tldr
                 FROM image i
                 LEFT JOIN debate d ON i.debate_id = d.id
-                WHERE i.id = ?
+                WHERE i.id IN ({placeholders})
             """,
-                (image_id,),
+                image_ids,
             )
-            image_path, ocr, tldr, summary = self.cursor.fetchone()
-            results.append((image_path, float(distance), ocr, tldr))
+            rows = {row[0]: row[1:] for row in cursor.fetchall()}
 
+        results = []
+        for query_hits in hits:
+            query_results = []
+            for image_id, distance in query_hits:
+                row = rows.get(image_id)
+                if row is None:  # SQL に反映される前に落ちた場合の孤立ベクトル
+                    continue
+                image_path, ocr, tldr = row
+                query_results.append((image_path, float(distance), ocr, tldr))
+            results.append(query_results)
         return results
 
     def search_by_text(
-        self, query_text: str, k: int = 5
+        self,
+        query_text: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
     ) -> List[Tuple[str, float, str, str]]:
         """Search using text query that will be embedded using Stella and compared with image embeddings"""
-        print(f"Performing embedding-based search for: '{query_text}'")
+        logger.debug("Performing embedding-based search for: '%s'", query_text)
+        translated_instruction = query_text
 
         try:
             # Embed the query text using Stella via the Processer
@@ -295,171 +1296,643 @@ class VectorStore:
             )
             translated_instruction = instruction_data.instruction
             query_embedding = instruction_data.instruction_feats
-            print(f"Translated instruction: {translated_instruction}")
-            print(f"Generated query embedding with shape: {query_embedding.shape}")
+            logger.debug(
+                "Translated instruction: %s (embedding shape %s)",
+                translated_instruction,
+                query_embedding.shape,
+            )
 
             # Use the standard FAISS search with the query embedding
             return translated_instruction, self.search(
-                query_vector=query_embedding, k=k
+                query_vector=query_embedding, k=k, nprobe=nprobe, ef_search=ef_search
             )
 
         except Exception as e:
-            print(f"Error during embedding-based search: {str(e)}")
-            print("Falling back to text-based matching...")
+            logger.warning(
+                "Error during embedding-based search: %s; falling back to text-based matching",
+                e,
+            )
 
             # Fall back to simple text matching if embedding fails
             return translated_instruction, self._text_based_search_fallback(
                 translated_instruction, k
             )
 
+    async def asearch_by_text(
+        self,
+        query_text: str,
+        k: int = 5,
+        nprobe: Optional[int] = None,
+        ef_search: Optional[int] = None,
+    ) -> List[Tuple[str, float, str, str]]:
+        """search_by_text without blocking the event loop on Mistral/Stella/FAISS"""
+        logger.debug("Performing embedding-based search for: '%s'", query_text)
+        translated_instruction = query_text
+
+        try:
+            instruction_data: InstructionData = (
+                await self.processer.aprocess_instruction(query_text)
+            )
+            translated_instruction = instruction_data.instruction
+            logger.debug("Translated instruction: %s", translated_instruction)
+
+            return translated_instruction, await self.asearch(
+                query_vector=instruction_data.instruction_feats,
+                k=k,
+                nprobe=nprobe,
+                ef_search=ef_search,
+            )
+
+        except Exception as e:
+            logger.warning(
+                "Error during embedding-based search: %s; falling back to text-based matching",
+                e,
+            )
+
+            return translated_instruction, await run_in_stage(
+                "search", self._text_based_search_fallback, translated_instruction, k
+            )
+
     def _text_based_search_fallback(
         self, query_text: str, k: int = 5
     ) -> List[Tuple[str, float, str, str]]:
-        """Fallback search using simple text matching when embeddings fail"""
-        query_lower = query_text.lower()
+        """Fallback search over the FTS5 index when embeddings fail"""
+        results = [
+            (image_path, 1.0 - self._bm25_similarity(score), ocr or "", tldr)
+            for image_path, score, ocr, tldr in self.lexical_search_images(
+                query_text, limit=k
+            )
+        ]
+        logger.debug("Found %d matches using text fallback", len(results))
+        return results
 
-        # Get all images with their debates
-        self.cursor.execute(
-            """
-            SELECT 
-                i.id, i.image_path, i.ocr, 
-                d.id, d.tldr, d.summary
-            FROM image i
-            LEFT JOIN debate d ON i.debate_id = d.id
+    @staticmethod
+    def _fts_terms(*texts: str) -> List[str]:
+        """Query terms, lower-cased and de-duplicated (unicode61 splits on non-word chars)"""
+        terms = []
+        for text in texts:
+            for term in re.findall(r"\w+", (text or "").lower()):
+                if len(term) >= 2 and term not in terms:
+                    terms.append(term)
+        return terms[:32]
+
+    def _fts_query(self, cursor, table: str, terms: List[str]) -> Optional[str]:
+        """FTS5 MATCH expression for any of ``terms``
+
+        Terms found in more than MAX_TERM_DOCS documents are dropped: they
+        barely change the BM25 ranking but every matching document has to be
+        scored. Non-ASCII terms are prefix queries, since unicode61 keeps e.g.
+        a Japanese phrase as one token. Returns None if no term is left.
         """
+        selected = []
+        for term in terms:
+            doc_count = self._term_doc_counts.get((table, term))
+            if doc_count is None:
+                cursor.execute(f"SELECT doc FROM {table}_vocab WHERE term = ?", (term,))
+                row = cursor.fetchone()
+                doc_count = row[0] if row else 0
+                self._term_doc_counts.set((table, term), doc_count)
+            if doc_count <= MAX_TERM_DOCS:
+                selected.append(term)
+        if not selected:
+            return None
+        return " OR ".join(
+            f'"{term}"' if term.isascii() else f'"{term}" *' for term in selected
         )
 
-        results = []
-        for img_id, img_path, ocr, debate_id, tldr, summary in self.cursor.fetchall():
-            # Skip if any critical field is missing
-            if not all([img_path, debate_id, tldr]):
-                continue
-
-            # Combine all text fields for searching
-            all_text = f"{tldr} {summary or ''} {ocr or ''}".lower()
-
-            # Calculate a simple score based on word matches
-            query_words = set(query_lower.split())
-
-            # Simple cosine similarity approximation
-            # Count matching words
-            matching_words = 0
-            for word in query_words:
-                if word in all_text:
-                    matching_words += 1
-
-            # Only include if there's at least one match
-            if matching_words > 0:
-                # Calculate a similarity score (0 to 1)
-                # This is a simplified version of cosine similarity
-                text_words = len(set(all_text.split()))
-                if text_words > 0:
-                    # Jaccard similarity (intersection over union)
-                    score = matching_words / (
-                        len(query_words) + text_words - matching_words
-                    )
-                else:
-                    score = 0.0
-
-                # Convert to a distance metric (lower is better)
-                distance = 1.0 - score
-
-                print(f"Match for '{tldr}': score={score:.4f}, distance={distance:.4f}")
+    @staticmethod
+    def _bm25_similarity(score: float) -> float:
+        """Map an FTS5 bm25() value (negative, lower is better) to [0, 1)"""
+        relevance = max(0.0, -score)
+        return relevance / (1.0 + relevance)
 
-                results.append((img_path, distance, ocr or "", tldr))
+    def lexical_search_images(
+        self, *texts: str, limit: int = LEXICAL_LIMIT
+    ) -> List[Tuple[str, float, str, str]]:
+        """Images ranked by BM25 over their OCR / description and their debate's text
 
-        # Sort by distance (lower is better)
-        results.sort(key=lambda x: x[1])
+        Returns (image_path, bm25, ocr, tldr); lower bm25 is better.
+        """
+        terms = self._fts_terms(*texts)
+        if not terms:
+            return []
+        with self.db.read() as cursor:
+            image_match = self._fts_query(cursor, "image_fts", terms)
+            debate_match = self._fts_query(cursor, "debate_fts", terms)
+            hits, params = [], []
+            if image_match is not None:
+                hits.append(
+                    """
+                    SELECT * FROM (
+                        SELECT rowid AS image_id, bm25(image_fts, 1.5, 1.0) AS score
+                        FROM image_fts WHERE image_fts MATCH ?
+                        ORDER BY score LIMIT ?
+                    )"""
+                )
+                params += [image_match, limit]
+            if debate_match is not None:
+                hits.append(
+                    """
+                    SELECT i.id, f.score FROM (
+                        SELECT rowid AS debate_id, bm25(debate_fts, 2.0, 1.0) AS score
+                        FROM debate_fts WHERE debate_fts MATCH ?
+                        ORDER BY score LIMIT ?
+                    ) f
+                    JOIN image i ON i.debate_id = f.debate_id"""
+                )
+                params += [debate_match, limit]
+            if not hits:
+                return []
+
+            cursor.execute(
+                f"""
+                SELECT i.image_path, MIN(hits.score) AS score, i.ocr, d.tldr
+                FROM ({" UNION ALL ".join(hits)}) hits
+                JOIN image i ON i.id = hits.image_id
+                JOIN debate d ON d.id = i.debate_id
+                WHERE d.tldr IS NOT NULL
+                GROUP BY i.id
+                ORDER BY score
+                LIMIT ?
+            """,
+                params + [limit],
+            )
+            return cursor.fetchall()
 
-        print(f"Found {len(results)} matches using text fallback")
+    def lexical_search_debates(
+        self, *texts: str, limit: int = LEXICAL_LIMIT
+    ) -> List[Tuple[int, float]]:
+        """Debates ranked by BM25 over tldr / summary and their images' OCR / description
 
-        # Return at most k results
-        return results[:k]
+        Returns (debate_id, bm25); lower bm25 is better.
+        """
+        terms = self._fts_terms(*texts)
+        if not terms:
+            return []
+        with self.db.read() as cursor:
+            debate_match = self._fts_query(cursor, "debate_fts", terms)
+            image_match = self._fts_query(cursor, "image_fts", terms)
+            hits, params = [], []
+            if debate_match is not None:
+                hits.append(
+                    """
+                    SELECT * FROM (
+                        SELECT rowid AS debate_id, bm25(debate_fts, 2.0, 1.0) AS score
+                        FROM debate_fts WHERE debate_fts MATCH ?
+                        ORDER BY score LIMIT ?
+                    )"""
+                )
+                params += [debate_match, limit]
+            if image_match is not None:
+                hits.append(
+                    """
+                    SELECT i.debate_id, f.score FROM (
+                        SELECT rowid AS image_id, bm25(image_fts, 1.5, 1.0) AS score
+                        FROM image_fts WHERE image_fts MATCH ?
+                        ORDER BY score LIMIT ?
+                    ) f
+                    JOIN image i ON i.id = f.image_id
+                    WHERE i.debate_id IS NOT NULL"""
+                )
+                params += [image_match, limit]
+            if not hits:
+                return []
+
+            cursor.execute(
+                f"""
+                SELECT debate_id, MIN(score) AS score
+                FROM ({" UNION ALL ".join(hits)})
+                GROUP BY debate_id
+                ORDER BY score
+                LIMIT ?
+            """,
+                params + [limit],
+            )
+            return cursor.fetchall()
 
     def get_debate(self, debate_id: int) -> Tuple[str, str, List[Tuple[str, str]]]:
         """Get debate details with all associated images"""
-        self.cursor.execute(
-            """
-            SELECT tldr, summary FROM debate WHERE id = ?
-        """,
-            (debate_id,),
-        )
-        tldr, summary = self.cursor.fetchone()
+        with self.db.read() as cursor:
+            cursor.execute(
+                """
+                SELECT tldr, summary FROM debate WHERE id = ?
+            """,
+                (debate_id,),
+            )
+            tldr, summary = cursor.fetchone()
 
-        self.cursor.execute(
-            """
-            SELECT image_path, ocr FROM image WHERE debate_id = ?
-        """,
-            (debate_id,),
-        )
-        images = self.cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT image_path, ocr FROM image WHERE debate_id = ?
+            """,
+                (debate_id,),
+            )
+            images = cursor.fetchall()
 
         return tldr, summary, images
 
+    def get_debate_detail(
+        self, debate_id: int
+    ) -> Optional[Tuple[int, str, str, str, Optional[str], Optional[str]]]:
+        """(id, tldr, summary, created_at, image_path, ocr) with the latest image, or None"""
+        with self.db.read() as cursor:
+            cursor.execute(
+                """
+                SELECT d.id, d.tldr, d.summary, d.created_at, i.image_path, i.ocr
+                FROM debate d
+                LEFT JOIN image i ON i.id = (
+                    SELECT MAX(id) FROM image WHERE debate_id = d.id
+                )
+                WHERE d.id = ?
+            """,
+                (debate_id,),
+            )
+            return cursor.fetchone()
+
+    def debate_exists(self, debate_id: int) -> bool:
+        with self.db.read() as cursor:
+            cursor.execute("SELECT 1 FROM debate WHERE id = ?", (debate_id,))
+            return cursor.fetchone() is not None
+
+    def get_latest_debate_id(self) -> Optional[int]:
+        """ID of the most recently created debate (None if there are none)"""
+        with self.db.read() as cursor:
+            cursor.execute("SELECT id FROM debate ORDER BY id DESC LIMIT 1")
+            row = cursor.fetchone()
+        return row[0] if row else None
+
     def get_debates(self) -> List[Tuple[int, str, str]]:
         """Get all debates"""
-        self.cursor.execute(
+        with self.db.read() as cursor:
+            cursor.execute(
+                """
+                SELECT id, tldr, summary FROM debate ORDER BY updated_at DESC
             """
-            SELECT id, tldr, summary FROM debate ORDER BY updated_at DESC
-        """
-        )
-        return self.cursor.fetchall()
+            )
+            return cursor.fetchall()
 
     def get_debates_with_images(self) -> List[Tuple[int, str, str, str]]:
         """Get all debates with creation timestamps"""
-        self.cursor.execute(
+        with self.db.read() as cursor:
+            cursor.execute(
+                """
+                SELECT id, tldr, summary, updated_at FROM debate ORDER BY updated_at DESC
             """
-            SELECT id, tldr, summary, updated_at FROM debate ORDER BY updated_at DESC
+            )
+            return cursor.fetchall()
+
+    def list_debates(
+        self,
+        limit: int = 50,
+        after: Optional[Tuple[str, int]] = None,
+        exclude_ids: Sequence[int] = (),
+    ) -> List[Tuple[int, str, str, str, Optional[int], Optional[str], Optional[str]]]:
+        """One page of debates, most recently updated first, with their latest image
+
+        Keyset pagination on (updated_at, id): pass the (updated_at, id) of the
+        last row of the previous page as ``after``. Returns (id, tldr, summary,
+        updated_at, image_id, image_path, ocr); the image columns are None for
+        debates without images.
         """
+        conditions, params = [], []
+        if after is not None:
+            conditions.append("(d.updated_at, d.id) < (?, ?)")
+            params += list(after)
+        if exclude_ids:
+            conditions.append(f"d.id NOT IN ({','.join('?' * len(exclude_ids))})")
+            params += list(exclude_ids)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self.db.read() as cursor:
+            cursor.execute(
+                f"""
+                SELECT d.id, d.tldr, d.summary, d.updated_at,
+                       i.id, i.image_path, i.ocr
+                FROM debate d
+                LEFT JOIN image i ON i.id = (
+                    SELECT MAX(id) FROM image WHERE debate_id = d.id
+                )
+                {where}
+                ORDER BY d.updated_at DESC, d.id DESC
+                LIMIT ?
+            """,
+                params + [limit],
+            )
+            return cursor.fetchall()
+
+    def get_debates_by_ids(
+        self, debate_ids: Sequence[int]
+    ) -> Dict[int, Tuple[int, str, str, str, Optional[int], Optional[str], Optional[str]]]:
+        """Rows like list_debates, only for ``debate_ids``"""
+        if not debate_ids:
+            return {}
+        placeholders = ",".join("?" * len(debate_ids))
+        with self.db.read() as cursor:
+            cursor.execute(
+                f"""
+                SELECT d.id, d.tldr, d.summary, d.updated_at,
+                       i.id, i.image_path, i.ocr
+                FROM debate d
+                LEFT JOIN image i ON i.id = (
+                    SELECT MAX(id) FROM image WHERE debate_id = d.id
+                )
+                WHERE d.id IN ({placeholders})
+            """,
+                list(debate_ids),
+            )
+            return {row[0]: row for row in cursor.fetchall()}
+
+    def get_debate_ids_for_images(self, image_paths: Iterable[str]) -> Dict[str, int]:
+        """image_path -> debate_id for a batch of image paths"""
+        image_paths = list(dict.fromkeys(image_paths))
+        if not image_paths:
+            return {}
+        placeholders = ",".join("?" * len(image_paths))
+        with self.db.read() as cursor:
+            cursor.execute(
+                f"""
+                SELECT image_path, debate_id FROM image
+                WHERE image_path IN ({placeholders}) AND debate_id IS NOT NULL
+            """,
+                image_paths,
+            )
+            return {image_path: debate_id for image_path, debate_id in cursor.fetchall()}
+
+    def score_debates(
+        self,
+        query: str,
+        search_results: List[Tuple[str, float, str, str]],
+        minimum_score: float = 0.0,
+        original_query: Optional[str] = None,
+        debate_ranking: Optional[Sequence[int]] = None,
+    ) -> List[Tuple[int, str, str, str, Optional[str], float]]:
+        """Fuse image search hits with FTS5 matches into a ranking of the matched debates
+
+        The vector ranking (best image hit per debate, or ``debate_ranking``
+        from ``rank_debates`` if given) and the BM25 ranking are combined
+        with Reciprocal Rank Fusion; the score is scaled so a debate ranked
+        first by both is 1.0. ``original_query`` (the untranslated text) is
+        matched lexically as well.
+
+        Returns (id, tldr, summary, updated_at, image_path, score) sorted by
+        score, highest first.
+        """
+        if debate_ranking is not None:
+            vector_ranking = list(debate_ranking)
+        else:
+            # Vector ranking: debates in the order of their best image hit
+            debate_by_image = self.get_debate_ids_for_images(
+                image_path for image_path, _, _, _ in search_results
+            )
+            vector_ranking = list(
+                dict.fromkeys(
+                    debate_by_image[image_path]
+                    for image_path, _, _, _ in search_results
+                    if image_path in debate_by_image
+                )
+            )
+        lexical_ranking = [
+            debate_id
+            for debate_id, _ in self.lexical_search_debates(
+                query, original_query or ""
+            )
+        ]
+
+        rrf: Dict[int, float] = {}
+        for ranking in (vector_ranking, lexical_ranking):
+            for rank, debate_id in enumerate(ranking, start=1):
+                rrf[debate_id] = rrf.get(debate_id, 0.0) + 1.0 / (RRF_K + rank)
+        max_rrf = 2.0 / (RRF_K + 1)
+        score_by_debate = {debate_id: score / max_rrf for debate_id, score in rrf.items()}
+
+        rows = self.get_debates_by_ids(
+            [
+                debate_id
+                for debate_id, score in score_by_debate.items()
+                if score > minimum_score
+            ]
         )
-        return self.cursor.fetchall()
 
-    def update_debate(self, debate_id: int, tldr: str, summary: str):
-        """Update debate details"""
-        self.cursor.execute(
-            """
-            UPDATE debate 
-            SET tldr = ?, summary = ?, updated_at = datetime('now')
-            WHERE id = ?
-        """,
-            (tldr, summary, debate_id),
+        results = []
+        for debate_id, tldr, summary, updated_at, _, image_path, _ in rows.values():
+            # Normalize image path
+            if image_path and image_path.startswith("src/"):
+                image_path = image_path[4:]
+
+            score = score_by_debate[debate_id]
+            results.append(
+                (debate_id, tldr, summary, str(updated_at), image_path, score)
+            )
+
+        # Sort debates by score, highest first
+        results.sort(key=lambda x: x[5], reverse=True)
+        return results
+
+    def rank_debates(self, query_vector: np.ndarray, k: int = 20) -> List[Tuple[int, float]]:
+        """Two-stage vector ranking of debates: debate-level ANN, then their images
+
+        The first stage takes the ``k * DEBATE_OVERSAMPLE`` debates whose
+        centroid or text vector is closest to the query. The second scores
+        every vector of those debates' images exactly; a debate's score is
+        the best of its image vectors and its text vector. Returns
+        (debate_id, score) pairs, best first, at most ``k``.
+        """
+        query_vector = np.array(query_vector, dtype=np.float32).reshape(-1)
+        query_vector /= np.linalg.norm(query_vector)  # L2ノルムを 1 に正規化
+        candidates = self.debate_index.search(query_vector, k * DEBATE_OVERSAMPLE)
+        if not candidates:
+            return []
+
+        debate_ids = [debate_id for debate_id, _ in candidates]
+        with self.db.read() as cursor:
+            cursor.execute(
+                f"""
+                SELECT i.debate_id, v.image_id, v.slot FROM image_vector v
+                JOIN image i ON i.id = v.image_id
+                WHERE i.has_vector = 1 AND i.debate_id IN ({",".join("?" * len(debate_ids))})
+            """,
+                debate_ids,
+            )
+            rows = cursor.fetchall()
+
+        # 候補の debate の画像だけを厳密に採点する（FAISS の近似は 1 段目のみ）
+        owners, vectors = [], []
+        with self.persistence.lock.read():
+            if self.index.d != len(query_vector):
+                logger.warning(
+                    "Query vector has %d dimensions, the index has %d",
+                    len(query_vector),
+                    self.index.d,
+                )
+                return []
+            ids = np.array(
+                [vector_id(image_id, slot) for _, image_id, slot in rows], dtype=np.int64
+            )
+            live = self.persistence.live_mask(ids)
+            if not live.all():
+                # 削除中の画像（tombstone は rev_map に残っていて reconstruct できてしまう）
+                rows = [row for row, keep in zip(rows, live.tolist()) if keep]
+                ids = ids[live]
+            try:
+                with FAISS_SEARCH_SECONDS.time(index="images", method="exact"):
+                    vectors = list(self.index.reconstruct_batch(ids)) if len(ids) else []
+                owners = [debate_id for debate_id, _, _ in rows]
+            except RuntimeError:
+                # SQL とずれた ID がある（書き込み途中）ので 1 件ずつ引く
+                for (debate_id, _, _), vid in zip(rows, ids.tolist()):
+                    vector = self.persistence.get(vid)
+                    if vector is not None:
+                        owners.append(debate_id)
+                        vectors.append(vector)
+        for debate_id in debate_ids:
+            vector = self.debate_index.get_text(debate_id)
+            if vector is not None and len(vector) == len(query_vector):
+                owners.append(debate_id)
+                vectors.append(vector)
+        if not vectors:
+            return []
+
+        best: Dict[int, float] = {}
+        for debate_id, score in zip(owners, (np.stack(vectors) @ query_vector).tolist()):
+            if score > best.get(debate_id, -np.inf):
+                best[debate_id] = score
+        return sorted(best.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    async def arank_debates(self, query: str, k: int = 20) -> Tuple[str, List[int]]:
+        """Embed the query and rank debates with ``rank_debates`` on the search stage"""
+        logger.debug("Performing two-stage debate search for: '%s'", query)
+        instruction_data: InstructionData = await self.processer.aprocess_instruction(
+            query
         )
-        self.conn.commit()
+        logger.debug("Translated instruction: %s", instruction_data.instruction)
+        ranked = await run_in_stage(
+            "search", self.rank_debates, instruction_data.instruction_feats, k
+        )
+        return instruction_data.instruction, [debate_id for debate_id, _ in ranked]
+
+    async def asearch_debates(
+        self,
+        query: str,
+        k: int = 20,
+        minimum_score: float = 0.0,
+    ) -> Tuple[str, List[Tuple[int, str, str, str, Optional[str], float]]]:
+        """Hybrid (embedding + FTS5) search, fused into a debate ranking
+
+        The vector side ranks ``k`` debates with ``rank_debates``; until the
+        debate index covers every debate it falls back to the ``k`` best
+        images.
+        """
+        original_query = query
+        search_results, debate_ranking = [], None
+        try:
+            if self.debate_index is not None and self.debate_index.ready:
+                query, debate_ranking = await self.arank_debates(query, k=k)
+                logger.debug("Search returned %d debates", len(debate_ranking))
+            else:
+                query, search_results = await self.asearch_by_text(query, k=k)
+                logger.debug("Search returned %d results", len(search_results))
+        except Exception as e:
+            logger.warning(
+                "Error in vector search: %s; continuing with direct text matching only", e
+            )
+
+        return query, await run_in_stage(
+            "search",
+            self.score_debates,
+            query,
+            search_results,
+            minimum_score=minimum_score,
+            original_query=original_query,
+            debate_ranking=debate_ranking,
+        )
+
+    def update_debate(self, debate_id: int, tldr: str, summary: str):
+        """Update debate details
+
+        A trigger queues the debate; the debate index re-embeds its text in
+        the background once the edits settle (see ``DebateIndex``).
+        """
+        with self.db.write() as cursor:
+            cursor.execute(
+                """
+                UPDATE debate 
+                SET tldr = ?, summary = ?, updated_at = datetime('now')
+                WHERE id = ?
+            """,
+                (tldr, summary, debate_id),
+            )
+        self._data_changed()
 
     def delete_debate(self, debate_id: int):
         """Delete a debate and all associated images"""
-        self.cursor.execute(
-            """
-            SELECT id, image_path FROM image WHERE debate_id = ?
-        """,
-            (debate_id,),
-        )
-        image_data = self.cursor.fetchall()
+        with self.db.write() as cursor:
+            cursor.execute(
+                """
+                SELECT id, image_path, has_vector FROM image WHERE debate_id = ?
+            """,
+                (debate_id,),
+            )
+            image_data = cursor.fetchall()
+            cursor.execute(
+                """
+                SELECT v.image_id, v.slot FROM image_vector v
+                JOIN image i ON i.id = v.image_id
+                WHERE i.debate_id = ? AND i.has_vector = 1
+            """,
+                (debate_id,),
+            )
+            self.persistence.remove(
+                vector_id(image_id, slot) for image_id, slot in cursor.fetchall()
+            )
 
-        for image_id, image_path in image_data:
-            faiss_idx = self.image_id_to_faiss[image_id]
-            # self.index.remove(faiss_idx)
-            del self.image_id_to_faiss[image_id]
-            del self.image_id_to_text[image_id]
+            cursor.execute(
+                """
+                DELETE FROM image_vector
+                WHERE image_id IN (SELECT id FROM image WHERE debate_id = ?)
+            """,
+                (debate_id,),
+            )
+
+            cursor.execute(
+                """
+                DELETE FROM image WHERE debate_id = ?
+            """,
+                (debate_id,),
+            )
+            cursor.execute(
+                """
+                DELETE FROM debate WHERE id = ?
+            """,
+                (debate_id,),
+            )
 
-            if os.path.exists(image_path):
-                os.remove(image_path)
+            # 同じ内容の画像は 1 ファイルを共有するので、他で参照されていれば残す
+            paths = list({image_path for _, image_path, _ in image_data})
+            shared = set()
+            if paths:
+                cursor.execute(
+                    f"""
+                    SELECT DISTINCT image_path FROM image
+                    WHERE image_path IN ({",".join("?" * len(paths))})
+                """,
+                    paths,
+                )
+                shared = {row[0] for row in cursor.fetchall()}
 
-        self.cursor.execute(
-            """
-            DELETE FROM image WHERE debate_id = ?
-        """,
-            (debate_id,),
-        )
-        self.cursor.execute(
-            """
-            DELETE FROM debate WHERE id = ?
-        """,
-            (debate_id,),
-        )
-        self.conn.commit()
+        self._data_changed()
+        self._schedule_rebuild()  # HNSW の tombstone が溜まったら詰め直す
+        for image_path in paths:
+            if image_path in shared:
+                continue
+            file_path = upload_file_path(image_path, self.uploads_dir)
+            if file_path is not None and file_path.exists():
+                os.remove(file_path)
 
     def close(self):
-        """Close the database connection and save FAISS index"""
-        faiss.write_index(self.index, str(self.db_path.parent / "vectors.faiss"))
-        self.conn.close()
+        """Close the database connections and save FAISS index"""
+        if self._rebuild_thread is not None:
+            self._rebuild_thread.join()
+        if self.debate_index is not None:
+            self.debate_index.close()
+        self.persistence.close()
+        self.db.close()
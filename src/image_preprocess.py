@@ -0,0 +1,178 @@
+import base64
+import hashlib
+import io
+import logging
+import os
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# 先頭バイトから判定する（拡張子やクライアントの Content-Type は当てにならない）
+_MAGIC = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+_FORMATS = {"jpeg": ("JPEG", "image/jpeg", "jpg"), "webp": ("WEBP", "image/webp", "webp")}
+
+MIME_EXTENSIONS = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/heic": "heic",
+}
+
+
+def detect_mime(data: bytes) -> str:
+    """MIME type of an encoded image from its magic bytes"""
+    for magic, mime in _MAGIC:
+        if data.startswith(magic):
+            return mime
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[4:8] == b"ftyp" and data[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return "application/octet-stream"
+
+
+def dhash(image_path: str, hash_size: int = 8) -> int:
+    """64-bit difference hash (signed, as stored in SQLite) for near-duplicate checks
+
+    Robust to re-encoding, resizing and small shifts in lighting, so a board
+    photographed twice usually lands within a few bits.
+    """
+    with Image.open(image_path) as opened:
+        image = ImageOps.exif_transpose(opened).convert("L")
+        image = image.resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = image.tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+class PreparedImage(NamedTuple):
+    data: bytes
+    mime: str
+    original_bytes: int
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+
+class ImagePreprocessor:
+    """Normalizes whiteboard photos before they are sent to the vision model.
+
+    EXIF orientation is applied, the longest side is capped at ``max_side``,
+    contrast is stretched (faint marker on a grey board), and the result is
+    re-encoded as JPEG/WebP, lowering the quality until it fits in
+    ``target_bytes``. Derivatives are cached in ``cache_dir`` by the hash of
+    the original bytes and the settings.
+    """
+
+    QUALITIES = (85, 75, 65, 55, 45)
+
+    def __init__(
+        self,
+        cache_dir: Optional[Path] = Path("image_cache"),
+        max_side: int = 2048,
+        target_bytes: int = 800 * 1024,
+        image_format: str = "jpeg",
+        enabled: bool = True,
+    ):
+        if image_format not in _FORMATS:
+            raise ValueError(f"Unsupported image format: {image_format}")
+        self.cache_dir = Path(cache_dir) if cache_dir is not None else None
+        self.max_side = max_side
+        self.target_bytes = target_bytes
+        self.image_format = image_format
+        self.enabled = enabled
+        if self.cache_dir is not None:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def from_env(cls) -> "ImagePreprocessor":
+        return cls(
+            cache_dir=Path(os.environ.get("WR_IMAGE_CACHE_DIR", "image_cache")),
+            max_side=int(os.environ.get("WR_IMAGE_MAX_SIDE", "2048")),
+            target_bytes=int(os.environ.get("WR_IMAGE_TARGET_KB", "800")) * 1024,
+            image_format=os.environ.get("WR_IMAGE_FORMAT", "jpeg"),
+            enabled=os.environ.get("WR_IMAGE_PREPROCESS", "1") == "1",
+        )
+
+    def _cache_path(self, digest: str) -> Optional[Path]:
+        if self.cache_dir is None:
+            return None
+        _, _, ext = _FORMATS[self.image_format]
+        settings = f"{self.max_side}-{self.target_bytes}"
+        return self.cache_dir / f"{digest}-{settings}.{ext}"
+
+    def prepare(self, image_path: str) -> PreparedImage:
+        """Derivative of the image at ``image_path`` (raises if it cannot be read)"""
+        with open(image_path, "rb") as f:
+            original = f.read()
+        if not self.enabled:
+            return PreparedImage(original, detect_mime(original), len(original))
+
+        cache_path = self._cache_path(hashlib.sha256(original).hexdigest())
+        _, mime, _ = _FORMATS[self.image_format]
+        if cache_path is not None and cache_path.exists():
+            return PreparedImage(cache_path.read_bytes(), mime, len(original))
+
+        try:
+            data = self._normalize(original)
+        except Exception as e:
+            # Pillow が読めない形式（HEIC など）はそのまま送る
+            logger.warning("Error preprocessing image %s: %s", image_path, e)
+            return PreparedImage(original, detect_mime(original), len(original))
+
+        if cache_path is not None:
+            tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, cache_path)
+        return PreparedImage(data, mime, len(original))
+
+    def to_data_url(self, image_path: str) -> str:
+        return self.prepare(image_path).to_data_url()
+
+    def _normalize(self, original: bytes) -> bytes:
+        with Image.open(io.BytesIO(original)) as opened:
+            image = ImageOps.exif_transpose(opened)
+            if image.mode in ("RGBA", "LA", "P"):
+                # 透過部分は白いボードとして扱う
+                image = image.convert("RGBA")
+                background = Image.new("RGB", image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel("A"))
+                image = background
+            else:
+                image = image.convert("RGB")
+
+        image.thumbnail((self.max_side, self.max_side), Image.Resampling.LANCZOS)
+        image = ImageOps.autocontrast(image, cutoff=1, preserve_tone=True)
+
+        while True:
+            for quality in self.QUALITIES:
+                data = self._encode(image, quality)
+                if len(data) <= self.target_bytes:
+                    return data
+            if max(image.size) <= 512:
+                return data
+            # 最低品質でも収まらなければ縮小してやり直す
+            image = image.resize(
+                (image.width * 3 // 4, image.height * 3 // 4), Image.Resampling.LANCZOS
+            )
+
+    def _encode(self, image: Image.Image, quality: int) -> bytes:
+        pil_format, _, _ = _FORMATS[self.image_format]
+        buffer = io.BytesIO()
+        image.save(buffer, format=pil_format, quality=quality, optimize=True)
+        return buffer.getvalue()
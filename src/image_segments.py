@@ -0,0 +1,80 @@
+import logging
+import os
+import re
+from typing import List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 1 枚のボードに持たせるベクトル数の上限（FAISS の ID は slot << 40 | image_id）
+MAX_SEGMENTS = int(os.environ.get("WR_MAX_SEGMENTS", "16"))
+# 説明文・OCR をこの語数ごとに区切って個別に埋め込む
+CHUNK_WORDS = int(os.environ.get("WR_CHUNK_WORDS", "80"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?。])\s+|\n+")
+# OCR の markdown に含まれる画像参照 ![img-0.jpeg](img-0.jpeg)
+_MARKDOWN_IMAGE = re.compile(r"!\[[^\]]*\]\([^)]*\)")
+
+
+def chunk_text(text: str, chunk_words: int = CHUNK_WORDS) -> List[str]:
+    """Split ``text`` at sentence boundaries into chunks of about ``chunk_words`` words"""
+    chunks, current, size = [], [], 0
+    for sentence in _SENTENCE_END.split(text or ""):
+        words = sentence.split()
+        if not words:
+            continue
+        # 1 文が長すぎる場合（OCR の表など）は語数で切る
+        while len(words) > chunk_words:
+            if current:
+                chunks.append(" ".join(current))
+                current, size = [], 0
+            chunks.append(" ".join(words[:chunk_words]))
+            words = words[chunk_words:]
+        if size + len(words) > chunk_words and current:
+            chunks.append(" ".join(current))
+            current, size = [], 0
+        current += words
+        size += len(words)
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def image_segments(
+    description: str, entities: Sequence[str] = (), ocr_markdown: str = ""
+) -> List[Tuple[str, str]]:
+    """(kind, text) of every vector of an image; the slot of a vector is its position
+
+    Slot 0 is always the whole description (the single vector images had
+    before), followed by the description chunks if it is long, the entity
+    list and the OCR markdown chunks. When there are more than MAX_SEGMENTS,
+    the entity list keeps its slot and the chunks share the rest (OCR gets at
+    least half of them), so a long description cannot push out the OCR.
+    """
+    chunks = chunk_text(description)
+    if len(chunks) <= 1:
+        chunks = []
+    entity_text = ", ".join(e for e in entities if e)
+    ocr_text = _MARKDOWN_IMAGE.sub(" ", ocr_markdown or "")
+    ocr_chunks = chunk_text(ocr_text)
+
+    budget = max(0, MAX_SEGMENTS - 1 - (1 if entity_text else 0))
+    # 説明文のチャンクを先に削り、残りを OCR に回す
+    description_budget = budget - min(len(ocr_chunks), budget // 2)
+    kept_chunks = chunks[:description_budget]
+    kept_ocr = ocr_chunks[: budget - len(kept_chunks)]
+    if len(kept_chunks) < len(chunks) or len(kept_ocr) < len(ocr_chunks):
+        logger.warning(
+            "Image has more than %d segments, keeping %d/%d description chunks and %d/%d OCR chunks",
+            MAX_SEGMENTS,
+            len(kept_chunks),
+            len(chunks),
+            len(kept_ocr),
+            len(ocr_chunks),
+        )
+
+    segments = [("description", description or "")]
+    segments += [("description_chunk", chunk) for chunk in kept_chunks]
+    if entity_text and MAX_SEGMENTS > 1:
+        segments.append(("entities", entity_text))
+    segments += [("ocr", chunk) for chunk in kept_ocr]
+    return segments
@@ -0,0 +1,129 @@
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.concurrency import run_in_stage
+from src.tracing import get_trace_id, set_trace_id
+
+logger = logging.getLogger(__name__)
+
+# バッチサイズのヒストグラムのバケット（上限値）
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, float("inf"))
+
+
+class MicroBatcher:
+    """Gather concurrent embed requests for a few milliseconds and encode them together.
+
+    Query and ingest paths both ``await batcher.embed(text)``; the first request
+    of a batch waits up to ``max_wait_ms`` for others to arrive (or until
+    ``max_batch_size`` is reached) and the whole batch runs as one
+    ``embed_batch`` forward pass on the shared executor.
+    """
+
+    def __init__(
+        self,
+        embed_batch: Callable[[Sequence[str]], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        self.embed_batch = embed_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+
+        # (text, future, 投入したリクエストの trace ID)
+        self._pending: List[Tuple[str, asyncio.Future, Optional[str]]] = []
+        self._arrived: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+        self.batches = 0
+        self.items = 0
+        self.batch_size_histogram: Dict[int, int] = {b: 0 for b in BATCH_SIZE_BUCKETS}
+        self.batch_seconds = 0.0
+
+    async def embed(self, text: str) -> np.ndarray:
+        """Embed one text as part of the next batch"""
+        self._ensure_running()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future, get_trace_id()))
+        self._arrived.set()
+        return await future
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._arrived = asyncio.Event()
+            self._task = asyncio.create_task(self._run(), name="embed-batcher")
+
+    async def _run(self):
+        while True:
+            await self._arrived.wait()
+            # 最初のリクエストから max_wait だけ待って後続をまとめる
+            deadline = time.monotonic() + self.max_wait
+            while len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = self._pending[: self.max_batch_size]
+            self._pending = self._pending[self.max_batch_size :]
+            if not self._pending:
+                self._arrived.clear()
+            if batch:
+                await self._encode(batch)
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future, Optional[str]]]):
+        texts = [text for text, _, _ in batch]
+        # バッチは複数のリクエストにまたがるので、その全員の trace ID でログを残す
+        set_trace_id(
+            ",".join(dict.fromkeys(trace_id for _, _, trace_id in batch if trace_id))
+            or None
+        )
+        logger.debug("Encoding a batch of %d texts", len(texts))
+        start = time.perf_counter()
+        try:
+            vectors = await run_in_stage("embed", self.embed_batch, texts)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        finally:
+            self._record(len(batch), time.perf_counter() - start)
+
+        for (_, future, _), vector in zip(batch, vectors):
+            if not future.done():
+                future.set_result(vector)
+
+    def _record(self, size: int, seconds: float):
+        self.batches += 1
+        self.items += size
+        self.batch_seconds += seconds
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self.batch_size_histogram[bucket] += 1
+                break
+
+    def stats(self) -> dict:
+        """Queue depth and batch size histogram"""
+        return {
+            "queue_depth": len(self._pending),
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "mean_batch_seconds": (
+                self.batch_seconds / self.batches if self.batches else 0.0
+            ),
+            "batch_size_histogram": {
+                f"le_{bucket:g}": count
+                for bucket, count in self.batch_size_histogram.items()
+            },
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -1,11 +1,18 @@
 import base64
 import json
+import logging
 import os
 
 from mistralai import Mistral
 from mistralai.models import OCRPageObject, OCRResponse
 from pydantic import BaseModel
 
+from src.concurrency import run_in_stage
+from src.image_preprocess import ImagePreprocessor
+from src.metrics import MISTRAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
 
 class ImageInfo(BaseModel):
     """英語での画像説明を表すクラス"""
@@ -21,6 +28,12 @@ class InstInfo(BaseModel):
     english_proper_noun_list: list[str]
 
 
+class InstInfoBatch(BaseModel):
+    """複数の指示文の英訳（入力と同じ順序）"""
+
+    instructions: list[InstInfo]
+
+
 class MistralModel:
     def __init__(self):
         self.client = Mistral(api_key=os.environ["MISTRAL_API_KEY"])
@@ -29,23 +42,58 @@ class MistralModel:
             "temperature": 0,
             "model": "mistral-small-latest",
         }
+        # 送信前に縮小・再エンコードする（派生画像は内容ハッシュでキャッシュ）
+        self.preprocessor = ImagePreprocessor.from_env()
 
     def ocr(self, image_url: str) -> str:
         """OCRを実行し、結果を取得する"""
-        pages: OCRResponse = self.client.ocr.process(
-            model="mistral-ocr-latest",
-            document={
-                "type": "image_url",
-                "image_url": image_url,
-            },
+        with MISTRAL_SECONDS.time(call="ocr"):
+            pages: OCRResponse = self.client.ocr.process(
+                model="mistral-ocr-latest",
+                document={
+                    "type": "image_url",
+                    "image_url": image_url,
+                },
+            )
+        page: OCRPageObject = pages.pages[0]
+        return page.markdown
+
+    async def aocr(self, image_path: str) -> str:
+        """OCRを実行し、結果を取得する（非同期版）"""
+        image_url = await run_in_stage(
+            "preprocess", self.preprocessor.to_data_url, image_path
         )
+        with MISTRAL_SECONDS.time(call="ocr"):
+            pages: OCRResponse = await self.client.ocr.process_async(
+                model="mistral-ocr-latest",
+                document={
+                    "type": "image_url",
+                    "image_url": image_url,
+                },
+            )
         page: OCRPageObject = pages.pages[0]
         return page.markdown
 
     def get_image_info(self, image_path: str) -> ImageInfo:
         """画像の説明を取得する"""
-        base64_image = self.encode_image(image_path)
-        image_url = f"data:image/jpeg;base64,{base64_image}"
+        image_url = self.preprocessor.to_data_url(image_path)
+        with MISTRAL_SECONDS.time(call="vision"):
+            response = self.client.chat.parse(**self._image_info_request(image_url))
+        return self._parse_response(response, ImageInfo)
+
+    async def aget_image_info(self, image_path: str) -> ImageInfo:
+        """画像の説明を取得する（非同期版）"""
+        # リサイズ・エンコードは CPU 処理なのでイベントループの外で行う
+        image_url = await run_in_stage(
+            "preprocess", self.preprocessor.to_data_url, image_path
+        )
+        with MISTRAL_SECONDS.time(call="vision"):
+            response = await self.client.chat.parse_async(
+                **self._image_info_request(image_url)
+            )
+        return self._parse_response(response, ImageInfo)
+
+    def _image_info_request(self, image_url: str) -> dict:
         messages = [
             {
                 "role": "user",
@@ -58,27 +106,42 @@ class MistralModel:
                 ],
             }
         ]
-        config = self.config
-        config["response_format"] = ImageInfo
-        response = self.client.chat.parse(messages=messages, **config)
+        # self.config を書き換えると並行リクエスト間で response_format が混ざる
+        return {"messages": messages, **self.config, "response_format": ImageInfo}
+
+    @staticmethod
+    def _parse_response(response, response_format):
         response = response.choices[0].message.content
         response_dict = json.loads(response)
-        return ImageInfo(**response_dict)
+        return response_format(**response_dict)
 
     def encode_image(self, image_path: str) -> str:
-        """Encode the image to base64."""
+        """Encode the preprocessed image to base64."""
         try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode("utf-8")
+            prepared = self.preprocessor.prepare(image_path)
+            return base64.b64encode(prepared.data).decode("utf-8")
         except FileNotFoundError:
-            print(f"Error: The file {image_path} was not found.")
+            logger.error("The file %s was not found.", image_path)
             return None
         except Exception as e:  # Added general exception handling
-            print(f"Error: {e}")
+            logger.exception("Error encoding image %s: %s", image_path, e)
             return None
 
     def get_inst_info(self, instruction: str) -> InstInfo:
         """指示文から固有表現を取得する"""
+        with MISTRAL_SECONDS.time(call="translate"):
+            res = self.client.chat.parse(**self._inst_info_request(instruction))
+        return self._parse_response(res, InstInfo)
+
+    async def aget_inst_info(self, instruction: str) -> InstInfo:
+        """指示文から固有表現を取得する（非同期版）"""
+        with MISTRAL_SECONDS.time(call="translate"):
+            res = await self.client.chat.parse_async(
+                **self._inst_info_request(instruction)
+            )
+        return self._parse_response(res, InstInfo)
+
+    def _inst_info_request(self, instruction: str) -> dict:
         prompt = (
             "Translate the following instruction into English and extract all proper nouns. "
             "Provide the translation and the list of proper nouns in English. "
@@ -90,12 +153,50 @@ class MistralModel:
                 "content": prompt,
             },
         ]
-        config = self.config
-        config["response_format"] = InstInfo
-        res = self.client.chat.parse(messages=prompt, **config)
-        response = res.choices[0].message.content
-        response_dict = json.loads(response)
-        return InstInfo(**response_dict)
+        return {"messages": prompt, **self.config, "response_format": InstInfo}
+
+    def get_inst_infos(self, instructions: list[str]) -> list[InstInfo]:
+        """複数の指示文を 1 回のリクエストで英訳する"""
+        with MISTRAL_SECONDS.time(call="translate_batch"):
+            res = self.client.chat.parse(**self._inst_infos_request(instructions))
+        return self._check_batch(self._parse_response(res, InstInfoBatch), instructions)
+
+    async def aget_inst_infos(self, instructions: list[str]) -> list[InstInfo]:
+        """複数の指示文を 1 回のリクエストで英訳する（非同期版）"""
+        with MISTRAL_SECONDS.time(call="translate_batch"):
+            res = await self.client.chat.parse_async(
+                **self._inst_infos_request(instructions)
+            )
+        return self._check_batch(self._parse_response(res, InstInfoBatch), instructions)
+
+    def _inst_infos_request(self, instructions: list[str]) -> dict:
+        numbered = "\n".join(
+            f"{i + 1}. {json.dumps(instruction, ensure_ascii=False)}"
+            for i, instruction in enumerate(instructions)
+        )
+        prompt = (
+            "Translate each of the following instructions into English and extract all proper nouns. "
+            "For every instruction, in the same order, provide the translation and the list of proper nouns in English. "
+            f"instructions:\n{numbered}"
+        )
+        prompt = [
+            {
+                "role": "user",
+                "content": prompt,
+            },
+        ]
+        # 出力の長さは指示文の数に比例する
+        config = {**self.config, "max_tokens": self.config["max_tokens"] * len(instructions)}
+        return {"messages": prompt, **config, "response_format": InstInfoBatch}
+
+    @staticmethod
+    def _check_batch(batch: InstInfoBatch, instructions: list[str]) -> list[InstInfo]:
+        # 件数がずれると対応が取れないので、呼び出し側で 1 件ずつに切り替える
+        if len(batch.instructions) != len(instructions):
+            raise ValueError(
+                f"Expected {len(instructions)} translations, got {len(batch.instructions)}"
+            )
+        return batch.instructions
 
 
 if __name__ == "__main__":
@@ -108,10 +209,7 @@ if __name__ == "__main__":
     print(instinfo.english_proper_noun_list)
 
     # image
-    base64_image = mistral_model.encode_image("images/IMG_0569.jpg")
-    image_url = f"data:image/jpeg;base64,{base64_image}"
-
-    image_info: ImageInfo = mistral_model.get_image_info(image_url)
+    image_info: ImageInfo = mistral_model.get_image_info("images/IMG_0569.jpg")
     english_named_entity_list = image_info.english_named_entity_list
     english_plain_text_description = image_info.english_plain_text_description
     print(english_named_entity_list)
@@ -1,10 +1,24 @@
-from typing import List
+import asyncio
+import functools
+import json
+import logging
+import os
+from typing import List, Optional, Sequence, Tuple
 
 import numpy as np
 from pydantic import BaseModel, ConfigDict
 
-from mistralai_api import ImageInfo, InstInfo, MistralModel
-from stella import StellaEmbedder
+from src.concurrency import run_in_stage, stage_limit
+from src.image_segments import image_segments
+from src.metrics import EMBED_SECONDS, EMBED_TEXTS
+from src.micro_batcher import MicroBatcher
+from src.model_registry import STELLA_MODEL_NAME, load_embedder, registry
+from src.query_cache import QueryCache
+
+logger = logging.getLogger(__name__)
+
+# 1 回の Mistral リクエストで英訳する指示文の数の上限
+TRANSLATE_BATCH_SIZE = int(os.environ.get("WR_TRANSLATE_BATCH_SIZE", "16"))
 
 
 # Custom type for numpy arrays
@@ -25,6 +39,9 @@ class ImageData(BaseModel):
     description: str
     ocr: List[str]
     description_feats: np.ndarray
+    # 画像ごとの全ベクトル: (kind, text) と (n, d) の埋め込み。先頭は説明文全体
+    segments: List[Tuple[str, str]] = []
+    segment_feats: Optional[np.ndarray] = None
     model_config = ConfigDict(arbitrary_types_allowed=True)
 
 
@@ -38,34 +55,303 @@ class InstructionData(BaseModel):
 
 
 class Processer:
-    def __init__(self):
-        self.stella = StellaEmbedder()
-        self.mistral = MistralModel()
+    def __init__(self, query_cache: Optional[QueryCache] = None):
+        # 検索クエリの翻訳結果と埋め込みのキャッシュ（None なら毎回 Mistral / Stella を呼ぶ）
+        self.query_cache = query_cache
+        self.embedding_model = STELLA_MODEL_NAME
+        # Mistral OCR の markdown もベクトル化する（画像ごとに API 呼び出しが 1 回増える）
+        self.ocr_segments = os.environ.get("WR_OCR_SEGMENTS", "0") == "1"
+        # 同時に来たクエリ・取り込みの埋め込みをまとめて 1 回の forward にする
+        self.batcher = MicroBatcher(
+            lambda texts: self.embed_batch(texts, path="batcher"),
+            max_batch_size=int(os.environ.get("WR_EMBED_BATCH_SIZE", "32")),
+            max_wait_ms=float(os.environ.get("WR_EMBED_MAX_WAIT_MS", "5")),
+        )
+
+    # モデルはレジストリで 1 度だけ読み込み、初回使用時（またはプリロード）まで遅延する
+    @property
+    def stella(self):
+        return registry.get("stella")
+
+    @property
+    def mistral(self):
+        return registry.get("mistral")
+
+    def embed_batch(self, texts: Sequence[str], path: str = "direct") -> np.ndarray:
+        """``stella.embed_batch`` recorded in the embed metrics under ``path``"""
+        stella = self.stella  # 初回のモデル読み込みは計測に含めない
+        with EMBED_SECONDS.time(path=path):
+            vectors = stella.embed_batch(texts)
+        EMBED_TEXTS.inc(len(texts), path=path)
+        return vectors
+
+    def set_embedding_model(self, model_name: str, embedder=None):
+        """Switch the embedding model; ``embedder`` is an already loaded instance,
+        otherwise the model is loaded on first use"""
+        if embedder is not None:
+            registry.replace("stella", embedder)
+        elif model_name != self.embedding_model:
+            registry.register("stella", functools.partial(load_embedder, model_name))
+        self.embedding_model = model_name
 
     def process_image(self, image_path: str) -> ImageData:
-        image_info: ImageInfo = self.mistral.get_image_info(image_path)
-        english_named_entity_list = image_info.english_named_entity_list
-        english_plain_text_description = image_info.english_plain_text_description
-        description_feats = self.stella.embed_text(english_plain_text_description)
+        image_info = self.mistral.get_image_info(image_path)
+        ocr_markdown = ""
+        if self.ocr_segments:
+            ocr_markdown = self.mistral.ocr(
+                self.mistral.preprocessor.to_data_url(image_path)
+            )
+        segments = image_segments(
+            image_info.english_plain_text_description,
+            image_info.english_named_entity_list,
+            ocr_markdown,
+        )
+        # 全セグメントを 1 回の forward で埋め込む
+        segment_feats = self.embed_batch([text for _, text in segments], path="image")
+        return self._image_data(image_path, image_info, segments, segment_feats)
+
+    async def aprocess_image(self, image_path: str) -> ImageData:
+        """process_image without blocking the event loop"""
+        async with stage_limit("mistral"):
+            image_info = await self.mistral.aget_image_info(image_path)
+        ocr_markdown = ""
+        if self.ocr_segments:
+            async with stage_limit("mistral"):
+                ocr_markdown = await self.mistral.aocr(image_path)
+        segments = image_segments(
+            image_info.english_plain_text_description,
+            image_info.english_named_entity_list,
+            ocr_markdown,
+        )
+        # 同時に投入すれば batcher が同じバッチにまとめる
+        segment_feats = np.stack(
+            await asyncio.gather(*(self.batcher.embed(text) for _, text in segments))
+        )
+        return self._image_data(image_path, image_info, segments, segment_feats)
+
+    @staticmethod
+    def _image_data(image_path, image_info, segments, segment_feats) -> ImageData:
+        segment_feats = np.asarray(segment_feats, dtype=np.float32)
         return ImageData(
             image_path=image_path,
-            description=english_plain_text_description,
-            ocr=english_named_entity_list,
-            description_feats=description_feats,
+            description=image_info.english_plain_text_description,
+            ocr=image_info.english_named_entity_list,
+            description_feats=segment_feats[0],
+            segments=segments,
+            segment_feats=segment_feats,
         )
 
     def process_instruction(self, instruction: str) -> InstructionData:
-        inst_info: InstInfo = self.mistral.get_inst_info(instruction)
-        english_instruction = inst_info.english_instruction
-        english_proper_noun_list = inst_info.english_proper_noun_list
-        instruction_feats = self.stella.embed_text(english_instruction)
+        inst_info = self._cached_inst_info(instruction)
+        if inst_info is None:
+            inst_info = self._cache_inst_info(
+                instruction, self.mistral.get_inst_info(instruction)
+            )
+        english_instruction = inst_info["english_instruction"]
+
+        instruction_feats = self._cached_vector(english_instruction)
+        if instruction_feats is None:
+            instruction_feats = self._cache_vector(
+                english_instruction,
+                self.embed_batch([english_instruction], path="query")[0],
+            )
 
         return InstructionData(
             instruction=english_instruction,
-            ocr=english_proper_noun_list,
+            ocr=inst_info["english_proper_noun_list"],
             instruction_feats=instruction_feats,
         )
 
+    async def aprocess_instruction(self, instruction: str) -> InstructionData:
+        """process_instruction without blocking the event loop"""
+        inst_info = await self._acached_inst_info(instruction)
+        if inst_info is None:
+            async with stage_limit("mistral"):
+                response = await self.mistral.aget_inst_info(instruction)
+            inst_info = await self._acache_inst_info(instruction, response)
+        english_instruction = inst_info["english_instruction"]
+
+        instruction_feats = await self._acached_vector(english_instruction)
+        if instruction_feats is None:
+            instruction_feats = await self._acache_vector(
+                english_instruction, await self.batcher.embed(english_instruction)
+            )
+
+        return InstructionData(
+            instruction=english_instruction,
+            ocr=inst_info["english_proper_noun_list"],
+            instruction_feats=instruction_feats,
+        )
+
+    def process_instructions(self, instructions: List[str]) -> List[InstructionData]:
+        """process_instruction for many queries at once
+
+        Uncached translations go to Mistral TRANSLATE_BATCH_SIZE per request
+        and uncached embeddings through a single ``embed_batch``.
+        """
+        inst_infos, missing = self._cached_inst_infos(instructions)
+        for start in range(0, len(missing), TRANSLATE_BATCH_SIZE):
+            chunk = missing[start : start + TRANSLATE_BATCH_SIZE]
+            try:
+                responses = self.mistral.get_inst_infos(chunk)
+            except ValueError as e:
+                logger.warning("Batch translation failed (%s), translating one by one", e)
+                responses = [self.mistral.get_inst_info(text) for text in chunk]
+            for text, response in zip(chunk, responses):
+                inst_infos[text] = self._cache_inst_info(text, response)
+
+        vectors, missing = self._cached_vectors(inst_infos.values())
+        if missing:
+            embeddings = self.embed_batch(missing, path="queries")
+            for text, vector in zip(missing, embeddings):
+                vectors[text] = self._cache_vector(text, vector)
+        return self._instruction_batch(instructions, inst_infos, vectors)
+
+    async def aprocess_instructions(
+        self, instructions: List[str]
+    ) -> List[InstructionData]:
+        """process_instructions without blocking the event loop"""
+        inst_infos, missing = await self._acached_inst_infos(instructions)
+
+        async def translate(chunk: List[str]):
+            try:
+                async with stage_limit("mistral"):
+                    responses = await self.mistral.aget_inst_infos(chunk)
+            except ValueError as e:
+                logger.warning("Batch translation failed (%s), translating one by one", e)
+                responses = await asyncio.gather(
+                    *(self._atranslate(text) for text in chunk)
+                )
+            for text, response in zip(chunk, responses):
+                inst_infos[text] = await self._acache_inst_info(text, response)
+
+        await asyncio.gather(
+            *(
+                translate(missing[start : start + TRANSLATE_BATCH_SIZE])
+                for start in range(0, len(missing), TRANSLATE_BATCH_SIZE)
+            )
+        )
+
+        vectors, missing = await self._acached_vectors(inst_infos.values())
+        if missing:
+            # 既にバッチなので batcher は通さず 1 回の forward にする
+            embeddings = await run_in_stage(
+                "embed", self.embed_batch, missing, path="queries"
+            )
+            for text, vector in zip(missing, embeddings):
+                vectors[text] = await self._acache_vector(text, vector)
+        return self._instruction_batch(instructions, inst_infos, vectors)
+
+    async def _atranslate(self, instruction: str):
+        async with stage_limit("mistral"):
+            return await self.mistral.aget_inst_info(instruction)
+
+    def _cached_inst_infos(self, instructions: List[str]) -> Tuple[dict, List[str]]:
+        """Cached translations of the distinct ``instructions`` and the missing ones"""
+        inst_infos = {}
+        for instruction in dict.fromkeys(instructions):
+            inst_infos[instruction] = self._cached_inst_info(instruction)
+        missing = [text for text, info in inst_infos.items() if info is None]
+        return inst_infos, missing
+
+    def _cached_vectors(self, inst_infos) -> Tuple[dict, List[str]]:
+        """Cached embeddings of the distinct English instructions and the missing ones"""
+        vectors = {}
+        for inst_info in inst_infos:
+            english = inst_info["english_instruction"]
+            if english not in vectors:
+                vectors[english] = self._cached_vector(english)
+        missing = [text for text, vector in vectors.items() if vector is None]
+        return vectors, missing
+
+    async def _acached_inst_infos(
+        self, instructions: List[str]
+    ) -> Tuple[dict, List[str]]:
+        inst_infos = {}
+        for instruction in dict.fromkeys(instructions):
+            inst_infos[instruction] = await self._acached_inst_info(instruction)
+        missing = [text for text, info in inst_infos.items() if info is None]
+        return inst_infos, missing
+
+    async def _acached_vectors(self, inst_infos) -> Tuple[dict, List[str]]:
+        vectors = {}
+        for inst_info in inst_infos:
+            english = inst_info["english_instruction"]
+            if english not in vectors:
+                vectors[english] = await self._acached_vector(english)
+        missing = [text for text, vector in vectors.items() if vector is None]
+        return vectors, missing
+
+    @staticmethod
+    def _instruction_batch(
+        instructions: List[str], inst_infos: dict, vectors: dict
+    ) -> List[InstructionData]:
+        results = []
+        for instruction in instructions:
+            inst_info = inst_infos[instruction]
+            english_instruction = inst_info["english_instruction"]
+            results.append(
+                InstructionData(
+                    instruction=english_instruction,
+                    ocr=inst_info["english_proper_noun_list"],
+                    instruction_feats=vectors[english_instruction],
+                )
+            )
+        return results
+
+    def _cached_inst_info(self, instruction: str) -> Optional[dict]:
+        if self.query_cache is None:
+            return None
+        cached = self.query_cache.get_translation(instruction)
+        return json.loads(cached) if cached is not None else None
+
+    def _cache_inst_info(self, instruction: str, inst_info) -> dict:
+        inst_info = inst_info.model_dump()
+        if self.query_cache is not None:
+            self.query_cache.set_translation(instruction, json.dumps(inst_info))
+        return inst_info
+
+    def _vector_cache_model(self) -> Tuple[str, int]:
+        # /api/reindex で同じ名前のモデルに差し替えても古いベクトルを返さないよう版も含める
+        return self.embedding_model, registry.version("stella")
+
+    def _cached_vector(self, english_text: str) -> Optional[np.ndarray]:
+        if self.query_cache is None:
+            return None
+        return self.query_cache.get_vector(english_text, *self._vector_cache_model())
+
+    def _cache_vector(self, english_text: str, vector: np.ndarray) -> np.ndarray:
+        if self.query_cache is not None:
+            model_name, version = self._vector_cache_model()
+            self.query_cache.set_vector(english_text, model_name, vector, version)
+        return vector
+
+    # 以下はイベントループ用（キャッシュの SQLite 側はスレッドで読み書きする）
+    async def _acached_inst_info(self, instruction: str) -> Optional[dict]:
+        if self.query_cache is None:
+            return None
+        cached = await self.query_cache.aget_translation(instruction)
+        return json.loads(cached) if cached is not None else None
+
+    async def _acache_inst_info(self, instruction: str, inst_info) -> dict:
+        inst_info = inst_info.model_dump()
+        if self.query_cache is not None:
+            await self.query_cache.aset_translation(instruction, json.dumps(inst_info))
+        return inst_info
+
+    async def _acached_vector(self, english_text: str) -> Optional[np.ndarray]:
+        if self.query_cache is None:
+            return None
+        return await self.query_cache.aget_vector(
+            english_text, *self._vector_cache_model()
+        )
+
+    async def _acache_vector(self, english_text: str, vector: np.ndarray) -> np.ndarray:
+        if self.query_cache is not None:
+            model_name, version = self._vector_cache_model()
+            await self.query_cache.aset_vector(english_text, model_name, vector, version)
+        return vector
+
 
 if __name__ == "__main__":
     processer = Processer()
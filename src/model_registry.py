@@ -0,0 +1,137 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+STELLA_MODEL_NAME = "dunzhang/stella_en_400M_v5"
+
+logger = logging.getLogger(__name__)
+
+
+def split_model_name(model_name: str) -> Tuple[str, Optional[int]]:
+    """``"<model>@<dim>"`` -> (model, truncated dimension); plain names keep the full output"""
+    name, sep, dim = model_name.rpartition("@")
+    if sep and dim.isdigit():
+        return name, int(dim)
+    return model_name, None
+
+
+# 埋め込みの推論バックエンド（CPU では onnx / int8 の方が速い。scripts.check_embedder_parity で確認）
+EMBED_BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+
+def load_embedder(model_name: str = STELLA_MODEL_NAME, backend: Optional[str] = None):
+    # Matryoshka 学習済みなので先頭 256 / 512 / 768 次元だけでも使える（"...@256"）
+    model_name, truncate_dim = split_model_name(model_name)
+    backend = backend or os.environ.get("WR_EMBED_BACKEND", "torch")
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(
+            f"Unknown embedding backend {backend!r}, expected one of {EMBED_BACKENDS}"
+        )
+    threads = os.environ.get("WR_EMBED_THREADS")
+    kwargs = dict(
+        model_name=model_name,
+        truncate_dim=truncate_dim,
+        cache_folder=os.environ.get("WR_MODEL_CACHE_DIR"),
+        local_files_only=os.environ.get("WR_MODEL_OFFLINE", "0") == "1",
+        quantize=backend.endswith("-int8"),
+        threads=int(threads) if threads else None,
+    )
+
+    # torch / sentence_transformers の import 自体が重いので読み込み時まで遅らせる
+    if backend.startswith("onnx"):
+        from src.stella_onnx import OnnxStellaEmbedder
+
+        return OnnxStellaEmbedder(**kwargs)
+
+    from src.stella import StellaEmbedder
+
+    return StellaEmbedder(**kwargs)
+
+
+def _load_mistral():
+    from src.mistralai_api import MistralModel
+
+    return MistralModel()
+
+
+class ModelRegistry:
+    """Process-wide registry that loads each model at most once.
+
+    ``get`` loads on first use (blocking); ``preload`` loads in a background
+    thread so the server can accept requests (static pages, readiness probes)
+    while the weights are read.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._status: Dict[str, str] = {}
+        self._load_seconds: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        # 登録・差し替えのたびに増える。キャッシュのキーに入れて古いモデルの結果を避ける
+        self._versions: Dict[str, int] = {}
+
+    def register(self, name: str, factory: Callable[[], Any]):
+        self._factories[name] = factory
+        self._locks[name] = threading.Lock()
+        self._status[name] = "not_loaded"
+        self._versions[name] = self._versions.get(name, 0) + 1
+
+    def get(self, name: str) -> Any:
+        """Return the model, loading it if this is the first use"""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+
+        with self._locks[name]:
+            if name not in self._models:
+                self._status[name] = "loading"
+                start = time.perf_counter()
+                try:
+                    self._models[name] = self._factories[name]()
+                except Exception as e:
+                    self._status[name] = f"failed: {e}"
+                    raise
+                self._load_seconds[name] = time.perf_counter() - start
+                self._status[name] = "ready"
+                logger.info("Loaded model '%s' in %.1f s", name, self._load_seconds[name])
+        return self._models[name]
+
+    def replace(self, name: str, model: Any):
+        """Swap in an already loaded model (e.g. after re-embedding with a new one)"""
+        with self._locks[name]:
+            self._models[name] = model
+            self._status[name] = "ready"
+            self._versions[name] += 1
+
+    def preload(self, names: Iterable[str]):
+        """Load models in a background thread"""
+
+        def load():
+            for name in names:
+                try:
+                    self.get(name)
+                except Exception as e:
+                    logger.exception("Error preloading model '%s': %s", name, e)
+
+        threading.Thread(target=load, name="model-preload", daemon=True).start()
+
+    def version(self, name: str) -> int:
+        """Generation of the model under ``name``; changes on every register / replace"""
+        return self._versions[name]
+
+    def is_ready(self, names: Iterable[str]) -> bool:
+        return all(self._status.get(name) == "ready" for name in names)
+
+    def status(self) -> Dict[str, dict]:
+        return {
+            name: {"status": status, "load_seconds": self._load_seconds.get(name)}
+            for name, status in self._status.items()
+        }
+
+
+registry = ModelRegistry()
+registry.register("stella", load_embedder)
+registry.register("mistral", _load_mistral)
@@ -0,0 +1,225 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+
+def normalize_query(text: str) -> str:
+    """Cache key for a raw user query (NFKC, case-folded, collapsed whitespace)"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+class LRUCache:
+    """In-process LRU with a per-entry TTL"""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Tuple[str, str], value: Any):
+        with self._lock:
+            self._data[key] = (time.time() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class SqliteCache:
+    """Persistent cache tier in its own SQLite file"""
+
+    def __init__(self, db_path: Path, ttl: float = 30 * 86400.0):
+        self.ttl = ttl
+        self.conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._lock = threading.Lock()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS query_cache (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value BLOB NOT NULL,
+                expires_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            );
+        """
+        )
+        self.conn.execute("DELETE FROM query_cache WHERE expires_at < ?", (time.time(),))
+        self.conn.commit()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            row = self.conn.execute(
+                """
+                SELECT value FROM query_cache
+                WHERE namespace = ? AND key = ? AND expires_at >= ?
+            """,
+                (*key, time.time()),
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: Tuple[str, str], value: bytes):
+        with self._lock:
+            self.conn.execute(
+                """
+                INSERT OR REPLACE INTO query_cache (namespace, key, value, expires_at)
+                VALUES (?, ?, ?, ?)
+            """,
+                (*key, value, time.time() + self.ttl),
+            )
+            self.conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM query_cache").fetchone()[0]
+
+
+class QueryCache:
+    """Two-level (memory LRU + SQLite) cache for query translations and query vectors.
+
+    Translations are keyed on the normalized raw query, vectors on the English
+    text, the embedding model name and its registry version (so a reindex or a
+    swapped model never reads vectors of the previous one). The ``a*`` methods read and write the
+    SQLite tier in a thread, for use on the event loop.
+    """
+
+    def __init__(
+        self,
+        db_path: Path = Path("query_cache.db"),
+        maxsize: int = 1024,
+        memory_ttl: float = 3600.0,
+        disk_ttl: float = 30 * 86400.0,
+    ):
+        self.memory = LRUCache(maxsize=maxsize, ttl=memory_ttl)
+        self.disk = SqliteCache(Path(db_path), ttl=disk_ttl)
+        self.counters: Dict[str, Dict[str, int]] = {
+            namespace: {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+            for namespace in ("translation", "vector")
+        }
+
+    def _get(self, namespace: str, key: str) -> Optional[Any]:
+        value = self._get_memory(namespace, key)
+        if value is not None:
+            return value
+        return self._get_disk(namespace, key)
+
+    async def _aget(self, namespace: str, key: str) -> Optional[Any]:
+        # メモリのヒットはループ上で返し、SQLite だけをスレッドで引く
+        value = self._get_memory(namespace, key)
+        if value is not None:
+            return value
+        return await asyncio.to_thread(self._get_disk, namespace, key)
+
+    def _get_memory(self, namespace: str, key: str) -> Optional[Any]:
+        value = self.memory.get((namespace, key))
+        if value is not None:
+            self.counters[namespace]["memory_hits"] += 1
+        return value
+
+    def _get_disk(self, namespace: str, key: str) -> Optional[Any]:
+        counters = self.counters[namespace]
+        raw = self.disk.get((namespace, key))
+        if raw is None:
+            counters["misses"] += 1
+            return None
+        counters["disk_hits"] += 1
+        value = self._decode(namespace, raw)
+        self.memory.set((namespace, key), value)  # メモリ側に昇格
+        return value
+
+    def _set(self, namespace: str, key: str, value: Any):
+        self.memory.set((namespace, key), value)
+        self.disk.set((namespace, key), self._encode(namespace, value))
+
+    async def _aset(self, namespace: str, key: str, value: Any):
+        self.memory.set((namespace, key), value)
+        await asyncio.to_thread(
+            self.disk.set, (namespace, key), self._encode(namespace, value)
+        )
+
+    @staticmethod
+    def _encode(namespace: str, value: Any) -> bytes:
+        if namespace == "vector":
+            return np.asarray(value, dtype=np.float32).tobytes()
+        return value.encode("utf-8")
+
+    @staticmethod
+    def _decode(namespace: str, raw: bytes) -> Any:
+        if namespace == "vector":
+            return np.frombuffer(raw, dtype=np.float32).copy()
+        return raw.decode("utf-8")
+
+    def get_translation(self, query: str) -> Optional[str]:
+        """Cached InstInfo JSON for a raw query"""
+        return self._get("translation", normalize_query(query))
+
+    def set_translation(self, query: str, inst_info_json: str):
+        self._set("translation", normalize_query(query), inst_info_json)
+
+    @staticmethod
+    def vector_key(english_text: str, model_name: str, version: int = 0) -> str:
+        return f"{model_name}\n{version}\n{english_text}"
+
+    def get_vector(
+        self, english_text: str, model_name: str, version: int = 0
+    ) -> Optional[np.ndarray]:
+        return self._get("vector", self.vector_key(english_text, model_name, version))
+
+    def set_vector(
+        self, english_text: str, model_name: str, vector: np.ndarray, version: int = 0
+    ):
+        self._set("vector", self.vector_key(english_text, model_name, version), vector)
+
+    async def aget_translation(self, query: str) -> Optional[str]:
+        return await self._aget("translation", normalize_query(query))
+
+    async def aset_translation(self, query: str, inst_info_json: str):
+        await self._aset("translation", normalize_query(query), inst_info_json)
+
+    async def aget_vector(
+        self, english_text: str, model_name: str, version: int = 0
+    ) -> Optional[np.ndarray]:
+        return await self._aget(
+            "vector", self.vector_key(english_text, model_name, version)
+        )
+
+    async def aset_vector(
+        self, english_text: str, model_name: str, vector: np.ndarray, version: int = 0
+    ):
+        await self._aset(
+            "vector", self.vector_key(english_text, model_name, version), vector
+        )
+
+    def stats(self) -> dict:
+        stats = {}
+        for namespace, counters in self.counters.items():
+            lookups = sum(counters.values())
+            hits = counters["memory_hits"] + counters["disk_hits"]
+            stats[namespace] = {
+                **counters,
+                "hit_rate": hits / lookups if lookups else 0.0,
+            }
+        stats["memory_entries"] = len(self.memory)
+        stats["disk_entries"] = len(self.disk)
+        return stats
@@ -21,15 +21,65 @@ document.addEventListener("DOMContentLoaded", () => {
   }
 });
 
+const PAGE_SIZE = 50;
+
+// 次のページの URL（サーバーの next_cursor から作る。最後のページなら null）
+let nextPageUrl = null;
+let nextPageIsSearch = false;
+let nextPageHasScores = false;
+let pageLoading = false;
+
+function withCursor(url, cursor) {
+  return cursor ? `${url}&cursor=${encodeURIComponent(cursor)}` : null;
+}
+
+async function loadNextPage() {
+  if (!nextPageUrl || pageLoading) return;
+  pageLoading = true;
+  try {
+    const baseUrl = nextPageUrl.replace(/&cursor=[^&]*$/, "");
+    const response = await fetch(nextPageUrl);
+    if (!response.ok) {
+      throw new Error(`Failed to fetch page (${response.status})`);
+    }
+    const data = await response.json();
+    nextPageUrl = withCursor(baseUrl, data.next_cursor);
+    displayDebates(data.debates, nextPageIsSearch, nextPageHasScores, true);
+  } catch (error) {
+    console.error("Error fetching next page:", error);
+    nextPageUrl = null;
+  } finally {
+    pageLoading = false;
+  }
+}
+
+// 一覧の末尾が見えたら次のページを読む
+function setupInfiniteScroll() {
+  const container = document.querySelector(".image-text-pair");
+  if (!container || document.querySelector(".page-sentinel")) return;
+  const sentinel = document.createElement("div");
+  sentinel.className = "page-sentinel";
+  container.after(sentinel);
+  new IntersectionObserver((entries) => {
+    if (entries.some((entry) => entry.isIntersecting)) loadNextPage();
+  }).observe(sentinel);
+}
+
 async function fetchDebates() {
   try {
-    const response = await fetch("/api/debates");
+    const url = `/api/debates?limit=${PAGE_SIZE}`;
+    const response = await fetch(url);
     if (!response.ok) {
       throw new Error("Failed to fetch debates");
     }
 
     const data = await response.json();
     displayDebates(data.debates);
+
+    nextPageUrl = withCursor(url, data.next_cursor);
+    nextPageIsSearch = false;
+    nextPageHasScores = false;
+    setupInfiniteScroll();
   } catch (error) {
     console.error("Error fetching debates:", error);
     document.querySelector(".image-text-pair").innerHTML = `
@@ -60,7 +110,7 @@ async function performAPISearch(query) {
 
     const url = `/api/search-debates?query=${encodeURIComponent(
       query
-    )}&minimum_score=${minimum_score}&include_all=${include_all}`;
+    )}&minimum_score=${minimum_score}&include_all=${include_all}&limit=${PAGE_SIZE}`;
     console.log(`Fetching from: ${url}`);
 
     const response = await fetch(url);
@@ -94,6 +144,12 @@ async function performAPISearch(query) {
     // Display the results
     displayDebates(data.debates, true, hasScores);
 
+    // Remaining pages are loaded while scrolling
+    nextPageUrl = withCursor(url, data.next_cursor);
+    nextPageIsSearch = true;
+    nextPageHasScores = hasScores;
+    setupInfiniteScroll();
+
     // Count relevant results (with score > 0)
     const relevantResults = data.debates.filter(
       (debate) => debate.score > 0
@@ -132,13 +188,20 @@ async function performAPISearch(query) {
   }
 }
 
-function displayDebates(debates, isSearchResult = false, hasScores = false) {
+function displayDebates(
+  debates,
+  isSearchResult = false,
+  hasScores = false,
+  append = false
+) {
   console.log("Rendering debates:", debates);
 
   const container = document.querySelector(".image-text-pair");
-  container.innerHTML = "";
+  if (!append) {
+    container.innerHTML = "";
+  }
 
-  if (debates.length === 0) {
+  if (debates.length === 0 && !append) {
     container.innerHTML = `
             <div class="no-debates">
                 <p>${
@@ -303,6 +366,8 @@ function displayDebates(debates, isSearchResult = false, hasScores = false) {
 
   container.appendChild(debatesFragment);
 
+  if (document.querySelector(".add-button")) return;
+
   // Add floating button to create a new record
   const addButton = document.createElement("div");
   addButton.className = "add-button";
@@ -1,19 +1,55 @@
 document.addEventListener("DOMContentLoaded", async function () {
   const imagesContainer = document.querySelector(".images");
+  const PAGE_SIZE = 60;
 
-  async function fetchImageData() {
-    const response = await fetch("/api/debates");
-    const data = await response.json();
-    debates = data.debates;
-    let return_data = [];
-    debates.forEach((item) => {
-      return_data.push({
-        id: item.id,
-        src: item.image_path,
-        text: item.tldr,
+  let nextCursor = null;
+  let loading = false;
+  let finished = false;
+
+  // NDJSON を 1 行ずつ読み、届いた順に onItem を呼ぶ
+  async function readNdjson(response, onItem) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop();
+      lines.filter((line) => line.trim()).forEach((line) => onItem(JSON.parse(line)));
+    }
+    if (buffer.trim()) onItem(JSON.parse(buffer));
+  }
+
+  async function loadNextPage() {
+    if (loading || finished) return;
+    loading = true;
+
+    let url = `/api/debates?stream=true&limit=${PAGE_SIZE}`;
+    if (nextCursor) url += `&cursor=${encodeURIComponent(nextCursor)}`;
+
+    try {
+      const response = await fetch(url);
+      nextCursor = null;
+      // 最初の行が届いた時点から描画する
+      await readNdjson(response, (item) => {
+        if ("next_cursor" in item) {
+          nextCursor = item.next_cursor;
+          return;
+        }
+        addImageBlock({
+          id: item.id,
+          src: item.image_path,
+          text: item.tldr,
+        });
       });
-    });
-    return return_data;
+      finished = !nextCursor;
+    } catch (error) {
+      console.error("Error fetching debates:", error);
+    } finally {
+      loading = false;
+    }
   }
 
   function addImageBlock(data) {
@@ -26,6 +62,7 @@ document.addEventListener("DOMContentLoaded", async function () {
     const img = document.createElement("img");
     img.src = data.src;
     img.alt = data.text;
+    img.loading = "lazy";
     link.appendChild(img);
 
     const description = document.createElement("p");
@@ -38,6 +75,13 @@ document.addEventListener("DOMContentLoaded", async function () {
     imagesContainer.appendChild(blockDiv);
   }
 
-  const imageData = await fetchImageData();
-  imageData.forEach(addImageBlock);
+  // 末尾が見えたら次のページを読む
+  const sentinel = document.createElement("div");
+  sentinel.className = "page-sentinel";
+  imagesContainer.after(sentinel);
+  new IntersectionObserver((entries) => {
+    if (entries.some((entry) => entry.isIntersecting)) loadNextPage();
+  }).observe(sentinel);
+
+  await loadNextPage();
 });
@@ -2,18 +2,53 @@ import numpy as np
 import torch
 from sentence_transformers import SentenceTransformer
 
+# CPU 推論用の設定（xformers の memory efficient attention / unpad は GPU 向け）
+CPU_CONFIG_KWARGS = {"use_memory_efficient_attention": False, "unpad_inputs": False}
+
 
 class StellaEmbedder:
-    def __init__(self):
+    def __init__(
+        self,
+        model_name: str = "dunzhang/stella_en_400M_v5",
+        cache_folder: str | None = None,
+        local_files_only: bool = False,
+        truncate_dim: int | None = None,
+        quantize: bool = False,
+        threads: int | None = None,
+    ):
+        self.model_name = model_name
+        self.truncate_dim = truncate_dim
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        if quantize:
+            # 動的 int8 量子化は CPU でしか動かない
+            self.device = "cpu"
+        if threads:
+            # プロセス全体の設定（embed ステージの同時実行数 × threads ≦ コア数にする）
+            torch.set_num_threads(threads)
+        # cache_folder を指定するとそこからモデルを読み込む（local_files_only ならダウンロードしない）
         self.model = SentenceTransformer(
-            "dunzhang/stella_en_400M_v5", trust_remote_code=True
+            model_name,
+            trust_remote_code=True,
+            cache_folder=cache_folder,
+            local_files_only=local_files_only,
+            truncate_dim=truncate_dim,
+            config_kwargs=CPU_CONFIG_KWARGS if quantize else None,
         ).to(self.device)
+        if quantize:
+            # Linear 層の重みを int8 にし、活性は推論時に動的に量子化する
+            self.model = torch.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8
+            )
 
     def embed_text(self, text):
-        result = self.model.encode(text)  ## stellaの出力は1024次元
+        result = self.model.encode(text)  ## stellaの出力は1024次元（truncate_dim 指定時はその次元）
         return np.array(result)
 
+    def embed_batch(self, texts, batch_size: int = 32):
+        """複数のテキストを 1 回の forward でまとめて埋め込む (n, 1024 or truncate_dim)"""
+        result = self.model.encode(list(texts), batch_size=batch_size)
+        return np.asarray(result, dtype=np.float32)
+
 
 if __name__ == "__main__":
     embedder = StellaEmbedder()
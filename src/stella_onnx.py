@@ -0,0 +1,173 @@
+import inspect
+import json
+import logging
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def export_onnx(
+    model_name: str,
+    export_dir: Path,
+    cache_folder: str | None = None,
+    local_files_only: bool = False,
+):
+    """Export the whole SentenceTransformer pipeline (encoder, pooling, dense) to ONNX
+
+    Writes ``model.onnx``, ``model_int8.onnx`` (dynamic int8 weights), the
+    tokenizer and ``embedder.json`` to ``export_dir``. torch is only needed here.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    from src.stella import CPU_CONFIG_KWARGS
+
+    model = SentenceTransformer(
+        model_name,
+        trust_remote_code=True,
+        cache_folder=cache_folder,
+        local_files_only=local_files_only,
+        device="cpu",
+        config_kwargs=CPU_CONFIG_KWARGS,
+    ).eval()
+
+    class Pipeline(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            features = {"input_ids": input_ids, "attention_mask": attention_mask}
+            return self.model(features)["sentence_embedding"]
+
+    export_dir.mkdir(parents=True, exist_ok=True)
+    sample = model.tokenizer(
+        ["whiteboard", "a longer sample text"], padding=True, return_tensors="pt"
+    )
+    # torch >= 2.9 の既定は dynamo 版（onnxscript が必要で remote code の追跡に弱い）
+    exporter = (
+        {"dynamo": False}
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters
+        else {}
+    )
+    with torch.no_grad():
+        torch.onnx.export(
+            Pipeline(),
+            (sample["input_ids"], sample["attention_mask"]),
+            str(export_dir / "model.onnx"),
+            input_names=["input_ids", "attention_mask"],
+            output_names=["sentence_embedding"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "sentence_embedding": {0: "batch"},
+            },
+            opset_version=17,
+            **exporter,
+        )
+    quantize_dynamic(
+        str(export_dir / "model.onnx"),
+        str(export_dir / "model_int8.onnx"),
+        weight_type=QuantType.QInt8,
+    )
+    model.tokenizer.save_pretrained(str(export_dir))
+    (export_dir / "embedder.json").write_text(
+        json.dumps({"model_name": model_name, "max_seq_length": model.max_seq_length})
+    )
+    logger.info("Exported %s to %s", model_name, export_dir)
+
+
+class OnnxStellaEmbedder:
+    """Stella on ONNX Runtime (CPU), with the same interface as StellaEmbedder
+
+    The model is exported on first use; afterwards neither torch nor the
+    PyTorch weights are loaded. ``quantize`` uses the int8 weight variant.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "dunzhang/stella_en_400M_v5",
+        cache_folder: str | None = None,
+        local_files_only: bool = False,
+        truncate_dim: int | None = None,
+        quantize: bool = False,
+        threads: int | None = None,
+    ):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        self.model_name = model_name
+        self.truncate_dim = truncate_dim
+        # エクスポートしたモデルはモデルキャッシュの onnx/ 以下に置く
+        export_dir = (
+            Path(cache_folder or "model_cache") / "onnx" / model_name.replace("/", "__")
+        )
+        if not (export_dir / "embedder.json").exists():
+            export_onnx(model_name, export_dir, cache_folder, local_files_only)
+        config = json.loads((export_dir / "embedder.json").read_text())
+        self.max_seq_length = config["max_seq_length"]
+        self.tokenizer = AutoTokenizer.from_pretrained(str(export_dir))
+
+        options = ort.SessionOptions()
+        if threads:
+            # 1 回の forward 内の並列数（embed ステージの同時実行数 × threads ≦ コア数にする）
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = "model_int8.onnx" if quantize else "model.onnx"
+        self.session = ort.InferenceSession(
+            str(export_dir / model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.output_dim = self._output_dim()
+
+    def _output_dim(self) -> int:
+        """Width of ``sentence_embedding`` (before truncation)"""
+        dim = self.session.get_outputs()[0].shape[-1]
+        if isinstance(dim, int):
+            return dim
+        # 次元が記号のままのモデルでは 1 件埋め込んで確かめる
+        tokens = self.tokenizer(["whiteboard"], return_tensors="np")
+        (embeddings,) = self.session.run(
+            None,
+            {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": tokens["attention_mask"].astype(np.int64),
+            },
+        )
+        return embeddings.shape[1]
+
+    def embed_text(self, text):
+        return self.embed_batch([text])[0]
+
+    def embed_batch(self, texts, batch_size: int = 32):
+        """複数のテキストを 1 回の forward でまとめて埋め込む (n, 1024 or truncate_dim)"""
+        texts = list(texts)
+        # SentenceTransformer.encode と同じく長さ順に並べてパディングを減らす
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        outputs = []
+        for start in range(0, len(texts), batch_size):
+            tokens = self.tokenizer(
+                [texts[i] for i in order[start : start + batch_size]],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            (embeddings,) = self.session.run(
+                None,
+                {
+                    "input_ids": tokens["input_ids"].astype(np.int64),
+                    "attention_mask": tokens["attention_mask"].astype(np.int64),
+                },
+            )
+            outputs.append(embeddings)
+        if not outputs:
+            return np.empty((0, self.truncate_dim or self.output_dim), dtype=np.float32)
+        result = np.empty_like(outputs[0], shape=(len(texts), outputs[0].shape[1]))
+        result[order] = np.concatenate(outputs)
+        if self.truncate_dim:
+            result = result[:, : self.truncate_dim]
+        return np.asarray(result, dtype=np.float32)
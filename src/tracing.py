@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import uuid
+from contextvars import ContextVar
+from typing import Optional
+
+# リクエストごとの trace ID（ログに付けて Processer / VectorStore まで追えるようにする）
+trace_id_var: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def get_trace_id() -> Optional[str]:
+    """Trace ID of the current request or job (None outside of one)"""
+    return trace_id_var.get()
+
+
+def set_trace_id(trace_id: Optional[str]):
+    """Set the trace ID of the current context; returns the token for ``reset_trace_id``"""
+    return trace_id_var.set(trace_id)
+
+
+def reset_trace_id(token):
+    trace_id_var.reset(token)
+
+
+class TraceIdFilter(logging.Filter):
+    """Add the current trace ID to every record as ``trace_id``"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id_var.get() or "-"
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line (for log collectors)"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": getattr(record, "trace_id", "-"),
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def configure_logging(level: str | None = None, json_lines: bool | None = None):
+    """Log to stderr with the trace ID (level from WR_LOG_LEVEL, JSON lines if WR_LOG_JSON=1)"""
+    level = level or os.environ.get("WR_LOG_LEVEL", "INFO")
+    if json_lines is None:
+        json_lines = os.environ.get("WR_LOG_JSON", "0") == "1"
+    handler = logging.StreamHandler()
+    handler.addFilter(TraceIdFilter())
+    handler.setFormatter(
+        JsonFormatter()
+        if json_lines
+        else logging.Formatter(
+            "%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"
+        )
+    )
+    # アプリのロガー（src.*, app）だけに付ける。uvicorn のログはそのまま
+    for name in ("src", "app"):
+        logger = logging.getLogger(name)
+        logger.handlers = [handler]
+        logger.setLevel(level.upper())
+        logger.propagate = False
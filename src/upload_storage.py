@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import BinaryIO, NamedTuple, Optional
+
+from src.image_preprocess import MIME_EXTENSIONS, detect_mime
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# アップロード画像の置き場所（作業ディレクトリからの相対パス）と、DB に保存する URL パスの接頭辞
+UPLOADS_DIR = Path("src/static/uploads")
+UPLOADS_URL_PREFIX = "static/uploads/"
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded the size limit (the partial file has been removed)"""
+
+
+class StoredUpload(NamedTuple):
+    path: Path
+    content_hash: str
+    size: int
+
+
+def store_upload(
+    source: BinaryIO,
+    uploads_dir: Path,
+    filename: Optional[str] = None,
+    max_bytes: Optional[int] = None,
+) -> StoredUpload:
+    """Copy ``source`` in chunks to ``<sha256>.<ext>`` in ``uploads_dir``
+
+    The file is written to a temp file next to its destination and renamed
+    into place, so a partially written upload is never visible. The
+    extension comes from the magic bytes, so the same image always maps to
+    the same file; if that file already exists the new copy is dropped.
+    Blocking: call it from a worker thread.
+    """
+    digest = hashlib.sha256()
+    size = 0
+    extension = None
+    fd, tmp_name = tempfile.mkstemp(dir=uploads_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if max_bytes is not None and size > max_bytes:
+                    raise UploadTooLarge(
+                        f"Upload exceeds the limit of {max_bytes // (1024 * 1024)} MiB"
+                    )
+                if extension is None:
+                    extension = MIME_EXTENSIONS.get(detect_mime(chunk))
+                digest.update(chunk)
+                f.write(chunk)
+
+        if size == 0:
+            raise ValueError("Uploaded file is empty")
+        if extension is None:
+            filename = filename or "uploaded_image"
+            extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else "jpg"
+        content_hash = digest.hexdigest()
+        path = uploads_dir / f"{content_hash}.{extension}"
+
+        if path.exists():
+            logger.info("Image already stored at %s", path)
+            os.remove(tmp_name)
+        else:
+            logger.info("Saving file to %s (%d bytes)", path, size)
+            os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+    return StoredUpload(path, content_hash, size)
+
+
+def upload_url_path(path: Path) -> str:
+    """Path stored in the database and served to the client for a stored upload"""
+    return UPLOADS_URL_PREFIX + path.name
+
+
+def upload_file_path(
+    image_path: str, uploads_dir: Path = UPLOADS_DIR
+) -> Optional[Path]:
+    """The file in ``uploads_dir`` behind a stored image path
+
+    Accepts the ``static/uploads/<name>`` form as well as older rows stored
+    with a ``src/`` prefix or a leading slash. Returns None for paths outside
+    the uploads directory.
+    """
+    url_path = image_path.lstrip("/")
+    if url_path.startswith("src/"):
+        url_path = url_path[4:]
+    if not url_path.startswith(UPLOADS_URL_PREFIX):
+        return None
+    name = url_path[len(UPLOADS_URL_PREFIX) :]
+    if not name or "/" in name or name in (".", ".."):
+        return None
+    return uploads_dir / name
@@ -0,0 +1,71 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from src.domain.index_factory import IndexConfig
+from src.domain.vector_store import VectorStore
+
+DIMENSION = 8
+
+
+def unit_vectors(n: int, seed: int = 0, dimension: int = DIMENSION) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def make_store(tmp_path):
+    """Open a VectorStore on a temporary database (closed after the test)"""
+    stores = []
+
+    def make(**kwargs) -> VectorStore:
+        kwargs.setdefault("index_config", IndexConfig(kind="flat"))
+        kwargs.setdefault("debate_index", False)
+        kwargs.setdefault("uploads_dir", tmp_path / "src" / "static" / "uploads")
+        kwargs["uploads_dir"].mkdir(parents=True, exist_ok=True)
+        store = VectorStore(
+            dimension=DIMENSION, db_path=str(tmp_path / "vectors.db"), **kwargs
+        )
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        if not store.persistence._stopped.is_set():  # テスト内で閉じていなければ
+            store.close()
+
+
+def png_bytes(seed: int) -> bytes:
+    """A small PNG whose content (and so content hash) depends on ``seed``"""
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (8, 8, 3), dtype=np.uint8)).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture(scope="session")
+def app_module(tmp_path_factory):
+    """app.py imported in a temporary working directory (its data paths are relative)"""
+    workdir = tmp_path_factory.mktemp("app")
+    (workdir / "src" / "static" / "uploads").mkdir(parents=True)
+    patch = pytest.MonkeyPatch()
+    patch.chdir(workdir)
+    # モデルは読み込まない（画像の処理・埋め込みは各テストで差し替える）
+    patch.setenv("WR_LAZY_MODELS", "1")
+    patch.setenv("WR_INDEX_KIND", "flat")
+    import app
+
+    yield app
+    app.vector_store.close()
+    patch.undo()
+
+
+@pytest.fixture
+def client(app_module):
+    from fastapi.testclient import TestClient
+
+    with TestClient(app_module.app) as client:
+        yield client
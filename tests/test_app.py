@@ -0,0 +1,183 @@
+import base64
+import json
+import time
+
+import pytest
+
+from conftest import png_bytes
+
+
+def _upload(client, debate_id: int, seed: int) -> dict:
+    response = client.post(
+        "/api/add",
+        params={"debate_id": str(debate_id)},
+        files={"file": ("board.png", png_bytes(seed), "image/png")},
+    )
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def _wait_for_status(client, image_id: int, statuses, timeout: float = 5.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = client.get(f"/api/image/{image_id}/status").json()
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.02)
+    raise AssertionError(f"image {image_id} is still {status}")
+
+
+def test_image_status_reports_failures(app_module, client, monkeypatch):
+    async def process(path):
+        raise RuntimeError("Mistral is down")
+
+    monkeypatch.setattr(app_module.vector_store.processer, "aprocess_image", process)
+    monkeypatch.setattr(app_module.ingest_queue, "max_attempts", 1)
+    debate_id = app_module.vector_store.add_debate("status", "")
+
+    uploaded = _upload(client, debate_id, seed=1)
+    # ワーカーが先に走れば応答の時点で失敗済みのこともある
+    assert uploaded["status"] in ("pending", "processing", "failed")
+
+    status = _wait_for_status(client, uploaded["image_id"], ("indexed", "failed"))
+    assert status == {
+        "image_id": uploaded["image_id"],
+        "status": "failed",
+        "attempts": 1,
+        "last_error": "Mistral is down",
+    }
+
+
+def test_image_status_of_an_unknown_image_is_404(client):
+    assert client.get("/api/image/999999/status").status_code == 404
+
+
+@pytest.fixture
+def debates(app_module):
+    """Ten more debates; returns every debate id, most recently updated first"""
+    store = app_module.vector_store
+    for i in range(10):
+        store.add_debate(f"cursor {i}", "")
+    return [row[0] for row in store.list_debates(limit=10_000)]
+
+
+@pytest.fixture
+def ranked(app_module, debates, monkeypatch):
+    """Make the hybrid search return three fixed debates (scores 0.9, 0.6, 0.3)"""
+    ids = [debates[4], debates[1], debates[7]]
+    rows = [
+        (debate_id, "", "", "", None, score)
+        for debate_id, score in zip(ids, (0.9, 0.6, 0.3))
+    ]
+
+    async def asearch_debates(query, k=20, minimum_score=0.0):
+        return query, rows
+
+    monkeypatch.setattr(app_module.vector_store, "asearch_debates", asearch_debates)
+    return ids
+
+
+def _pages(client, url: str, **params) -> list:
+    """Follow next_cursor to the end; returns the ids of each page"""
+    pages, cursor = [], None
+    while True:
+        response = client.get(url, params={**params, "cursor": cursor or ""})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        pages.append([debate["id"] for debate in body["debates"]])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            return pages
+        assert len(pages) < 100
+
+
+def _search_order(debates: list, ranked: list) -> list:
+    """Ranked debates first, then the rest, most recently updated first"""
+    return ranked + [debate_id for debate_id in debates if debate_id not in ranked]
+
+
+def _cursor(state: dict) -> str:
+    return base64.urlsafe_b64encode(json.dumps(state).encode()).decode()
+
+
+@pytest.mark.parametrize("limit", [1, 3, 4])
+def test_debate_cursors_cover_every_debate_once(client, debates, limit):
+    pages = _pages(client, "/api/debates", limit=limit)
+    assert [debate_id for page in pages for debate_id in page] == debates
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+@pytest.mark.parametrize("limit", [2, 3, 5])
+def test_search_cursors_hand_over_from_ranked_to_the_rest(
+    client, debates, ranked, limit
+):
+    pages = _pages(
+        client, "/api/search-debates", query="q", include_all=True, limit=limit
+    )
+    ids = [debate_id for page in pages for debate_id in page]
+    # スコア順の 3 件の後に残りが更新日時順で続き、重複も抜けもない
+    assert ids == _search_order(debates, ranked)
+    assert all(len(page) == limit for page in pages[:-1])
+
+
+def test_search_cursor_after_the_ranked_debates_is_after_null(client, debates, ranked):
+    body = client.get(
+        "/api/search-debates", params={"query": "q", "include_all": True, "limit": 3}
+    ).json()
+    assert [debate["id"] for debate in body["debates"]] == ranked
+    assert json.loads(base64.urlsafe_b64decode(body["next_cursor"])) == {"after": None}
+
+    params = {"query": "q", "include_all": True, "limit": 3}
+    body = client.get(
+        "/api/search-debates", params={**params, "cursor": body["next_cursor"]}
+    ).json()
+    rest = _search_order(debates, ranked)[3:]
+    assert [debate["id"] for debate in body["debates"]] == rest[:3]
+    assert all(debate["score"] == 0.0 for debate in body["debates"])
+
+
+def test_search_without_include_all_ends_after_the_ranked(client, ranked):
+    pages = _pages(client, "/api/search-debates", query="q", limit=2)
+    assert pages == [ranked[:2], ranked[2:]]
+
+
+@pytest.mark.parametrize("url", ["/api/debates", "/api/search-debates"])
+def test_stream_ends_with_the_next_cursor(client, debates, ranked, url):
+    params = {"query": "q", "include_all": True, "limit": 4, "stream": True}
+    ids, cursor = [], None
+    for _ in range(100):
+        response = client.get(url, params={**params, "cursor": cursor or ""})
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert list(lines[-1]) == ["next_cursor"]
+        ids += [line["id"] for line in lines[:-1]]
+        cursor = lines[-1]["next_cursor"]
+        if cursor is None:
+            break
+    if url == "/api/search-debates":
+        assert ids == _search_order(debates, ranked)
+    else:
+        assert ids == debates
+
+
+@pytest.mark.parametrize(
+    "url, cursor",
+    [
+        ("/api/debates", "not-a-cursor"),
+        ("/api/debates", _cursor(["after"])),
+        ("/api/debates", _cursor({"after": 5})),
+        ("/api/debates", _cursor({"after": ["2024-01-01", "x"]})),
+        ("/api/debates", _cursor({"offset": 3})),
+        ("/api/search-debates", "not-a-cursor"),
+        ("/api/search-debates", _cursor({"offset": "3"})),
+        ("/api/search-debates", _cursor({"offset": -1})),
+        ("/api/search-debates", _cursor({"offset": 0, "after": None})),
+    ],
+)
+def test_bad_cursor_is_400(client, ranked, url, cursor):
+    for stream in (False, True):
+        response = client.get(
+            url, params={"query": "q", "cursor": cursor, "stream": stream}
+        )
+        assert response.status_code == 400, response.text
+        assert response.json()["detail"] == "Invalid cursor"
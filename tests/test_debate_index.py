@@ -0,0 +1,137 @@
+import numpy as np
+import pytest
+
+import src.domain.debate_index as debate_index_module
+from conftest import DIMENSION, unit_vectors
+from src.domain.debate_index import CENTROID_SLOT
+from src.model_registry import ModelRegistry
+
+
+@pytest.fixture
+def store(make_store):
+    """A store whose debate index is only updated by the test (no background thread)"""
+    store = make_store(debate_index=True)
+    index = store.debate_index
+    index._stopped.set()
+    index._wakeup.set()
+    index._thread.join()
+    index.debounce = 0.0
+    return store
+
+
+@pytest.fixture
+def embedded(store, monkeypatch):
+    """Make the query embedder ready; returns the texts of every embed_batch call"""
+    registry = ModelRegistry()
+    registry.register("stella", object)
+    registry.get("stella")
+    monkeypatch.setattr(debate_index_module, "registry", registry)
+    calls = []
+
+    def embed_batch(texts, path="direct"):
+        calls.append(list(texts))
+        return unit_vectors(len(texts), seed=len(calls))
+
+    monkeypatch.setattr(store.processer, "embed_batch", embed_batch)
+    return calls
+
+
+def _queue(store) -> list:
+    with store.db.read() as cursor:
+        cursor.execute(
+            """
+            SELECT debate_id, centroid_changed, text_changed, version
+            FROM debate_vector_queue ORDER BY debate_id
+        """
+        )
+        return cursor.fetchall()
+
+
+def _basis(*weights: float) -> np.ndarray:
+    vector = np.zeros(DIMENSION, dtype=np.float32)
+    vector[: len(weights)] = weights
+    return vector / np.linalg.norm(vector)
+
+
+def test_triggers_queue_changes_until_the_debounce_passes(store):
+    index = store.debate_index
+    index.debounce = 60.0
+    debate_id = store.add_debate("tldr", "summary")
+    vectors = unit_vectors(2)
+    store.add_image(debate_id, "static/uploads/a.jpg", vectors[0], "", "")
+    store.add_image(debate_id, "static/uploads/b.jpg", vectors[1], "", "")
+
+    # 連続した変更は 1 行にまとまり、version だけが進む
+    assert _queue(store) == [(debate_id, 1, 1, 3)]
+    assert index.update() == 0
+    assert index.get(debate_id, CENTROID_SLOT) is None
+
+    index.debounce = 0.0
+    assert index.update() == 1
+    assert index.get(debate_id, CENTROID_SLOT) is not None
+    # 埋め込みモデルが未読み込みの間はテキストだけキューに残る
+    assert _queue(store) == [(debate_id, 0, 1, 3)]
+
+
+def test_unchanged_text_is_not_embedded_again(store, embedded):
+    index = store.debate_index
+    debate_id = store.add_debate("tldr", "summary")
+    vectors = unit_vectors(2)
+    store.add_image(debate_id, "static/uploads/a.jpg", vectors[0], "", "")
+    assert index.update() == 1
+    assert embedded == [["tldr\nsummary"]]
+    text_vector = index.get_text(debate_id)
+    centroid = index.get(debate_id, CENTROID_SLOT)
+
+    # 画像の追加は重心だけを計算し直す
+    store.add_image(debate_id, "static/uploads/b.jpg", vectors[1], "", "")
+    assert index.update() == 1
+    assert not np.allclose(index.get(debate_id, CENTROID_SLOT), centroid)
+
+    # 同じ内容での保存はトリガーでキューに入るが、ハッシュが同じなので埋め込まない
+    with store.db.write() as cursor:
+        cursor.execute("UPDATE debate SET tldr = tldr WHERE id = ?", (debate_id,))
+    assert _queue(store) == [(debate_id, 0, 1, 1)]
+    assert index.update() == 1
+    assert embedded == [["tldr\nsummary"]]
+    np.testing.assert_allclose(index.get_text(debate_id), text_vector)
+    assert _queue(store) == []
+
+
+def test_rank_debates_scores_the_images_of_the_candidates(store):
+    near, far = store.add_debate("near", ""), store.add_debate("far", "")
+    # near の重心はクエリから遠いが、画像の 1 枚はクエリそのもの
+    store.add_image(near, "static/uploads/n0.jpg", _basis(1), "", "")
+    store.add_image(near, "static/uploads/n1.jpg", _basis(0, 1), "", "")
+    store.add_image(far, "static/uploads/f.jpg", _basis(0.9, 0, 0.44), "", "")
+    store.debate_index.update()
+    query = _basis(1)
+
+    first_stage = store.debate_index.search(query, 2)
+    assert [debate_id for debate_id, _ in first_stage] == [far, near]
+
+    ranked = store.rank_debates(query, k=2)
+    assert [debate_id for debate_id, _ in ranked] == [near, far]
+    assert ranked[0][1] == pytest.approx(1.0)
+    assert store.rank_debates(query, k=1) == ranked[:1]
+
+
+def test_update_debate_queues_one_re_embed(store, embedded):
+    index = store.debate_index
+    debate_id = store.add_debate("tldr", "summary")
+    assert index.update() == 1
+    assert embedded == [["tldr\nsummary"]]
+
+    # 続けて保存しても再埋め込みは最後の内容で 1 回だけ
+    store.update_debate(debate_id, "draft", "summary")
+    store.update_debate(debate_id, "final", "summary")
+    assert _queue(store) == [(debate_id, 0, 1, 2)]
+    assert index.update() == 1
+    assert embedded[1:] == [["final\nsummary"]]
+    assert index.update() == 0
+
+    # 内容が同じなら（updated_at だけが変わる）埋め込まない
+    store.update_debate(debate_id, "final", "summary")
+    assert index.update() == 1
+    assert len(embedded) == 2
+    assert _queue(store) == []
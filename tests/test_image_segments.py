@@ -0,0 +1,77 @@
+import pytest
+
+from src import image_segments as segments_module
+from src.image_segments import CHUNK_WORDS, image_segments
+
+ENTITIES = ["Alice", "Bob"]
+
+
+def _text(sentences: int, word: str) -> str:
+    """``sentences`` sentences of CHUNK_WORDS words, one chunk each"""
+    return " ".join(
+        " ".join([word] * (CHUNK_WORDS - 1)) + f" {word}{i}." for i in range(sentences)
+    )
+
+
+def _kinds(segments) -> list:
+    return [kind for kind, _ in segments]
+
+
+@pytest.fixture
+def max_segments(monkeypatch):
+    monkeypatch.setattr(segments_module, "MAX_SEGMENTS", 6)
+    return 6
+
+
+def test_long_description_and_ocr_share_the_budget(max_segments):
+    segments = image_segments(_text(10, "desc"), ENTITIES, _text(10, "ocr"))
+
+    # 説明文全体 + entities を除いた 4 枠を説明文チャンクと OCR で半分ずつ
+    assert _kinds(segments) == [
+        "description",
+        "description_chunk",
+        "description_chunk",
+        "entities",
+        "ocr",
+        "ocr",
+    ]
+    assert segments[4][1].endswith("ocr0.") and segments[5][1].endswith("ocr1.")
+
+
+def test_description_takes_what_the_ocr_does_not_use(max_segments):
+    segments = image_segments(_text(10, "desc"), ENTITIES, _text(1, "ocr"))
+    assert _kinds(segments).count("description_chunk") == 3
+    assert _kinds(segments).count("ocr") == 1
+
+    segments = image_segments(_text(10, "desc"), ENTITIES)
+    assert _kinds(segments).count("description_chunk") == 4
+    assert "ocr" not in _kinds(segments)
+
+
+def test_ocr_is_not_pushed_out_by_a_short_description(max_segments):
+    segments = image_segments("A whiteboard.", ENTITIES, _text(10, "ocr"))
+    # 説明文が 1 チャンクなら description_chunk は作らず OCR が残り全部を使う
+    assert _kinds(segments) == ["description", "entities"] + ["ocr"] * 4
+
+
+@pytest.mark.parametrize("ocr_sentences", [0, 1, 10])
+def test_entities_keep_their_slot_at_max_segments(max_segments, ocr_sentences):
+    segments = image_segments(
+        _text(10, "desc"), ENTITIES, _text(ocr_sentences, "ocr")
+    )
+    assert len(segments) == max_segments
+    assert ("entities", "Alice, Bob") in segments
+    assert segments[0] == ("description", _text(10, "desc"))
+
+
+def test_without_entities_the_slot_goes_to_the_chunks(max_segments):
+    segments = image_segments(_text(10, "desc"), [], _text(10, "ocr"))
+    assert len(segments) == max_segments
+    assert "entities" not in _kinds(segments)
+    assert _kinds(segments).count("ocr") == 2
+    assert _kinds(segments).count("description_chunk") == 3
+
+
+def test_markdown_images_are_not_embedded():
+    segments = image_segments("board", [], "![img-0.jpeg](img-0.jpeg) Agenda")
+    assert segments == [("description", "board"), ("ocr", "Agenda")]
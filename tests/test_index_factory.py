@@ -0,0 +1,120 @@
+import numpy as np
+
+from conftest import unit_vectors
+from src.domain.index_factory import (
+    IndexConfig,
+    all_ids,
+    build_index,
+    choose_kind,
+    index_kind,
+    live_count,
+    needs_rebuild,
+    remove_ids,
+    search_parameters,
+    tombstone_count,
+)
+from src.domain.index_persistence import IndexPersistence
+
+
+def test_auto_stays_flat_below_ann_threshold():
+    config = IndexConfig(kind="auto", ann_kind="hnsw", ann_threshold=1000)
+    assert choose_kind(0, config) == "flat"
+    assert choose_kind(999, config) == "flat"
+    assert choose_kind(1000, config) == "hnsw"
+
+
+def test_ann_kind_waits_for_enough_training_vectors():
+    config = IndexConfig(kind="auto", ann_kind="ivf_flat", ann_threshold=100)
+    # ivf_flat は 39 * 16 件ないと学習できない
+    assert choose_kind(100, config) == "flat"
+    assert choose_kind(39 * 16, config) == "ivf_flat"
+    # 明示した kind は ann_threshold に関係なく使う
+    assert choose_kind(10, IndexConfig(kind="hnsw")) == "hnsw"
+
+
+def test_needs_rebuild_migrates_but_never_back_to_flat():
+    config = IndexConfig(kind="auto", ann_kind="hnsw", ann_threshold=50)
+    vectors = unit_vectors(60)
+    flat = build_index("flat", vectors.shape[1], config)
+    flat.add_with_ids(vectors[:49], np.arange(49))
+    assert needs_rebuild(flat, config) is None
+    flat.add_with_ids(vectors[49:], np.arange(49, 60))
+    assert needs_rebuild(flat, config) == "hnsw"
+
+    hnsw = build_index("hnsw", vectors.shape[1], config)
+    hnsw.add_with_ids(vectors[:10], np.arange(10))
+    assert needs_rebuild(hnsw, config) is None
+
+
+def test_migration_keeps_every_id_searchable(make_store):
+    store = make_store(
+        index_config=IndexConfig(kind="auto", ann_kind="hnsw", ann_threshold=40)
+    )
+    debate_id = store.add_debate("tldr", "summary")
+    vectors = unit_vectors(50)
+    image_ids = [
+        store.add_image(debate_id, f"static/uploads/{i}.jpg", vector, "", "")
+        for i, vector in enumerate(vectors)
+    ]
+    store._rebuild_thread.join()
+
+    assert index_kind(store.index) == "hnsw"
+    assert sorted(all_ids(store.index).tolist()) == sorted(image_ids)
+    hits = store._search_ids(vectors, k=1)
+    assert [query_hits[0][0] for query_hits in hits] == image_ids
+
+
+def test_hnsw_tombstones_are_hidden_from_search():
+    config = IndexConfig(kind="hnsw")
+    vectors = unit_vectors(30)
+    index = build_index("hnsw", vectors.shape[1], config)
+    index.add_with_ids(vectors, np.arange(100, 130))
+
+    assert remove_ids(index, np.array([105, 110, 999])) == 2
+    assert index.ntotal == 30  # グラフのノードは残る
+    assert tombstone_count(index) == 2
+    assert live_count(index) == 28
+    assert sorted(all_ids(index).tolist()) == [i for i in range(100, 130) if i not in (105, 110)]
+
+    _, labels = index.search(vectors, 30, params=search_parameters(index, config))
+    found = set(labels.ravel().tolist()) - {-1}
+    assert not found & {105, 110}
+    assert min(found) >= 100  # tombstone の負の ID は返らない
+    assert labels[0, 0] == 100
+
+
+def test_tombstones_past_the_ratio_trigger_a_compacting_rebuild(make_store):
+    config = IndexConfig(kind="hnsw", max_tombstone_ratio=0.2)
+    store = make_store(index_config=config)
+    kept, deleted = store.add_debate("kept", ""), store.add_debate("deleted", "")
+    vectors = unit_vectors(20)
+    for i, vector in enumerate(vectors):
+        store.add_image(kept if i < 15 else deleted, f"static/uploads/{i}.jpg", vector, "", "")
+    assert needs_rebuild(store.index, config) is None
+
+    store.delete_debate(deleted)  # 5 / 20 = 25% が tombstone
+    store._rebuild_thread.join()
+
+    assert index_kind(store.index) == "hnsw"
+    assert store.index.ntotal == 15
+    assert tombstone_count(store.index) == 0
+    hits = store._search_ids(vectors[:15], k=1)
+    assert [query_hits[0][0] for query_hits in hits] == list(range(1, 16))
+
+
+def test_removed_ids_stay_removed_until_compaction(tmp_path):
+    vectors = unit_vectors(10)
+    persistence = IndexPersistence(tmp_path / "vectors.faiss", vectors.shape[1])
+    persistence.load(build_index("hnsw", vectors.shape[1], IndexConfig()))
+    persistence.add(range(10), vectors)
+
+    persistence.remove([3])
+    # rev_map は作り直していないが、削除した ID は見えない
+    assert not persistence.contains(3)
+    assert persistence.get(3) is None
+    assert persistence.live_mask(np.array([2, 3])).tolist() == [True, False]
+
+    persistence.add([3], vectors[:1])
+    assert persistence.contains(3)
+    np.testing.assert_allclose(persistence.get(3), vectors[0], rtol=1e-6)
+    persistence.close()
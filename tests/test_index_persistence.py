@@ -0,0 +1,166 @@
+import os
+from pathlib import Path
+
+import faiss
+import numpy as np
+import pytest
+
+from src.domain.index_factory import IndexConfig, build_index
+from src.domain.index_persistence import IndexPersistence
+
+DIMENSION = 8
+
+
+def _vectors(n: int, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _open(path, kind: str = "flat", **kwargs) -> IndexPersistence:
+    persistence = IndexPersistence(path, DIMENSION, **kwargs)
+    persistence.load(build_index(kind, DIMENSION, IndexConfig()))
+    return persistence
+
+
+def _code_stores(index: faiss.Index) -> list:
+    """The flat code arrays of an ID-mapped flat / HNSW / binary index"""
+    inner = faiss.downcast_index(index.index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return [faiss.downcast_index(inner.storage).codes]
+    if isinstance(inner, faiss.IndexRefine):
+        return [
+            faiss.downcast_index(inner.base_index).codes,
+            faiss.downcast_index(inner.refine_index).codes,
+        ]
+    return [inner.codes]
+
+
+@pytest.mark.skipif(
+    not hasattr(faiss, "IO_FLAG_MMAP_IFC"), reason="faiss < 1.11 cannot mmap flat codes"
+)
+@pytest.mark.parametrize("kind", ["flat", "hnsw", "binary"])
+def test_snapshot_is_memory_mapped_until_the_first_write(tmp_path, kind):
+    path = tmp_path / "vectors.faiss"
+    vectors = _vectors(200)
+    persistence = _open(path, kind)
+    persistence.add(range(200), vectors)
+    persistence.close()
+
+    persistence = _open(path, kind)
+    # コードはスナップショットの mmap を指している（読み込みでコピーしていない）
+    assert not any(codes.is_owned for codes in _code_stores(persistence.index))
+    _, labels = persistence.index.search(vectors[:5], 1)
+    assert labels[:, 0].tolist() == [0, 1, 2, 3, 4]
+
+    persistence.add([200], _vectors(1, seed=1))
+    assert all(codes.is_owned for codes in _code_stores(persistence.index))
+    assert persistence.index.ntotal == 201
+    persistence.remove([0])
+    persistence.close()
+
+    persistence = _open(path, kind)
+    assert persistence.get(0) is None
+    assert persistence.get(200) is not None
+    persistence.close()
+
+
+def _crash(persistence: IndexPersistence):
+    """Stop the snapshot thread without the final snapshot ``close`` would write"""
+    persistence._stopped.set()
+    persistence._wakeup.set()
+    persistence._thread.join()
+    persistence._wal_file.close()
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_wal_is_replayed_after_a_crash(tmp_path, kind):
+    path = tmp_path / "vectors.faiss"
+    vectors = _vectors(20)
+    persistence = _open(path, kind)
+    persistence.add(range(10), vectors[:10])
+    persistence.flush()
+    persistence.add(range(10, 20), vectors[10:])
+    persistence.remove([3, 15])
+    persistence.upsert([4], vectors[:1])
+    _crash(persistence)
+
+    persistence = _open(path, kind)
+    assert persistence.get(3) is None
+    assert persistence.get(15) is None
+    np.testing.assert_allclose(persistence.get(4), vectors[0], rtol=1e-6)
+    _, labels = persistence.index.search(vectors[10:15], 1)
+    assert labels[:, 0].tolist() == [10, 11, 12, 13, 14]
+    persistence.close()
+
+
+def test_replay_is_idempotent(tmp_path):
+    path = tmp_path / "vectors.faiss"
+    vectors = _vectors(10)
+    persistence = _open(path)
+    persistence.add(range(10), vectors)
+    persistence.remove([7])
+    wal = persistence.wal_path.read_bytes()
+    # 10 件とも入ったスナップショットを書いた後、WAL の削除前に落ちたことにする
+    persistence.flush()
+    _crash(persistence)
+    persistence.flushing_path.write_bytes(wal)
+
+    for _ in range(2):
+        persistence = _open(path)
+        assert persistence.index.ntotal == 9
+        assert persistence.get(7) is None
+        np.testing.assert_allclose(persistence.get(2), vectors[2], rtol=1e-6)
+        _crash(persistence)
+
+
+def test_snapshot_is_written_before_the_wal_is_truncated(tmp_path, monkeypatch):
+    path = tmp_path / "vectors.faiss"
+    persistence = _open(path)
+    persistence.add(range(5), _vectors(5))
+
+    events = []
+    replace, remove = os.replace, os.remove
+
+    def record_replace(src, dst):
+        events.append(("replace", Path(src).name, Path(dst).name))
+        replace(src, dst)
+
+    def record_remove(target):
+        events.append(("remove", Path(target).name))
+        remove(target)
+
+    monkeypatch.setattr(os, "replace", record_replace)
+    monkeypatch.setattr(os, "remove", record_remove)
+    persistence.flush()
+    monkeypatch.undo()
+
+    assert events == [
+        ("replace", "vectors.faiss.wal", "vectors.faiss.wal.flushing"),
+        ("replace", "vectors.faiss.tmp", "vectors.faiss"),
+        ("remove", "vectors.faiss.wal.flushing"),
+    ]
+    persistence.close()
+
+
+def test_failed_snapshot_keeps_the_wal(tmp_path, monkeypatch):
+    path = tmp_path / "vectors.faiss"
+    vectors = _vectors(5)
+    persistence = _open(path)
+    persistence.add(range(5), vectors)
+
+    def fail(*args):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(os, "fsync", fail)
+    with pytest.raises(OSError):
+        persistence.flush()
+    monkeypatch.undo()
+    assert not path.exists()
+    assert persistence.flushing_path.exists()
+    _crash(persistence)
+
+    persistence = _open(path)
+    assert persistence.index.ntotal == 5
+    np.testing.assert_allclose(persistence.get(4), vectors[4], rtol=1e-6)
+    persistence.close()
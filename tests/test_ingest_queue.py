@@ -0,0 +1,173 @@
+import asyncio
+import time
+
+import pytest
+
+from conftest import unit_vectors
+from src.domain import ingest_queue as ingest_queue_module
+from src.domain.index_factory import all_ids
+from src.domain.ingest_queue import IngestQueue
+from src.domain.vector_store import vector_id
+from src.model import ImageData
+
+
+def _image_data(image_path: str) -> ImageData:
+    vector = unit_vectors(1)
+    return ImageData(
+        image_path=image_path,
+        description="whiteboard",
+        ocr=["Alice"],
+        description_feats=vector[0],
+        segments=[("description", "whiteboard")],
+        segment_feats=vector,
+    )
+
+
+@pytest.fixture
+def store(make_store):
+    return make_store()
+
+
+def _upload(store, name: str = "a.jpg") -> tuple:
+    (store.uploads_dir / name).write_bytes(b"jpeg")
+    return store.add_debate("tldr", "summary"), f"static/uploads/{name}"
+
+
+def _job(store, image_id: int) -> dict:
+    with store.db.read() as cursor:
+        cursor.execute(
+            "SELECT id, status, attempts, next_attempt_at FROM ingest_job WHERE image_id = ?",
+            (image_id,),
+        )
+        return dict(zip(("id", "status", "attempts", "next_attempt_at"), cursor.fetchone()))
+
+
+async def _wait_for(queue: IngestQueue, image_id: int, statuses, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = queue.status(image_id)
+        if status["status"] in statuses:
+            return status
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"image {image_id} is still {status}")
+
+
+def _run(queue: IngestQueue, scenario):
+    async def main():
+        queue.start()
+        try:
+            return await scenario()
+        finally:
+            await queue.stop()
+
+    return asyncio.run(main())
+
+
+def test_job_goes_from_pending_through_processing_to_indexed(store, monkeypatch):
+    queue = IngestQueue(store, workers=1, poll_interval=0.01)
+    debate_id, image_path = _upload(store)
+    image_id = queue.enqueue(debate_id, image_path)
+    assert queue.status(image_id) == {
+        "image_id": image_id,
+        "status": "pending",
+        "attempts": 0,
+        "last_error": None,
+    }
+
+    seen = []
+
+    async def process(path):
+        seen.append(queue.status(image_id))
+        return _image_data(path)
+
+    monkeypatch.setattr(store.processer, "aprocess_image", process)
+    status = _run(queue, lambda: _wait_for(queue, image_id, ("indexed", "failed")))
+
+    assert [(s["status"], s["attempts"]) for s in seen] == [("processing", 1)]
+    assert status == {
+        "image_id": image_id,
+        "status": "indexed",
+        "attempts": 1,
+        "last_error": None,
+    }
+    assert all_ids(store.index).tolist() == [vector_id(image_id, 0)]
+    assert queue.depth() == 0
+
+
+def test_failing_job_is_retried_until_the_attempt_limit(store, monkeypatch):
+    queue = IngestQueue(
+        store, workers=1, max_attempts=3, backoff_base=0.05, poll_interval=0.01
+    )
+    debate_id, image_path = _upload(store)
+    image_id = queue.enqueue(debate_id, image_path)
+    calls = []
+
+    async def process(path):
+        calls.append(time.monotonic())
+        raise RuntimeError("Mistral is down")
+
+    monkeypatch.setattr(store.processer, "aprocess_image", process)
+    status = _run(queue, lambda: _wait_for(queue, image_id, ("failed",)))
+
+    assert status == {
+        "image_id": image_id,
+        "status": "failed",
+        "attempts": 3,
+        "last_error": "Mistral is down",
+    }
+    assert len(calls) == 3
+    # 2 回目は base * 1、3 回目は base * 2 の（0.5〜1 倍の揺らぎ付き）バックオフ後
+    assert calls[1] - calls[0] >= 0.05 * 0.5
+    assert calls[2] - calls[1] >= 0.05 * 2 * 0.5
+    assert len(all_ids(store.index)) == 0
+
+
+def test_transient_failure_is_retried_and_indexed(store, monkeypatch):
+    queue = IngestQueue(store, workers=1, backoff_base=0.01, poll_interval=0.01)
+    debate_id, image_path = _upload(store)
+    image_id = queue.enqueue(debate_id, image_path)
+    failures = [RuntimeError("rate limited")]
+
+    async def process(path):
+        if failures:
+            raise failures.pop()
+        return _image_data(path)
+
+    monkeypatch.setattr(store.processer, "aprocess_image", process)
+    status = _run(queue, lambda: _wait_for(queue, image_id, ("indexed", "failed")))
+
+    assert status["status"] == "indexed"
+    assert status["attempts"] == 2
+    assert status["last_error"] is None
+
+
+def test_backoff_doubles_per_attempt_and_is_capped(store, monkeypatch):
+    queue = IngestQueue(store, max_attempts=10, backoff_base=2.0, backoff_max=10.0)
+    debate_id, image_path = _upload(store)
+    image_id = queue.enqueue(debate_id, image_path)
+    job_id = _job(store, image_id)["id"]
+    monkeypatch.setattr(ingest_queue_module.random, "uniform", lambda low, high: high)
+
+    delays = []
+    for attempts in (1, 2, 3, 4):
+        before = time.time()
+        queue._retry_or_fail(job_id, attempts, "error")
+        job = _job(store, image_id)
+        assert job["status"] == "pending"
+        delays.append(round(job["next_attempt_at"] - before))
+    assert delays == [2, 4, 8, 10]
+
+    queue._retry_or_fail(job_id, 10, "error")
+    assert queue.status(image_id)["status"] == "failed"
+
+
+def test_jobs_left_processing_are_retried_after_a_restart(store):
+    queue = IngestQueue(store)
+    debate_id, image_path = _upload(store)
+    image_id = queue.enqueue(debate_id, image_path)
+    assert queue._claim() is not None
+    assert queue.status(image_id)["status"] == "processing"
+
+    IngestQueue(store)  # 次のプロセスの起動
+    assert queue.status(image_id)["status"] == "pending"
+    assert queue.depth() == 1
@@ -0,0 +1,86 @@
+from conftest import unit_vectors
+from src.domain.vector_store import RRF_K
+
+
+def _fts_rows(store, table: str, term: str) -> list:
+    with store.db.read() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {table} WHERE {table} MATCH ? ORDER BY rowid",
+            (f'"{term}"',),
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_triggers_keep_image_fts_in_sync(make_store):
+    store = make_store()
+    debate_id = store.add_debate("tldr", "summary")
+    image_id = store.add_image(
+        debate_id,
+        "static/uploads/a.jpg",
+        unit_vectors(1)[0],
+        "gradient descent",
+        "loss curve",
+    )
+    assert _fts_rows(store, "image_fts", "gradient") == [image_id]
+    assert _fts_rows(store, "image_fts", "curve") == [image_id]
+
+    with store.db.write() as cursor:
+        cursor.execute(
+            "UPDATE image SET ocr = ?, description = ? WHERE id = ?",
+            ("attention heads", "transformer diagram", image_id),
+        )
+    # 古い語は消え、新しい語だけが引ける
+    assert _fts_rows(store, "image_fts", "gradient") == []
+    assert _fts_rows(store, "image_fts", "curve") == []
+    assert _fts_rows(store, "image_fts", "attention") == [image_id]
+    assert _fts_rows(store, "image_fts", "transformer") == [image_id]
+
+    store.delete_debate(debate_id)
+    assert _fts_rows(store, "image_fts", "attention") == []
+    with store.db.read() as cursor:
+        assert cursor.execute("SELECT COUNT(*) FROM image_fts").fetchone()[0] == 0
+
+
+def test_triggers_keep_debate_fts_in_sync(make_store):
+    store = make_store()
+    debate_id = store.add_debate("contrastive learning", "negatives matter")
+    assert _fts_rows(store, "debate_fts", "contrastive") == [debate_id]
+
+    store.update_debate(debate_id, "diffusion models", "noise schedule")
+    assert _fts_rows(store, "debate_fts", "contrastive") == []
+    assert _fts_rows(store, "debate_fts", "diffusion") == [debate_id]
+    assert _fts_rows(store, "debate_fts", "schedule") == [debate_id]
+
+    store.delete_debate(debate_id)
+    assert _fts_rows(store, "debate_fts", "diffusion") == []
+
+
+def test_rrf_ranks_a_debate_found_only_by_lexical_search(make_store):
+    store = make_store()
+    vectors = unit_vectors(2)
+    both = store.add_debate("quantum codes", "")
+    vector_only = store.add_debate("sorting", "")
+    lexical_only = store.add_debate("quantum annealing in practice", "")
+    store.add_image(both, "static/uploads/both.jpg", vectors[0], "", "")
+    store.add_image(vector_only, "static/uploads/vector.jpg", vectors[1], "", "")
+
+    search_results = [
+        ("static/uploads/both.jpg", 0.1, "", "quantum codes"),
+        ("static/uploads/vector.jpg", 0.2, "", "sorting"),
+    ]
+    results = store.score_debates("quantum", search_results)
+    scores = {debate_id: score for debate_id, *_, score in results}
+
+    # 語彙検索だけで見つかった議論も結果に入る
+    assert set(scores) == {both, vector_only, lexical_only}
+    # 両方で 1 位なら 1.0、片方だけなら各ランキングでの順位の分だけ
+    assert [debate_id for debate_id, *_ in results][0] == both
+    assert scores[both] == 1.0
+    assert scores[lexical_only] > 0
+    max_rrf = 2.0 / (RRF_K + 1)
+    assert abs(scores[lexical_only] - (1.0 / (RRF_K + 2)) / max_rrf) < 1e-9
+    assert abs(scores[vector_only] - (1.0 / (RRF_K + 2)) / max_rrf) < 1e-9
+
+    # ベクトル検索で何も見つからなくても語彙検索の結果は返る
+    lexical = [debate_id for debate_id, *_ in store.score_debates("annealing", [])]
+    assert lexical == [lexical_only]
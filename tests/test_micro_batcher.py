@@ -0,0 +1,119 @@
+import asyncio
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from src.micro_batcher import MicroBatcher
+
+
+class _Model:
+    """embed_batch stand-in that records every batch it is called with"""
+
+    def __init__(self, delay: float = 0.0, error: Exception = None):
+        self.delay = delay
+        self.error = error
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, texts):
+        with self._lock:
+            self.calls.append(list(texts))
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return np.array([[len(text), i] for i, text in enumerate(texts)], np.float32)
+
+
+def test_concurrent_calls_share_one_batch():
+    model = _Model()
+    batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=50)
+    texts = [f"text {'x' * i}" for i in range(10)]
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.embed(text) for text in texts))
+
+    vectors = asyncio.run(scenario())
+    assert model.calls == [texts]
+    # 各呼び出し元には自分のテキストのベクトルが返る
+    assert [int(vector[0]) for vector in vectors] == [len(text) for text in texts]
+    assert batcher.stats()["batch_size_histogram"]["le_16"] == 1
+
+
+def test_max_batch_size_splits_batches():
+    model = _Model()
+    batcher = MicroBatcher(model, max_batch_size=4, max_wait_ms=50)
+    texts = [str(i) for i in range(10)]
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.embed(text) for text in texts))
+
+    vectors = asyncio.run(scenario())
+    assert model.calls == [texts[0:4], texts[4:8], texts[8:10]]
+    assert len(vectors) == 10
+    assert batcher.stats()["batches"] == 3
+
+
+def test_max_wait_bounds_the_wait_for_followers():
+    model = _Model()
+    batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=20)
+
+    async def scenario():
+        start = time.monotonic()
+        first = asyncio.create_task(batcher.embed("first"))
+        await asyncio.sleep(0)
+        # 1 件だけなら max_wait で打ち切ってそのまま送る
+        await first
+        waited = time.monotonic() - start
+        # max_wait を過ぎてから来たリクエストは次のバッチになる
+        await asyncio.sleep(0.05)
+        await batcher.embed("late")
+        return waited
+
+    waited = asyncio.run(scenario())
+    assert 0.015 <= waited < 0.5
+    assert model.calls == [["first"], ["late"]]
+
+
+def test_requests_within_max_wait_join_the_batch():
+    model = _Model()
+    batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=200)
+
+    async def scenario():
+        first = asyncio.create_task(batcher.embed("first"))
+        await asyncio.sleep(0.02)
+        await asyncio.gather(first, batcher.embed("second"))
+
+    asyncio.run(scenario())
+    assert model.calls == [["first", "second"]]
+
+
+def test_batch_error_reaches_every_caller():
+    model = _Model(error=RuntimeError("CUDA out of memory"))
+    batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=20)
+
+    async def scenario():
+        return await asyncio.gather(
+            *(batcher.embed(str(i)) for i in range(5)), return_exceptions=True
+        )
+
+    results = asyncio.run(scenario())
+    assert len(model.calls) == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert all(str(result) == "CUDA out of memory" for result in results)
+
+
+def test_batcher_keeps_working_after_a_failed_batch():
+    model = _Model(error=RuntimeError("boom"))
+    batcher = MicroBatcher(model, max_batch_size=32, max_wait_ms=5)
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            await batcher.embed("a")
+        model.error = None
+        return await batcher.embed("b")
+
+    vector = asyncio.run(scenario())
+    assert vector.tolist() == [1.0, 0.0]
+    assert batcher.stats()["batches"] == 2
@@ -0,0 +1,120 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import src.model
+from src.model import Processer
+from src.model_registry import ModelRegistry
+from src.query_cache import LRUCache, QueryCache, SqliteCache
+
+
+def test_lru_evicts_the_least_recently_used():
+    cache = LRUCache(maxsize=2)
+    cache.set(("vector", "a"), 1)
+    cache.set(("vector", "b"), 2)
+    assert cache.get(("vector", "a")) == 1  # a の方が新しくなる
+    cache.set(("vector", "c"), 3)
+    assert cache.get(("vector", "b")) is None
+    assert cache.get(("vector", "a")) == 1
+    assert cache.get(("vector", "c")) == 3
+    assert len(cache) == 2
+
+
+def test_lru_and_sqlite_entries_expire(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("src.query_cache.time.time", lambda: now[0])
+    memory = LRUCache(ttl=10)
+    disk = SqliteCache(tmp_path / "cache.db", ttl=10)
+    memory.set(("translation", "q"), "m")
+    disk.set(("translation", "q"), b"d")
+    now[0] += 11
+    assert memory.get(("translation", "q")) is None
+    assert disk.get(("translation", "q")) is None
+
+
+def test_memory_miss_falls_back_to_disk_and_promotes(tmp_path):
+    cache = QueryCache(tmp_path / "cache.db", maxsize=1)
+    vector = np.arange(4, dtype=np.float32)
+    cache.set_vector("whiteboard", "model", vector)
+    cache.set_translation("ホワイトボード", '{"english_instruction": "whiteboard"}')
+
+    # translation を入れたのでメモリ側からは vector が追い出されている
+    np.testing.assert_array_equal(cache.get_vector("whiteboard", "model"), vector)
+    np.testing.assert_array_equal(cache.get_vector("whiteboard", "model"), vector)
+    assert cache.get_vector("blackboard", "model") is None
+    assert cache.stats()["vector"] == {
+        "memory_hits": 1,
+        "disk_hits": 1,
+        "misses": 1,
+        "hit_rate": 2 / 3,
+    }
+
+    # 別プロセス（新しいメモリ）でも SQLite 側から読める
+    reopened = QueryCache(tmp_path / "cache.db")
+    np.testing.assert_array_equal(reopened.get_vector("whiteboard", "model"), vector)
+    assert reopened.get_translation("  ホワイトボード ") is not None
+    assert reopened.stats()["disk_entries"] == 2
+
+
+@pytest.mark.parametrize("asynchronous", [False, True])
+def test_vector_key_includes_model_and_version(tmp_path, asynchronous):
+    cache = QueryCache(tmp_path / "cache.db")
+    vector = np.ones(4, dtype=np.float32)
+    if asynchronous:
+        asyncio.run(cache.aset_vector("whiteboard", "model", vector, 1))
+    else:
+        cache.set_vector("whiteboard", "model", vector, 1)
+
+    def get(model_name, version):
+        if asynchronous:
+            return asyncio.run(cache.aget_vector("whiteboard", model_name, version))
+        return cache.get_vector("whiteboard", model_name, version)
+
+    assert get("model", 1) is not None
+    assert get("model", 2) is None
+    assert get("other-model", 1) is None
+
+
+class _Embedder:
+    def __init__(self, value: float):
+        self.value = value
+        self.calls = 0
+
+    def embed_batch(self, texts):
+        self.calls += 1
+        return np.full((len(texts), 4), self.value, dtype=np.float32)
+
+
+@pytest.fixture
+def processer(tmp_path, monkeypatch):
+    registry = ModelRegistry()
+    registry.register("stella", lambda: _Embedder(1.0))
+    monkeypatch.setattr(src.model, "registry", registry)
+    processer = Processer(query_cache=QueryCache(tmp_path / "cache.db"))
+    processer.query_cache.set_translation(
+        "ホワイトボード",
+        '{"english_instruction": "whiteboard", "english_proper_noun_list": []}',
+    )
+    return processer
+
+
+def test_swapped_model_does_not_read_cached_vectors(processer):
+    first = processer.process_instruction("ホワイトボード").instruction_feats
+    assert processer.process_instruction("ホワイトボード").instruction_feats is not None
+    assert processer.stella.calls == 1
+
+    # /api/reindex は同じモデル名のまま埋め込みモデルを差し替えることもある
+    processer.set_embedding_model(processer.embedding_model, _Embedder(2.0))
+    second = processer.process_instruction("ホワイトボード").instruction_feats
+    assert processer.stella.calls == 1
+    assert first.tolist() == [1.0] * 4
+    assert second.tolist() == [2.0] * 4
+
+
+def test_renamed_model_does_not_read_cached_vectors(processer):
+    processer.process_instruction("ホワイトボード")
+    processer.set_embedding_model("other/model")
+    src.model.registry.replace("stella", _Embedder(3.0))
+    feats = processer.process_instruction("ホワイトボード").instruction_feats
+    assert feats.tolist() == [3.0] * 4
@@ -0,0 +1,22 @@
+from src.domain.search_filter import SearchFilter
+
+
+def test_offset_timestamp_is_converted_to_utc():
+    search_filter = SearchFilter(created_after="2024-05-01T09:00+09:00")
+    assert search_filter.created_after == "2024-05-01 00:00:00"
+
+
+def test_naive_timestamp_is_kept_as_utc():
+    search_filter = SearchFilter(
+        created_after="2024-05-01", created_before="2024-05-01T23:30:15"
+    )
+    assert search_filter.created_after == "2024-05-01 00:00:00"
+    assert search_filter.created_before == "2024-05-01 23:30:15"
+
+
+def test_trailing_z_is_read_as_utc():
+    search_filter = SearchFilter(
+        created_after="2024-05-01T09:00:00Z", created_before="2024-05-01T23:30:15.5z"
+    )
+    assert search_filter.created_after == "2024-05-01 09:00:00"
+    assert search_filter.created_before == "2024-05-01 23:30:15"
@@ -0,0 +1,107 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from src.domain.sqlite_pool import SQLitePool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = SQLitePool(tmp_path / "pool.db", readers=2, busy_timeout=1.0)
+    pool.executescript("CREATE TABLE item (id INTEGER PRIMARY KEY, name TEXT);")
+    yield pool
+    pool.close()
+
+
+def _pragmas(cursor) -> dict:
+    return {
+        name: cursor.execute(f"PRAGMA {name}").fetchone()[0]
+        for name in ("journal_mode", "synchronous", "cache_size", "mmap_size", "temp_store")
+    }
+
+
+def _names(cursor) -> list:
+    return [row[0] for row in cursor.execute("SELECT name FROM item ORDER BY id")]
+
+
+def test_wal_and_pragmas_are_applied(pool):
+    expected = {
+        "journal_mode": "wal",
+        "synchronous": 1,  # NORMAL
+        "cache_size": -pool.cache_size_kib,
+        "mmap_size": pool.mmap_size,
+        "temp_store": 2,  # MEMORY
+    }
+    with pool.write() as cursor:
+        assert _pragmas(cursor) == expected
+    with pool.read() as cursor:
+        assert _pragmas(cursor) == expected
+        assert cursor.execute("PRAGMA query_only").fetchone()[0] == 1
+        with pytest.raises(sqlite3.OperationalError):
+            cursor.execute("INSERT INTO item (name) VALUES ('x')")
+
+
+def test_reader_runs_while_a_writer_is_open(pool):
+    with pool.write() as cursor:
+        cursor.execute("INSERT INTO item (name) VALUES ('committed')")
+
+    in_transaction = threading.Event()
+    release = threading.Event()
+
+    def writer():
+        with pool.write() as cursor:
+            cursor.execute("INSERT INTO item (name) VALUES ('pending')")
+            in_transaction.set()
+            release.wait(5)
+
+    thread = threading.Thread(target=writer)
+    thread.start()
+    assert in_transaction.wait(5)
+    try:
+        # 書き込みトランザクションが開いていても待たずに確定済みの行が読める
+        start = time.perf_counter()
+        with pool.read() as cursor:
+            assert _names(cursor) == ["committed"]
+        assert time.perf_counter() - start < pool.busy_timeout / 2
+    finally:
+        release.set()
+        thread.join()
+
+    with pool.read() as cursor:
+        assert _names(cursor) == ["committed", "pending"]
+
+
+def test_nested_write_joins_the_outer_transaction(pool):
+    with pool.write() as outer:
+        outer.execute("INSERT INTO item (name) VALUES ('outer')")
+        with pool.write() as inner:
+            inner.execute("INSERT INTO item (name) VALUES ('inner')")
+        # 内側を抜けてもまだコミットされていない
+        assert pool._writer.in_transaction
+        # 同じスレッドの read() は writer を使うので未コミットの行も見える
+        with pool.read() as cursor:
+            assert _names(cursor) == ["outer", "inner"]
+    assert not pool._writer.in_transaction
+
+    with pool.read() as cursor:
+        assert _names(cursor) == ["outer", "inner"]
+
+
+def test_exception_in_nested_write_rolls_back_everything(pool):
+    with pytest.raises(RuntimeError):
+        with pool.write() as outer:
+            outer.execute("INSERT INTO item (name) VALUES ('outer')")
+            with pool.write() as inner:
+                inner.execute("INSERT INTO item (name) VALUES ('inner')")
+                raise RuntimeError("boom")
+
+    assert not pool._writer.in_transaction
+    with pool.read() as cursor:
+        assert _names(cursor) == []
+    # ロールバック後も writer は使える
+    with pool.write() as cursor:
+        cursor.execute("INSERT INTO item (name) VALUES ('after')")
+    with pool.read() as cursor:
+        assert _names(cursor) == ["after"]
@@ -0,0 +1,91 @@
+import numpy as np
+import pytest
+
+ort = pytest.importorskip("onnxruntime")
+onnx = pytest.importorskip("onnx")
+
+from onnx import TensorProto, helper  # noqa: E402
+
+from src.stella_onnx import OnnxStellaEmbedder  # noqa: E402
+
+WIDTH = 6
+
+
+def _session(static_width: bool = True):
+    """(batch, seq) ids and mask -> (batch, WIDTH): token count times 1..WIDTH"""
+    scale = helper.make_tensor(
+        "scale", TensorProto.FLOAT, [1, WIDTH], np.arange(1, WIDTH + 1).tolist()
+    )
+    axes = helper.make_tensor("axes", TensorProto.INT64, [1], [1])
+    graph = helper.make_graph(
+        [
+            helper.make_node(
+                "Cast", ["attention_mask"], ["mask"], to=TensorProto.FLOAT
+            ),
+            helper.make_node("ReduceSum", ["mask", "axes"], ["count"], keepdims=1),
+            helper.make_node("Mul", ["count", "scale"], ["sentence_embedding"]),
+        ],
+        "embedder",
+        [
+            helper.make_tensor_value_info(name, TensorProto.INT64, ["batch", "seq"])
+            for name in ("input_ids", "attention_mask")
+        ],
+        [
+            helper.make_tensor_value_info(
+                "sentence_embedding",
+                TensorProto.FLOAT,
+                ["batch", WIDTH if static_width else "width"],
+            )
+        ],
+        [scale, axes],
+    )
+    model = helper.make_model(
+        graph, opset_imports=[helper.make_opsetid("", 13)], ir_version=8
+    )
+    return ort.InferenceSession(
+        model.SerializeToString(), providers=["CPUExecutionProvider"]
+    )
+
+
+def _tokenizer(texts, return_tensors="np", **kwargs):
+    length = max((len(text.split()) for text in texts), default=1)
+    mask = np.array(
+        [[1] * len(text.split()) + [0] * (length - len(text.split())) for text in texts]
+    )
+    return {"input_ids": mask * 7, "attention_mask": mask}
+
+
+def _embedder(truncate_dim=None, static_width=True) -> OnnxStellaEmbedder:
+    # モデルの書き出しとトークナイザの読み込みを飛ばして小さなグラフを載せる
+    embedder = OnnxStellaEmbedder.__new__(OnnxStellaEmbedder)
+    embedder.truncate_dim = truncate_dim
+    embedder.max_seq_length = 16
+    embedder.tokenizer = _tokenizer
+    embedder.session = _session(static_width)
+    embedder.output_dim = embedder._output_dim()
+    return embedder
+
+
+@pytest.mark.parametrize("static_width", [True, False])
+def test_empty_input_keeps_the_output_width(static_width):
+    embedder = _embedder(static_width=static_width)
+    assert embedder.output_dim == WIDTH
+    empty = embedder.embed_batch([])
+    assert empty.shape == (0, WIDTH)
+    assert empty.dtype == np.float32
+    assert embedder.embed_batch(["a b", "c"]).shape == (2, WIDTH)
+
+
+def test_empty_input_with_truncation():
+    embedder = _embedder(truncate_dim=4)
+    assert embedder.embed_batch([]).shape == (0, 4)
+    assert embedder.embed_batch(["a b", "c"]).shape == (2, 4)
+
+
+def test_batches_are_returned_in_input_order():
+    embedder = _embedder()
+    texts = ["a", "a b c d", "a b", "a b c"]
+    vectors = embedder.embed_batch(texts, batch_size=2)
+    # 長さ順に並べ替えて埋め込んでも、返す順は入力の順
+    expected = np.outer([1, 4, 2, 3], np.arange(1, WIDTH + 1))
+    np.testing.assert_allclose(vectors, expected)
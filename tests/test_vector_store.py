@@ -0,0 +1,123 @@
+import io
+
+import numpy as np
+import pytest
+
+from conftest import png_bytes, unit_vectors
+from src.domain.index_factory import IndexConfig, all_ids, live_count
+from src.domain.vector_store import IMAGE_ID_MASK, SEGMENT_SHIFT, vector_id
+from src.upload_storage import store_upload, upload_url_path
+
+SEGMENTS = [("description", "whiteboard"), ("entities", "Alice, Bob")]
+
+
+def test_failed_upload_does_not_shift_later_ids(make_store):
+    store = make_store()
+    debate_id = store.add_debate("tldr", "summary")
+    vectors = unit_vectors(2)
+
+    first = store.add_image(debate_id, "static/uploads/a.jpg", vectors[0], "", "a")
+    # Mistral の処理に失敗した画像はベクトル無しの行だけが残る
+    failed = store._store_processed_image(debate_id, "static/uploads/b.jpg", None)
+    later = store.add_image(debate_id, "static/uploads/c.jpg", vectors[1], "", "c")
+    assert first < failed < later
+
+    def check(store):
+        assert sorted(all_ids(store.index).tolist()) == [
+            vector_id(first, 0),
+            vector_id(later, 0),
+        ]
+        np.testing.assert_allclose(
+            store.persistence.get(vector_id(later, 0)), vectors[1], rtol=1e-6
+        )
+        assert [path for path, *_ in store.search(vectors[1], k=1)] == [
+            "static/uploads/c.jpg"
+        ]
+
+    check(store)
+    store.close()
+    check(make_store())  # 開き直しても（スナップショット + WAL）同じ
+
+
+def test_vector_ids_decode_back_to_their_image(make_store):
+    store = make_store()
+    debate_id = store.add_debate("tldr", "")
+    vectors = unit_vectors(6)
+    segments = SEGMENTS + [("ocr", "agenda")]
+    image_ids = [
+        store.add_image(
+            debate_id,
+            f"static/uploads/{i}.jpg",
+            vectors[3 * i : 3 * i + 3],
+            "",
+            "",
+            segments,
+        )
+        for i in range(2)
+    ]
+
+    decoded = sorted(
+        (vid & IMAGE_ID_MASK, vid >> SEGMENT_SHIFT)
+        for vid in all_ids(store.index).tolist()
+    )
+    assert decoded == [(image_id, slot) for image_id in image_ids for slot in range(3)]
+    # slot 0 以外のベクトルに当たっても結果は画像単位にまとまる
+    hits = store._search_ids(vectors[[2, 4]], k=2)
+    assert [query_hits[0][0] for query_hits in hits] == image_ids
+    assert [path for path, *_ in store.search(vectors[5], k=2)] == [
+        "static/uploads/1.jpg",
+        "static/uploads/0.jpg",
+    ]
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_delete_debate_removes_exactly_its_vectors(make_store, kind):
+    store = make_store(index_config=IndexConfig(kind=kind))
+    kept, deleted = store.add_debate("kept", ""), store.add_debate("deleted", "")
+    vectors = unit_vectors(6)
+    kept_ids = [
+        store.add_image(
+            kept, f"static/uploads/k{i}.jpg", vectors[2 * i : 2 * i + 2], "", "", SEGMENTS
+        )
+        for i in range(2)
+    ]
+    deleted_id = store.add_image(
+        deleted, "static/uploads/d.jpg", vectors[4:], "", "", SEGMENTS
+    )
+    assert live_count(store.index) == 6
+
+    store.delete_debate(deleted)
+
+    assert live_count(store.index) == 4
+    assert sorted(all_ids(store.index).tolist()) == sorted(
+        vector_id(image_id, slot) for image_id in kept_ids for slot in range(2)
+    )
+    hits = store._search_ids(vectors[4:], k=5)
+    assert all(image_id != deleted_id for query_hits in hits for image_id, _ in query_hits)
+    assert [len(query_hits) for query_hits in hits] == [2, 2]
+    paths = {path for path, *_ in store.search(vectors[4], k=5)}
+    assert paths == {"static/uploads/k0.jpg", "static/uploads/k1.jpg"}
+
+
+def test_deduplicated_upload_is_removed_with_its_last_debate(make_store):
+    store = make_store()
+    first, second = store.add_debate("first", ""), store.add_debate("second", "")
+    vectors = unit_vectors(2)
+    # 同じ写真を 2 つの議論にアップロードすると 1 ファイルを共有する
+    paths = []
+    for debate_id, vector in zip((first, second), vectors):
+        stored = store_upload(io.BytesIO(png_bytes(0)), store.uploads_dir, "board.png")
+        paths.append(stored.path)
+        store.add_image(debate_id, upload_url_path(stored.path), vector, "", "")
+    assert paths[0] == paths[1]
+    assert stored.path.parent == store.uploads_dir
+
+    store.delete_debate(first)
+    assert stored.path.exists()
+    assert [path for path, *_ in store.search(vectors[1], k=2)] == [
+        upload_url_path(stored.path)
+    ]
+
+    store.delete_debate(second)
+    assert not stored.path.exists()
+    assert list(store.uploads_dir.iterdir()) == []